@@ -1,10 +1,35 @@
 import os
 import re
-import subprocess
-from openai import OpenAI
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from Streaming import CodeFenceWatcher, iter_text
+from Completion import CompletionLayer, partial_scope
+from Architecture import FOLDER_SECTION, ArchitectureIndex, ArchitectureStream, build_dependency_graph, count_tokens
+from Executor import ExecutionResult, WorkerPool
+from Manifest import BuildManifest, content_hash
+from Routing import default_policy
+from Scheduler import priority_scope
+from StaticCheck import StaticChecker, format_diagnostics
+from TestRunner import REPORT_NAME, TestRunner, discover_tests, is_test_file
+from Tracing import agent_scope, get_tracer
+
+# Tutte le richieste passano dal livello di completamento (cache, record/replay);
+# il client OpenAI (chiave da OPENAI_API_KEY) viene creato alla prima richiesta
+llm = CompletionLayer()
+
+
+def __getattr__(name):
+    # AgentDeveloper.client resta disponibile: è il client di llm, creato al primo accesso
+    if name == "client":
+        return llm.client
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Rientro di una riga della struttura delle cartelle: spazi, elenchi e caratteri dell'albero
+_TREE_PREFIX = re.compile(r"[\s│├└─|`+*-]*")
 
-# Inizializzazione del client OpenAI
-client = OpenAI(api_key="API")
 
 def extract_code(content: str) -> str:
     """
@@ -16,21 +41,77 @@ def extract_code(content: str) -> str:
     return matches[0] if matches else content
 
 
+def complete(model: str, messages: list, **params) -> str:
+    """
+    Esegue una richiesta di completamento e restituisce il testo della risposta.
+    params: altri parametri della richiesta (es. response_format).
+    """
+    response = llm.create(model=model, messages=messages, **params)
+    return response.choices[0].message.content
+
+
+def complete_candidates(model: str, messages: list, n: int) -> list:
+    """
+    Chiede n risposte alternative con una sola richiesta (parametro n) e ne
+    restituisce i testi.
+    """
+    if n <= 1:
+        return [complete(model, messages)]
+    response = llm.create(model=model, messages=messages, n=n)
+    return [choice.message.content for choice in response.choices]
+
+
+def stream_completion(model: str, messages: list, **params):
+    """
+    Come complete(), ma restituisce un generatore con i frammenti di testo
+    man mano che il modello li produce. Chiudere il generatore chiude lo stream.
+    """
+    stream = llm.create(model=model, messages=messages, stream=True, **params)
+    try:
+        yield from iter_text(stream)
+    finally:
+        stream.close()
+
+
 class ArchitectAgent:
     """
     L'Architetto si occupa di:
       1. Definire l'architettura del progetto in modo dettagliato.
       2. Fornire UML di alto livello per i principali componenti, classi e relazioni.
       3. Struttura della cartella del progetto.
+    Con structured=True risponde con un documento JSON conforme allo schema di
+    ArchitectureSchema.py invece che con il testo a sezioni.
     """
-    def process(self, combined_context: str) -> str:
+    model = "gpt-4o-mini"
+    models = ("gpt-4o-mini",)  # scala di modelli, dal più economico (vedi Routing.py)
+    max_repairs = 2            # richieste di correzione per una risposta non valida
+
+    def __init__(self, structured: bool = False):
+        self.structured = structured
+
+    def structured_system_message(self) -> dict:
+        from ArchitectureSchema import schema_text
+
+        return {
+            "role": "system",
+            "content": (
+                "Sei un architetto software. Il tuo compito è progettare il progetto descritto: "
+                "descrizione generale, diagramma delle classi UML (PlantUML), moduli principali con le "
+                "loro responsabilità e tutti i file da generare, con le dipendenze tra i file."
+                "\n\nRispondi solo con un oggetto JSON conforme a questo JSON Schema:\n" + schema_text()
+            )
+        }
+
+    def build_messages(self, combined_context: str) -> list:
         """
         combined_context è una stringa che include:
           - Descrizione del progetto
           - Contesto attuale (self.project_context)
           - Istruzioni per l'architetto
         """
-        messages = [
+        if self.structured:
+            return [self.structured_system_message(), {"role": "user", "content": combined_context}]
+        return [
             {
                 "role": "system",
                 "content": (
@@ -54,8 +135,57 @@ class ArchitectAgent:
                 "content": combined_context
             }
         ]
-        response = client.chat.completions.create(model="gpt-4o-mini", messages=messages)
-        return response.choices[0].message.content
+
+    def params(self) -> dict:
+        """
+        Parametri aggiuntivi della richiesta: in modalità strutturata la risposta è un oggetto JSON.
+        """
+        return {"response_format": {"type": "json_object"}} if self.structured else {}
+
+    def process(self, combined_context: str, model: str = None) -> str:
+        return complete(model or self.model, self.build_messages(combined_context), **self.params())
+
+    def process_stream(self, combined_context: str, model: str = None):
+        return stream_completion(model or self.model, self.build_messages(combined_context), **self.params())
+
+    def repair(self, architecture: str, model: str = None):
+        """
+        Trasforma una risposta non utilizzabile (testo in un formato diverso da
+        quello atteso, oppure JSON non conforme allo schema) in un documento
+        JSON valido, senza ripetere la progettazione: il modello riceve la
+        propria risposta e gli errori di validazione, per al massimo
+        max_repairs richieste. Restituisce il JSON normalizzato, oppure None.
+        """
+        from ArchitectureSchema import looks_like_document, validate
+
+        answer = architecture
+        with get_tracer().span("architect.repair") as span:
+            for attempt in range(1, self.max_repairs + 1):
+                if looks_like_document(answer):
+                    _, errors = validate(answer)
+                    request = (
+                        "Il documento JSON seguente non è valido:\n"
+                        + "\n".join(f"- {error}" for error in errors)
+                        + "\n\nCorreggi questi errori senza cambiare il resto e restituisci il documento "
+                        f"completo.\n\n{answer}"
+                    )
+                else:
+                    request = (
+                        "L'architettura seguente non rispetta il formato richiesto. Riportala nel documento "
+                        f"JSON, senza cambiarne le scelte (file, classi, moduli).\n\n{answer}"
+                    )
+                print(f"[ARCHITETTURA] risposta non valida: richiesta di correzione {attempt}/{self.max_repairs}")
+                answer = complete(
+                    model or self.model,
+                    [self.structured_system_message(), {"role": "user", "content": request}],
+                    response_format={"type": "json_object"},
+                )
+                document, _ = validate(answer)
+                if document is not None:
+                    span.set(attempts=attempt, repaired=True)
+                    return document.model_dump_json(indent=2)
+            span.set(attempts=self.max_repairs, repaired=False)
+        return None
 
 
 class DeveloperAgent:
@@ -65,8 +195,11 @@ class DeveloperAgent:
       - le istruzioni specifiche per un determinato file o modulo
     Restituisce il contenuto del file (codice) racchiuso in un blocco ```...```.
     """
-    def process(self, task_description: str) -> str:
-        messages = [
+    model = "gpt-4o"
+    models = ("gpt-4o-mini", "gpt-4o")
+
+    def build_messages(self, task_description: str) -> list:
+        return [
             {
                 "role": "system",
                 "content": (
@@ -76,8 +209,12 @@ class DeveloperAgent:
             },
             {"role": "user", "content": task_description}
         ]
-        response = client.chat.completions.create(model="gpt-4o", messages=messages)
-        return response.choices[0].message.content
+
+    def process(self, task_description: str, model: str = None) -> str:
+        return complete(model or self.model, self.build_messages(task_description))
+
+    def process_stream(self, task_description: str, model: str = None):
+        return stream_completion(model or self.model, self.build_messages(task_description))
 
 
 class DebuggerAgent:
@@ -86,8 +223,11 @@ class DebuggerAgent:
       - tutto il contesto di progetto (architettura, UML, file generato, errore)
       - fornisce un codice corretto, racchiuso in un blocco ```...```.
     """
-    def process(self, debug_info: str) -> str:
-        messages = [
+    model = "gpt-4o"
+    models = ("gpt-4o-mini", "gpt-4o")
+
+    def build_messages(self, debug_info: str) -> list:
+        return [
             {
                 "role": "system",
                 "content": (
@@ -97,16 +237,26 @@ class DebuggerAgent:
             },
             {"role": "user", "content": debug_info}
         ]
-        response = client.chat.completions.create(model="gpt-4o", messages=messages)
-        return response.choices[0].message.content
+
+    def process(self, debug_info: str, model: str = None) -> str:
+        return complete(model or self.model, self.build_messages(debug_info))
+
+    def process_candidates(self, debug_info: str, n: int, model: str = None) -> list:
+        return complete_candidates(model or self.model, self.build_messages(debug_info), n)
+
+    def process_stream(self, debug_info: str, model: str = None):
+        return stream_completion(model or self.model, self.build_messages(debug_info))
 
 
 class DocumenterAgent:
     """
     Il Documentatore riceve il codice del progetto (o snippet) per scrivere la documentazione.
     """
-    def process(self, code_snippet: str) -> str:
-        messages = [
+    model = "gpt-4o"
+    models = ("gpt-4o-mini", "gpt-4o")
+
+    def build_messages(self, code_snippet: str) -> list:
+        return [
             {
                 "role": "system",
                 "content": (
@@ -115,8 +265,12 @@ class DocumenterAgent:
             },
             {"role": "user", "content": code_snippet}
         ]
-        response = client.chat.completions.create(model="gpt-4o", messages=messages)
-        return response.choices[0].message.content
+
+    def process(self, code_snippet: str, model: str = None) -> str:
+        return complete(model or self.model, self.build_messages(code_snippet))
+
+    def process_stream(self, code_snippet: str, model: str = None):
+        return stream_completion(model or self.model, self.build_messages(code_snippet))
 
 
 class SupervisorAgent:
@@ -126,9 +280,38 @@ class SupervisorAgent:
       - Esegue i task nell'ordine stabilito (Architettura -> Sviluppo -> Debug -> ecc.).
       - Fornisce ad ogni agente il contesto necessario.
     """
-    def __init__(self):
+    def __init__(self, max_workers: int = 4, interactive: bool = False, stream: bool = False,
+                 root_folder: str = "root", repair_candidates: int = 3, repair_rounds: int = 2,
+                 routing=None, executor: WorkerPool = None, pipeline: bool = True, structured: bool = False,
+                 test_timeout: float = 10.0, test_workers: int = None):
+        self.max_workers = 1 if interactive else max(1, max_workers)  # file generati contemporaneamente
+        self.interactive = interactive  # generazione sequenziale, con una pausa dopo ogni file
+        self.stream = stream            # risposte consumate in streaming (vedi request_code)
+        self.pipeline = pipeline and not interactive and not structured  # vedi develop_while_streaming
+        self.structured = structured    # architettura come documento JSON (vedi ArchitectureSchema.py)
+        self.root_folder = root_folder
+        self.repair_candidates = max(1, repair_candidates)  # correzioni provate per round (vedi repair)
+        self.repair_rounds = max(1, repair_rounds)
+        self.routing = routing or default_policy()  # tassi di successo per modello (vedi Routing.py)
+        self.manifest = None
+        self._lock = threading.Lock()
+        self.context_index = None
+        self._applied_plan = None  # (descrizione, piano) usati per context_index
+        self.dependencies = {}     # {"cartella/file.py": ["cartella/dipendenza.py", ...]}
+        self.context_tokens = {}   # {"cartella/file.py": [("developer", token), ...]}
+        self.architecture_tokens = 0
+        self.repair_stats = {}     # {"cartella/file.py": {"fixed", "rounds", "attempts", "seconds"}}
+        self.checker = StaticChecker()
+        self.check_stats = {"static_failures": 0, "executions": 0}
+        self.test_timeout = test_timeout  # secondi per test (vedi run_tests)
+        self.test_workers = test_workers  # processi di TestRunner, default uno per core
+        self.test_report = None
+        # Interpreti già avviati per eseguire i file generati (con timeout e limiti di risorse);
+        # un executor passato dal chiamante può essere condiviso tra supervisori (vedi Batch.py)
+        self.executor = executor or WorkerPool(size=self.max_workers)
+        self._owns_executor = executor is None
         self.agents = {
-            "architect": ArchitectAgent(),
+            "architect": ArchitectAgent(structured=structured),
             "developer": DeveloperAgent(),
             "debugger": DebuggerAgent(),
             "documenter": DocumenterAgent()
@@ -138,35 +321,54 @@ class SupervisorAgent:
             "description": "",
             "architecture": "",
             "uml": "",
+            "modules": "",
             "folders": {},   # {"folder_path": ["file1.py", "file2.py"]}
             "files": {},     # {"file_path": "contenuto_file"}
         }
 
+    def close(self) -> None:
+        """
+        Ferma i worker del pool creato dal supervisore (un executor condiviso
+        resta a chi lo ha passato). Chiamato anche all'uscita da un blocco with.
+        """
+        if self._owns_executor:
+            self.executor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
     def parse_folder_structure(self, folder_structure: str) -> dict:
         """
         Converte la struttura testuale delle cartelle in un dizionario.
+        Il livello di ogni riga è la colonna in cui inizia il nome: sono
+        accettati rientri di qualsiasi ampiezza, caratteri di disegno dell'albero
+        (├──, │, └──) e commenti dopo " #".
         """
-        lines = folder_structure.strip().split("\n")
-        current_path = []
+        lines = folder_structure.strip("\n").expandtabs(4).split("\n")
+        current_path = []  # [(colonna, nome cartella)]
         folders = {}
 
         for line in lines:
-            indent_level = len(line) - len(line.lstrip())
-            name = line.strip()
+            line = line.split(" #")[0].rstrip()
+            prefix = _TREE_PREFIX.match(line).group(0)
+            name = line[len(prefix):]
 
             if not name:
                 continue
 
+            indent_level = len(prefix)
+            while current_path and current_path[-1][0] >= indent_level:
+                current_path.pop()
             if name.endswith("/"):
-                current_path = current_path[:indent_level // 4]
-                current_path.append(name[:-1])
-                folder_key = "/".join(current_path)
-                folders[folder_key] = []
+                current_path.append((indent_level, name[:-1]))
+                folders.setdefault("/".join(folder for _, folder in current_path), [])
             else:
-                folder_key = "/".join(current_path)
-                if folder_key not in folders:
-                    folders[folder_key] = []
-                folders[folder_key].append(name)
+                folder_key = "/".join(folder for _, folder in current_path)
+                folders.setdefault(folder_key, []).append(name)
 
         return folders
 
@@ -184,141 +386,843 @@ class SupervisorAgent:
                     with open(file_path, "w", encoding="utf-8") as f:
                         f.write("")
 
-    def route_task(self, agent_type: str, content: str) -> str:
+    def route_task(self, agent_type: str, content: str, model: str = None) -> str:
         """
         Route di comodo per interfacciarsi con i vari agenti.
+        model sceglie un gradino della scala dell'agente (default: il suo modello).
         """
         agent = self.agents.get(agent_type)
         if not agent:
             raise ValueError(f"Agente '{agent_type}' non trovato.")
-        return agent.process(content)
+        with agent_scope(agent_type):
+            return agent.process(content, model=model) if model else agent.process(content)
+
+    def route_task_stream(self, agent_type: str, content: str, model: str = None):
+        """
+        Come route_task, ma restituisce un generatore di frammenti di testo.
+        """
+        agent = self.agents.get(agent_type)
+        if not agent:
+            raise ValueError(f"Agente '{agent_type}' non trovato.")
+        return agent.process_stream(content, model=model) if model else agent.process_stream(content)
+
+    def ladder(self, agent_type: str) -> list:
+        """
+        Modelli da provare in ordine per l'agente; [None] se l'agente non dichiara una scala.
+        """
+        models = getattr(self.agents.get(agent_type), "models", None)
+        return self.routing.ladder(agent_type, models) if models else [None]
+
+    def request_code(self, agent_type: str, content: str, model: str = None) -> str:
+        """
+        Chiede codice a un agente e ne estrae il primo blocco ```...```.
+        In modalità streaming smette di leggere la risposta appena il blocco si
+        chiude, così ogni file è scritto senza attendere il resto della risposta.
+        """
+        if not self.stream:
+            return extract_code(self.route_task(agent_type, content, model))
+        watcher = CodeFenceWatcher()
+        tokens = self.route_task_stream(agent_type, content, model)
+        try:
+            with agent_scope(agent_type), partial_scope():
+                for delta in tokens:
+                    if watcher.feed(delta) is not None:
+                        break
+        finally:
+            tokens.close()
+        return watcher.code if watcher.code is not None else extract_code(watcher.text)
+
+    def request_candidates(self, agent_type: str, content: str, n: int, model: str = None) -> list:
+        """
+        Chiede n versioni alternative del codice (senza duplicati). Gli agenti
+        senza process_candidates ne forniscono una sola.
+        """
+        agent = self.agents.get(agent_type)
+        if n <= 1 or not hasattr(agent, "process_candidates"):
+            return [self.request_code(agent_type, content, model)]
+        with agent_scope(agent_type):
+            answers = agent.process_candidates(content, n, model=model) if model else agent.process_candidates(content, n)
+        return list(dict.fromkeys(extract_code(answer) for answer in answers))
+
+    def develop_all(self, graph: dict, stop: threading.Event = None) -> None:
+        """
+        Esegue DeveloperAgent su tutti i file del grafo, con al massimo
+        self.max_workers richieste contemporanee, rispettando l'ordine delle dipendenze
+        (in modalità interattiva un file alla volta, con una pausa dopo ciascuno).
+        Impostato stop, non vengono avviati altri file (quelli in corso terminano).
+        """
+        remaining = {path: set(deps) for path, deps in graph.items()}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while remaining or running:
+                if stop is not None and stop.is_set():
+                    remaining.clear()
+                for path in [p for p, deps in remaining.items() if not deps]:
+                    del remaining[path]
+                    # copia del contesto: gli span del file restano figli di quello del progetto
+                    running[pool.submit(
+                        contextvars.copy_context().run, self.develop_file, path, sorted(graph[path])
+                    )] = path
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as ex:
+                        print(f"Errore durante la generazione di {path}: {ex}")
+                    for deps in remaining.values():
+                        deps.discard(path)
+
+    def develop_file(self, relative_path: str, dependencies: list) -> None:
+        """
+        Genera un singolo file (ed eventualmente lo esegue e lo corregge),
+        passando allo sviluppatore le interfacce dei file da cui dipende.
+        """
+        self.complete_file(relative_path, self.file_request(relative_path, dependencies))
+
+    def file_request(self, relative_path: str, dependencies: list):
+        """
+        Restituisce (contesto per lo sviluppatore, impronta degli input) del
+        file, oppure None se il file è invariato rispetto al manifest (in tal
+        caso il suo contenuto viene caricato nel contesto del progetto).
+        """
+        folder, file_name = os.path.split(relative_path)
+        file_path = os.path.join(self.root_folder, relative_path)
+
+        with self._lock:
+            files = dict(self.project_context["files"])
+
+        # Impronta degli input specifici del file: sezione di architettura e interfacce delle dipendenze
+        developer = self.agents["developer"]
+        input_hash = content_hash(
+            str(getattr(developer, "models", None) or getattr(developer, "model", "")),
+            relative_path,
+            self.context_index.file_section(relative_path),
+            self.context_index.dependency_interfaces(dependencies, files),
+        )
+        if self.manifest.is_current(relative_path, input_hash, file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                file_content = f.read()
+            with self._lock:
+                self.project_context["files"][relative_path] = file_content
+            print(f"\n--- FILE INVARIATO: {file_path} ---")
+            return None
+
+        # Creiamo una descrizione per lo sviluppatore (solo la parte di architettura che lo riguarda)
+        dev_input_context = (
+            self.context_index.file_context(relative_path, dependencies, files) + "\n"
+            f"Devi generare il contenuto per il file {file_name} nella cartella {folder}/.\n"
+            f"Fornisci solo il codice, racchiuso tra triple backticks."
+        )
+        self.report_context(relative_path, "developer", dev_input_context)
+        return dev_input_context, input_hash
+
+    def complete_file(self, relative_path: str, request, generated: str = None) -> None:
+        """
+        Porta a termine un file a partire dall'esito di file_request: lo genera
+        (o usa generated, il codice già ottenuto), lo esegue, lo corregge e ne
+        registra lo stato finale nel manifest.
+        """
+        if request is None:
+            # Codice invariato: si riesegue solo se l'ultima esecuzione non era andata a buon fine
+            if not relative_path.endswith(".py") or self.manifest.file(relative_path).get("status") == "ok":
+                return
+            passed = self.run_and_debug(relative_path)
+        else:
+            passed = self.generate_file(relative_path, *request, generated=generated)
+
+        # Stato finale dei file Python (eseguiti ed eventualmente corretti)
+        if relative_path.endswith(".py"):
+            with self._lock:
+                final_content = self.project_context["files"][relative_path]
+            self.manifest.record_file(
+                relative_path, output_hash=content_hash(final_content), status="ok" if passed else "failed"
+            )
+
+        if self.interactive:
+            input("\nPremi Invio per continuare...")
+
+    def generate_file(self, relative_path: str, context: str, input_hash: str, generated: str = None) -> bool:
+        """
+        Genera il file salendo la scala di modelli dello sviluppatore: si parte
+        dal modello più economico e si passa al successivo solo se il file
+        Python generato non gira senza errori; se fallisce anche l'ultimo, il
+        file va in riparazione. Restituisce True se il file finale funziona.
+        L'esito di ogni gradino viene registrato in self.routing.
+        generated è il codice già ottenuto per il primo gradino (es. da un batch).
+        """
+        file_path = os.path.join(self.root_folder, relative_path)
+        ladder = self.ladder("developer")
+        for level, model in enumerate(ladder):
+            start = time.monotonic()
+            if level == 0 and generated is not None:
+                file_content = generated
+            else:
+                with get_tracer().span("file.generate", agent="developer", file=relative_path, model=model):
+                    file_content = self.request_code("developer", context, model)
+
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write(file_content)
+            with self._lock:
+                self.project_context["files"][relative_path] = file_content
+            self.manifest.record_file(
+                relative_path, input_hash=input_hash, output_hash=content_hash(file_content),
+                status="generated", model=model,
+            )
+
+            print(f"\n--- FILE GENERATO: {file_path}" + (f" ({model})" if model else "") + " ---")
+            print(file_content)
+
+            if not relative_path.endswith(".py"):
+                return True
+            # Se è un file Python, lo eseguiamo e intercettiamo eventuali errori
+            try:
+                stderr = self.execute(relative_path)
+            except Exception as ex:
+                print(f"Errore durante l'esecuzione di {file_path}: {ex}")
+                return False
+            if model:
+                self.routing.record("developer", model, not stderr, time.monotonic() - start)
+            if not stderr:
+                return True
+            if level + 1 < len(ladder):
+                print(f"[ESCALATION] {relative_path}: {model} -> {ladder[level + 1]}")
+                continue
+            return self.repair(relative_path, stderr)
+
+    def report_context(self, relative_path: str, agent_type: str, context: str) -> None:
+        """
+        Registra e stampa la dimensione (in token) del contesto inviato per un file.
+        """
+        tokens = count_tokens(context)
+        with self._lock:
+            self.context_tokens.setdefault(relative_path, []).append((agent_type, tokens))
+        print(f"[CONTESTO] {agent_type} {relative_path}: {tokens} token (architettura completa: {self.architecture_tokens})")
+
+    def run_and_debug(self, relative_path: str) -> bool:
+        """
+        Esegue un file Python generato; in caso di errori lo fa riparare (vedi repair).
+        Restituisce True se l'ultima esecuzione è terminata senza errori.
+        """
+        file_path = os.path.join(self.root_folder, relative_path)
+        try:
+            stderr = self.execute(relative_path)
+            return self.repair(relative_path, stderr) if stderr else True
+
+        except Exception as ex:
+            print(f"Errore durante l'esecuzione di {file_path}: {ex}")
+            return False
+
+    def static_check(self, relative_path: str, code: str = None) -> str:
+        """
+        Verifica statica del file (o di code, un contenuto alternativo per lo
+        stesso percorso): diagnosi nel formato di un traceback, vuota se superata.
+        """
+        with self._lock:
+            files = dict(self.project_context["files"])
+        if code is None:
+            code = files.get(relative_path)
+        if code is None:
+            with open(os.path.join(self.root_folder, relative_path), "r", encoding="utf-8") as f:
+                code = f.read()
+        search = self.import_folders() if is_test_file(relative_path) else ()
+        diagnostics = self.checker.check(relative_path, code, self.project_context["folders"], files, search)
+        if not diagnostics:
+            return ""
+        with self._lock:
+            self.check_stats["static_failures"] += 1
+        return format_diagnostics(os.path.abspath(os.path.join(self.root_folder, relative_path)), diagnostics)
+
+    def execute(self, relative_path: str) -> str:
+        """
+        Verifica il file staticamente (StaticChecker: sintassi, import risolti
+        sulla struttura pianificata, nomi importati dai moduli generati) e, se
+        la verifica è superata, lo esegue e ne stampa l'output; restituisce lo
+        stderr o la diagnosi statica (vuoto se non ci sono errori), così un
+        file rotto va al debugger senza essere eseguito. I file di test
+        (test_*.py, *_test.py) si fermano alla verifica statica: li esegue
+        run_tests a fine progetto.
+        """
+        file_path = os.path.join(self.root_folder, relative_path)
+        error = self.static_check(relative_path)
+        if error:
+            print(f"\n[VERIFICA STATICA] {file_path}:\n{error}")
+            return error
+        if is_test_file(relative_path):
+            return ""
+        with self._lock:
+            self.check_stats["executions"] += 1
+        process = self.executor.run(file_path)
+        if process.stdout:
+            print(f"\n[OUTPUT ESECUZIONE] {file_path}:\n{process.stdout}")
+        if process.stderr:
+            print(f"\n[ERRORI ESECUZIONE] {file_path}:\n{process.stderr}")
+        return process.stderr
+
+    def repair(self, relative_path: str, error: str) -> bool:
+        """
+        Ciclo di riparazione: a ogni round chiede al DebuggerAgent
+        repair_candidates correzioni candidate (contesto + codice + errore), le
+        esegue in parallelo e tiene la prima che gira senza errori, per al
+        massimo repair_rounds round. Se nessuna funziona, il round successivo
+        riparte dal primo candidato e dal suo errore, con il modello successivo
+        della scala del debugger (se c'è).
+        """
+        file_path = os.path.join(self.root_folder, relative_path)
+        ladder = self.ladder("debugger")
+        start = time.monotonic()
+        attempts = 0
+        fixed = False
+        with get_tracer().span("debug.cycle", agent="debugger", file=relative_path) as span:
+            for round_number in range(1, self.repair_rounds + 1):
+                model = ladder[min(round_number, len(ladder)) - 1]
+                round_start = time.monotonic()
+                # Richiesta di debug: forniamo all'agente contesto completo + codice + errore
+                with open(file_path, "r", encoding="utf-8") as code_file:
+                    current_code = code_file.read()
+                with self._lock:
+                    files = dict(self.project_context["files"])
+                debug_context = (
+                    self.context_index.file_context(relative_path, self.dependencies.get(relative_path, []), files)
+                    + f"\nErrore incontrato nell'esecuzione di {file_path}:\n{error}\n\n"
+                    f"Codice attuale:\n{current_code}"
+                )
+                self.report_context(relative_path, "debugger", debug_context)
+                candidates = self.request_candidates("debugger", debug_context, self.repair_candidates, model)
+                attempts += len(candidates)
+                winner, results = self.validate_candidates(relative_path, candidates)
+                chosen = winner if winner is not None else 0
+                if model:
+                    self.routing.record("debugger", model, winner is not None, time.monotonic() - round_start)
+
+                # Sovrascrive il file con il codice corretto
+                with open(file_path, "w", encoding="utf-8") as f:
+                    f.write(candidates[chosen])
+                with self._lock:
+                    self.project_context["files"][relative_path] = candidates[chosen]
+
+                print(f"\n--- CODICE CORRETTO ({file_path}, round {round_number}, "
+                      f"candidato {chosen + 1}/{len(candidates)}) ---\n{candidates[chosen]}")
+                if results[chosen].stdout:
+                    print(f"\n[OUTPUT RIESECUZIONE] {file_path}:\n{results[chosen].stdout}")
+                if winner is not None:
+                    fixed = True
+                    break
+                error = results[chosen].stderr
+                print(f"\n[ERRORI DOPO CORREZIONE] {file_path}:\n{error}")
+            span.set(fixed=fixed, rounds=round_number, attempts=attempts)
+
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self.repair_stats[relative_path] = {
+                "fixed": fixed, "rounds": round_number, "attempts": attempts, "seconds": round(elapsed, 3),
+            }
+        print(f"[RIPARAZIONE] {relative_path}: {'riuscita' if fixed else 'fallita'}, "
+              f"{attempts} candidati in {round_number} round, {elapsed:.2f} s")
+        return fixed
+
+    def validate_candidates(self, relative_path: str, candidates: list):
+        """
+        Verifica staticamente i candidati ed esegue in parallelo nell'executor
+        quelli che superano la verifica, ognuno in un file temporaneo accanto
+        all'originale (stessi import relativi). Appena uno termina senza
+        errori, gli altri vengono interrotti. Per un file di test vince il primo
+        candidato che supera la verifica (i test girano in run_tests).
+        Restituisce (indice del vincitore o None, lista degli ExecutionResult).
+        """
+        file_path = os.path.abspath(os.path.join(self.root_folder, relative_path))
+        directory, file_name = os.path.split(file_path)
+        paths = [os.path.join(directory, f".repair_{i}_{file_name}") for i in range(len(candidates))]
+        results = [None] * len(candidates)
+        runnable = []
+        for i, code in enumerate(candidates):
+            error = self.static_check(relative_path, code)
+            if error:
+                results[i] = ExecutionResult(returncode=1, stdout="", stderr=error)
+            else:
+                runnable.append(i)
+        if not runnable:
+            return None, results
+        if is_test_file(relative_path):
+            results[runnable[0]] = ExecutionResult(returncode=0, stdout="", stderr="")
+            return runnable[0], results
+        with self._lock:
+            self.check_stats["executions"] += len(runnable)
+        winner = None
+        cancel = threading.Event()
+        try:
+            for i in runnable:
+                with open(paths[i], "w", encoding="utf-8") as f:
+                    f.write(candidates[i])
+            with ThreadPoolExecutor(max_workers=len(runnable)) as pool:
+                futures = {
+                    pool.submit(contextvars.copy_context().run, self.executor.run, paths[i], None, None, cancel): i
+                    for i in runnable
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    result = future.result()
+                    # Gli errori devono citare il file vero, non la copia temporanea
+                    result.stderr = result.stderr.replace(paths[i], file_path)
+                    results[i] = result
+                    if winner is None and not result.stderr and not result.cancelled:
+                        winner = i
+                        cancel.set()
+        finally:
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+        return winner, results
+
+    def check_project(self) -> None:
+        """
+        Verifica statica di tutti i file generati in una sola passata: un file
+        che funzionava può rompersi quando un modulo da cui dipende viene
+        corretto dopo di lui (nomi rinominati o rimossi). Questi file tornano
+        al debugger; quelli già falliti restano come sono.
+        """
+        with self._lock:
+            files = dict(self.project_context["files"])
+        search = dict.fromkeys(filter(is_test_file, files), self.import_folders())
+        failures = self.checker.check_tree(self.project_context["folders"], files, search)
+        for relative_path, diagnostics in sorted(failures.items()):
+            if self.manifest.file(relative_path).get("status") != "ok":
+                continue
+            file_path = os.path.abspath(os.path.join(self.root_folder, relative_path))
+            error = format_diagnostics(file_path, diagnostics)
+            print(f"\n[VERIFICA FINALE] {file_path}:\n{error}")
+            with self._lock:
+                self.check_stats["static_failures"] += 1
+            passed = self.repair(relative_path, error)
+            with self._lock:
+                final_content = self.project_context["files"][relative_path]
+            self.manifest.record_file(
+                relative_path, output_hash=content_hash(final_content), status="ok" if passed else "failed"
+            )
+
+    def run_tests(self) -> None:
+        """
+        Esegue i test generati con TestRunner, in shard paralleli su
+        test_workers processi e con test_timeout secondi per test. I test
+        falliti vengono raggruppati per file responsabile (vedi
+        failure_targets) e il debugger corregge ogni file a partire dai loro
+        traceback; poi si rieseguono solo gli shard con fallimenti, per al
+        massimo repair_rounds round. Il report finale resta in test_report e
+        viene salvato in REPORT_NAME nella cartella del progetto.
+        """
+        with self._lock:
+            test_files = sorted(path for path in self.project_context["files"] if is_test_file(path))
+        units = discover_tests(self.root_folder, test_files)
+        if not units:
+            return
+        runner = TestRunner(self.root_folder, workers=self.test_workers, timeout=self.test_timeout,
+                            sys_path=[os.path.join(self.root_folder, folder) for folder in self.import_folders()])
+        ladder = self.ladder("debugger")
+        exhausted = set()  # moduli la cui correzione non ha fatto passare nessun test
+        report = runner.run(units)
+        print(f"\n--- TEST ---\n{report.summary()}")
+        for round_number in range(1, self.repair_rounds + 1):
+            failures = report.failures()
+            if not failures:
+                break
+            model = ladder[min(round_number, len(ladder)) - 1]
+            for relative_path, results in sorted(self.failure_targets(failures, exhausted).items()):
+                if not self.repair_from_tests(relative_path, results, runner, model):
+                    exhausted.add(relative_path)
+            report = runner.rerun(report)
+            print(f"\n--- TEST (round {round_number}, shard falliti rieseguiti) ---\n{report.summary()}")
+        for result in report.failures():
+            print(f"\n[TEST FALLITO] {result.test_id} ({result.outcome}):\n{result.traceback}")
+        self.test_report = report
+        report.save(os.path.join(self.root_folder, REPORT_NAME))
+
+    def import_folders(self) -> list:
+        """
+        Cartelle di import dei test (relative a root_folder): le cartelle
+        pianificate che contengono moduli Python e le loro cartelle superiori
+        (per gli import di package), dalle meno profonde.
+        """
+        folders = set()
+        for folder, names in self.project_context["folders"].items():
+            if any(name.endswith(".py") and not is_test_file(name) for name in names):
+                parts = folder.split("/")
+                folders.update("/".join(parts[:depth]) for depth in range(1, len(parts) + 1))
+        return sorted(folders, key=lambda folder: (folder.count("/"), folder))
+
+    def failure_targets(self, failures: list, exhausted: set = frozenset()) -> dict:
+        """
+        {file da correggere: [TestResult]}: per ogni test fallito, l'ultimo
+        modulo del progetto (non di test) citato nel traceback; se il traceback
+        non ne cita (es. un'asserzione nel test), l'unico modulo del progetto da
+        cui dipende il test. Altrimenti, o se quel modulo è in exhausted (già
+        corretto senza risultati), il file di test stesso.
+        """
+        root = os.path.abspath(self.root_folder)
+        with self._lock:
+            files = set(self.project_context["files"])
+        targets = {}
+        for result in failures:
+            modules = [path for path in self.dependencies.get(result.path, []) if not is_test_file(path)]
+            target = modules[0] if len(modules) == 1 else result.path
+            for match in re.finditer(r'File "([^"]+)"', result.traceback):
+                path = os.path.relpath(match.group(1), root).replace(os.sep, "/")
+                if path in files and not is_test_file(path):
+                    target = path
+            if target in exhausted:
+                target = result.path
+            targets.setdefault(target, []).append(result)
+        return targets
+
+    def repair_from_tests(self, relative_path: str, failures: list, runner: TestRunner, model: str = None) -> bool:
+        """
+        Corregge relative_path a partire dai test falliti che lo riguardano: il
+        debugger riceve contesto, codice ed esito e traceback di ogni test. I
+        candidati che superano la verifica statica vengono scritti uno alla
+        volta al posto del file (i test lo importano per nome) e provati
+        rieseguendo solo quei test; resta quello che ne fa passare di più, o il
+        file originale se nessuno migliora. Restituisce True se almeno un test
+        è stato corretto.
+        """
+        file_path = os.path.join(self.root_folder, relative_path)
+        start = time.monotonic()
+        test_ids = [result.test_id for result in failures]
+        with self._lock:
+            files = dict(self.project_context["files"])
+        original = files[relative_path]
+        failed_tests = "\n".join(f"{result.test_id} ({result.outcome}):\n{result.traceback}" for result in failures)
+        debug_context = (
+            self.context_index.file_context(relative_path, self.dependencies.get(relative_path, []), files)
+            + f"\nTest falliti che coinvolgono {file_path}:\n{failed_tests}\n\n"
+            f"Codice attuale:\n{original}"
+        )
+        best, best_passed = None, 0
+        with get_tracer().span("debug.tests", agent="debugger", file=relative_path, tests=len(test_ids)) as span:
+            self.report_context(relative_path, "debugger", debug_context)
+            candidates = self.request_candidates("debugger", debug_context, self.repair_candidates, model)
+            try:
+                for code in candidates:
+                    if self.static_check(relative_path, code):
+                        continue
+                    with open(file_path, "w", encoding="utf-8") as f:
+                        f.write(code)
+                    passed = sum(not result.failed for result in runner.run(test_ids).results.values())
+                    if passed > best_passed:
+                        best, best_passed = code, passed
+                    if passed == len(test_ids):
+                        break
+            finally:
+                with open(file_path, "w", encoding="utf-8") as f:
+                    f.write(best if best is not None else original)
+            fixed = best_passed == len(test_ids)
+            span.set(fixed=fixed, passed=best_passed, attempts=len(candidates))
+        if model:
+            self.routing.record("debugger", model, best is not None, time.monotonic() - start)
+
+        elapsed = time.monotonic() - start
+        with self._lock:
+            if best is not None:
+                self.project_context["files"][relative_path] = best
+            stats = self.repair_stats.setdefault(
+                relative_path, {"fixed": False, "rounds": 0, "attempts": 0, "seconds": 0.0}
+            )
+            stats.update(fixed=fixed, rounds=stats["rounds"] + 1, attempts=stats["attempts"] + len(candidates),
+                         seconds=round(stats["seconds"] + elapsed, 3))
+        if best is not None:
+            self.manifest.record_file(relative_path, output_hash=content_hash(best))
+        print(f"[RIPARAZIONE DAI TEST] {relative_path}: {best_passed}/{len(test_ids)} test superati, "
+              f"{len(candidates)} candidati, {elapsed:.2f} s")
+        return best is not None
+
+    def report_repairs(self) -> None:
+        """
+        Riepilogo delle riparazioni: esito, candidati provati e latenza per file.
+        """
+        if not self.repair_stats:
+            return
+        print("\n--- RIPARAZIONI ---")
+        for path, stats in sorted(self.repair_stats.items()):
+            print(f"{path}: {'riuscita' if stats['fixed'] else 'fallita'}, {stats['attempts']} candidati, "
+                  f"{stats['rounds']} round, {stats['seconds']:.2f} s")
 
     def manage_project(self, project_description: str):
+        """
+        Architettura, sviluppo e verifica del progetto descritto. Il manifest in
+        root_folder (vedi Manifest.py) fa rigenerare solo i file i cui input
+        sono cambiati rispetto all'esecuzione precedente; con stream=True
+        l'architettura viene stampata mentre arriva.
+        """
+        tracer = get_tracer()
+        # generazione in blocco: i turni interattivi (MAS) hanno la precedenza
+        with tracer.span("project.build", root=self.root_folder), priority_scope("bulk"):
+            result = self._manage_project(project_description)
+        if tracer.enabled:  # TRACE_FILE impostata: riepilogo di tempi e token
+            print(tracer.summary())
+        return result
+
+    def _manage_project(self, project_description: str):
         #
-        # Salviamo la descrizione del progetto nel contesto
+        # Step 1: ARCHITETTURA (incluso UML)
         #
-        self.project_context["description"] = project_description
+        arch_input_context, arch_input_hash, architecture_full = self.architecture_request(project_description)
+        if architecture_full is not None:
+            print("\n--- ARCHITETTURA INVARIATA (dal manifest) ---")
+        elif self.pipeline and hasattr(self.agents["architect"], "process_stream"):
+            # Step 1 e 2 sovrapposti: lo sviluppo parte mentre l'architettura arriva
+            if not self.develop_while_streaming(arch_input_context, arch_input_hash):
+                return
+            return self.finish_project()
+        elif self.stream:
+            print("\n--- ARCHITETTURA (streaming) ---")
+            chunks = []
+            with agent_scope("architect"):
+                for delta in self.route_task_stream("architect", arch_input_context):
+                    print(delta, end="", flush=True)
+                    chunks.append(delta)
+            print()
+            architecture_full = "".join(chunks)
+        else:
+            architecture_full = self.route_task("architect", arch_input_context)
+        graph = self.apply_architecture(arch_input_hash, architecture_full)
+        if graph is None:
+            return
 
         #
-        # Step 1: ARCHITETTURA (incluso UML)
+        # Step 2: SVILUPPO
         #
+        # I file indipendenti vengono generati in parallelo; chi dipende da altri
+        # file parte solo quando le sue dipendenze esistono, così ne vede il codice reale.
+        self.develop_all(graph)
+        return self.finish_project()
+
+    def finish_project(self) -> dict:
+        """
+        Verifica finale dell'albero, riepiloghi (riparazioni, modelli) e risultato del progetto.
+        """
+        self.check_project()
+        self.run_tests()
+        self.report_repairs()
+        self.routing.stats.save()
+        print("\n--- MODELLI (tasso di successo) ---")
+        print(self.routing.stats.report())
+
+        #
+        # Step 3: ALTRE FASI (Documentazione, ecc.) - se necessario
+        #
+
+        return self.result()
+
+    def develop_while_streaming(self, arch_input_context: str, arch_input_hash: str) -> bool:
+        """
+        Legge l'architettura in streaming e, appena la struttura delle cartelle
+        è completa, avvia lo sviluppo dei file (in un thread) sul piano ricavato
+        dal testo arrivato fin lì. A risposta completa riconcilia: se il piano
+        finale è lo stesso lo sviluppo prosegue; altrimenti non vengono avviati
+        altri file del piano speculativo, i file non più previsti vengono rimossi
+        e develop_all riparte sul piano finale (i file già generati con gli
+        stessi input sono riconosciuti dal manifest e non vengono rigenerati).
+        Restituisce False se l'architettura non è valida.
+        """
+        parser = ArchitectureStream()
+        stop = threading.Event()
+        speculative = None  # (piano, thread dello sviluppo)
+        if self.stream:
+            print("\n--- ARCHITETTURA (streaming) ---")
+        try:
+            with agent_scope("architect"):
+                for delta in self.route_task_stream("architect", arch_input_context):
+                    if self.stream:
+                        print(delta, end="", flush=True)
+                    if parser.feed(delta):
+                        plan = self.parse_architecture(parser.planned)
+                        if plan is not None:
+                            graph = self.apply_plan(plan)
+                            print(f"\n[PIPELINE] struttura completa: sviluppo di {len(graph)} file avviato "
+                                  "mentre l'architettura è ancora in arrivo")
+                            thread = threading.Thread(
+                                target=contextvars.copy_context().run, args=(self.develop_all, graph, stop),
+                                name="speculative-develop", daemon=True,
+                            )
+                            thread.start()
+                            speculative = (plan, thread)
+        except BaseException:
+            # architettura interrotta: i file in corso terminano, nessun altro viene avviato
+            stop.set()
+            if speculative is not None:
+                speculative[1].join()
+            raise
+        if self.stream:
+            print()
+
+        architecture_full = parser.text
+        final_plan = self.parse_architecture(architecture_full)
+        if speculative is not None:
+            plan, thread = speculative
+            if final_plan != plan:
+                stop.set()
+            thread.join()
+            if final_plan == plan:
+                self.apply_architecture(arch_input_hash, architecture_full)
+                return True
+            print("\n[PIPELINE] il piano finale è cambiato: riconciliazione dei file")
+            self.discard_files(plan, final_plan)
+        graph = self.apply_architecture(arch_input_hash, architecture_full)
+        if graph is None:
+            return False
+        self.develop_all(graph)
+        return True
+
+    def discard_files(self, plan: dict, final_plan: dict) -> None:
+        """
+        Rimuove i file generati per plan che final_plan (eventualmente None) non prevede più.
+        """
+        def planned(folders):
+            return {os.path.join(folder, file_name) for folder, files in folders.items() for file_name in files}
+
+        keep = planned(final_plan["folders"]) if final_plan else set()
+        for relative_path in sorted(planned(plan["folders"]) - keep):
+            file_path = os.path.join(self.root_folder, relative_path)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            with self._lock:
+                self.project_context["files"].pop(relative_path, None)
+            self.manifest.forget_file(relative_path)
+            print(f"[PIPELINE] {relative_path} non è più nel piano: rimosso")
+
+    def architecture_request(self, project_description: str):
+        """
+        Prepara la richiesta all'architetto e apre il manifest.
+        Restituisce (contesto per l'architetto, impronta degli input,
+        architettura già registrata nel manifest per gli stessi input o None).
+        """
+        # Salviamo la descrizione del progetto nel contesto
+        self.project_context["description"] = project_description
         # Unifichiamo la descrizione del progetto e il contesto in un'unica stringa
         arch_input_context = (
             f"Descrizione progetto: {project_description}\n\n"
             f"Contesto attuale (dizionario Python): {self.project_context}\n\n"
             "Fornisci un'architettura dettagliata e un UML di alto livello."
         )
-        architecture_full = self.route_task("architect", arch_input_context)
-        self.project_context["architecture"] = architecture_full
-
-        # Cerchiamo le sezioni UML e Struttura Cartelle
-        sections = architecture_full.split("###")
+        self.manifest = BuildManifest(self.root_folder)
+        architect = self.agents["architect"]
+        parts = [getattr(architect, "model", ""), arch_input_context]
+        if getattr(architect, "structured", False):
+            parts.append("json")
+        arch_input_hash = content_hash(*parts)
+        return arch_input_context, arch_input_hash, self.manifest.architecture(arch_input_hash)
 
-        # UML
-        uml_section = next((s for s in sections if "UML" in s), None)
-        if uml_section and "```" in uml_section:
-            uml_code = uml_section.split("```")[1]
-            self.project_context["uml"] = uml_code.strip()
-        else:
-            self.project_context["uml"] = "Nessun UML fornito."
-
-        # Folder structure
-        folder_section = next((s for s in sections if "Struttura della Cartella del Progetto" in s), None)
-        if folder_section and "```" in folder_section:
-            folder_structure = folder_section.split("```")[1]
-            self.project_context["folders"] = self.parse_folder_structure(folder_structure)
-        else:
-            print("Struttura cartelle non trovata o mal formattata nell'architettura.")
-            return
+    def apply_architecture(self, arch_input_hash: str, architecture_full: str):
+        """
+        Registra l'architettura, ne estrae UML, moduli e cartelle, crea la
+        struttura su disco e restituisce il grafo delle dipendenze tra i file
+        (None se la struttura delle cartelle manca). Una risposta non
+        utilizzabile viene prima fatta correggere all'architetto.
+        """
+        plan = self.parse_architecture(architecture_full)
+        if plan is None:
+            repaired = self.repair_architecture(architecture_full)
+            plan = self.parse_architecture(repaired) if repaired else None
+            if plan is None:
+                print("Struttura cartelle non trovata o mal formattata nell'architettura.")
+                return None
+            architecture_full = repaired
+        self.manifest.record_architecture(arch_input_hash, architecture_full)
+        self.project_context["architecture"] = architecture_full
 
-        # Creiamo la struttura fisica
-        self.create_project_structure()
+        graph = self.apply_plan(plan)
+        self.architecture_tokens = count_tokens(architecture_full)
 
-        print("\n--- ARCHITETTURA COMPLETA ---")
-        print(architecture_full)
+        if not self.stream:
+            print("\n--- ARCHITETTURA COMPLETA ---")
+            print(architecture_full)
         print("\n--- UML ---")
         print(self.project_context["uml"])
         print("\n--- STRUTTURA CARTELLE ---")
         for k, v in self.project_context["folders"].items():
             print(f"{k} -> {v}")
+        return graph
 
-        #
-        # Step 2: SVILUPPO
-        #
-        for folder, files in self.project_context["folders"].items():
-            for file_name in files:
-                file_path = os.path.join("root", folder, file_name)
-
-                # Creiamo una descrizione per lo sviluppatore
-                dev_input_context = (
-                    f"Contesto del progetto:\n"
-                    f"- Descrizione: {self.project_context['description']}\n"
-                    f"- Architettura: {self.project_context['architecture']}\n"
-                    f"- UML: {self.project_context['uml']}\n\n"
-                    f"Devi generare il contenuto per il file {file_name} nella cartella {folder}/.\n"
-                    f"Fornisci solo il codice, racchiuso tra triple backticks."
-                )
-                developer_response = self.route_task("developer", dev_input_context)
-                file_content = extract_code(developer_response)
+    def repair_architecture(self, architecture: str):
+        """
+        Architettura corretta dall'architetto (documento JSON), oppure None.
+        """
+        architect = self.agents["architect"]
+        if not hasattr(architect, "repair"):
+            return None
+        with agent_scope("architect"):
+            return architect.repair(architecture)
 
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(file_content)
+    def parse_architecture(self, architecture: str):
+        """
+        Estrae dall'output dell'architetto {"uml", "modules", "folders"} (più
+        "dependencies" per un documento JSON), oppure None se la struttura
+        delle cartelle manca o non contiene file.
+        """
+        from ArchitectureSchema import looks_like_document, validate
 
-                print(f"\n--- FILE GENERATO: {file_path} ---")
-                print(file_content)
+        if looks_like_document(architecture):
+            document, _ = validate(architecture)
+            if document is None:
+                return None
+            plan = document.plan()
+            plan["uml"] = plan["uml"] or "Nessun UML fornito."
+            return plan
 
-                # Se è un file Python, lo eseguiamo e intercettiamo eventuali errori
-                if file_name.endswith(".py"):
-                    try:
-                        process = subprocess.run(["python", file_path], capture_output=True, text=True)
-                        stdout = process.stdout
-                        stderr = process.stderr
-
-                        if stdout:
-                            print(f"\n[OUTPUT ESECUZIONE] {file_path}:\n{stdout}")
-                        if stderr:
-                            print(f"\n[ERRORI ESECUZIONE] {file_path}:\n{stderr}")
-
-                            # Richiesta di debug: forniamo all'agente contesto completo + codice + errore
-                            with open(file_path, "r", encoding="utf-8") as code_file:
-                                current_code = code_file.read()
-
-                            debug_context = (
-                                f"Contesto del progetto:\n"
-                                f"- Descrizione: {self.project_context['description']}\n"
-                                f"- Architettura: {self.project_context['architecture']}\n"
-                                f"- UML: {self.project_context['uml']}\n\n"
-                                f"Errore incontrato nell'esecuzione di {file_path}:\n{stderr}\n\n"
-                                f"Codice attuale:\n{current_code}"
-                            )
-                            debug_response = self.route_task("debugger", debug_context)
-                            corrected_code = extract_code(debug_response)
+        # Cerchiamo le sezioni UML e Struttura Cartelle
+        sections = architecture.split("###")
 
-                            # Sovrascrive il file con il codice corretto
-                            with open(file_path, "w", encoding="utf-8") as f:
-                                f.write(corrected_code)
+        # UML
+        uml_section = next((s for s in sections if "UML" in s), None)
+        if uml_section and "```" in uml_section:
+            uml = uml_section.split("```")[1].strip()
+        else:
+            uml = "Nessun UML fornito."
 
-                            print(f"\n--- CODICE CORRETTO ({file_path}) ---\n{corrected_code}")
+        # Moduli principali (usati per ricavare le dipendenze tra file)
+        modules_section = next((s for s in sections if "Moduli Principali" in s), None)
+        modules = modules_section.replace("Moduli Principali", "", 1).strip() if modules_section else ""
 
-                            # Eventuale riesecuzione dopo correzione
-                            try:
-                                retry_process = subprocess.run(["python", file_path], capture_output=True, text=True)
-                                if retry_process.stdout:
-                                    print(f"\n[OUTPUT RIESECUZIONE] {file_path}:\n{retry_process.stdout}")
-                                if retry_process.stderr:
-                                    print(f"\n[ERRORI DOPO CORREZIONE] {file_path}:\n{retry_process.stderr}")
-                            except Exception as re_ex:
-                                print(f"Errore nella riesecuzione di {file_path} dopo la correzione: {re_ex}")
+        # Folder structure
+        folder_section = next((s for s in sections if FOLDER_SECTION in s), None)
+        if not folder_section or "```" not in folder_section:
+            return None
+        folders = self.parse_folder_structure(folder_section.split("```")[1])
+        if not any(folders.values()):
+            return None
+        return {"uml": uml, "modules": modules, "folders": folders}
 
-                    except Exception as ex:
-                        print(f"Errore durante l'esecuzione di {file_path}: {ex}")
+    def apply_plan(self, plan: dict) -> dict:
+        """
+        Rende corrente il piano (UML, moduli, cartelle): indice dell'architettura,
+        struttura su disco e grafo delle dipendenze, che viene restituito. Se il
+        piano è quello già in uso non cambia nulla.
+        """
+        applied = (self.project_context["description"], plan)
+        if self._applied_plan == applied:
+            return {path: set(deps) for path, deps in self.dependencies.items()}
+        self._applied_plan = applied
+        self.project_context.update({key: plan[key] for key in ("uml", "modules", "folders")})
 
-                input("\nPremi Invio per continuare...")
+        # Indicizziamo l'architettura una sola volta: ogni file riceverà solo la parte che lo riguarda
+        self.context_index = ArchitectureIndex(
+            self.project_context["description"],
+            self.project_context["uml"],
+            self.project_context["modules"],
+            self.project_context["folders"],
+        )
 
-        #
-        # Step 3: ALTRE FASI (Documentazione, ecc.) - se necessario
-        #
+        # Creiamo la struttura fisica
+        self.create_project_structure(self.root_folder)
+
+        graph = build_dependency_graph(
+            self.project_context["folders"], self.project_context["uml"], self.project_context["modules"],
+            plan.get("dependencies"),
+        )
+        self.dependencies = {path: sorted(deps) for path, deps in graph.items()}
+        return graph
 
+    def result(self) -> dict:
         return {
             "architecture": self.project_context["architecture"],
             "uml": self.project_context["uml"],
@@ -327,10 +1231,10 @@ class SupervisorAgent:
 
 
 if __name__ == "__main__":
-    supervisor = SupervisorAgent()
     # Esempio di progetto
     project = "Crea un semplice sistema per la gestione delle prenotazioni di un ristorante."
-    result = supervisor.manage_project(project)
+    with SupervisorAgent() as supervisor:
+        result = supervisor.manage_project(project)
 
     print("\n--- PROGETTO COMPLETATO ---")
     print("UML:", result["uml"])
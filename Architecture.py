@@ -0,0 +1,329 @@
+"""
+Analisi dell'output dell'ArchitectAgent: relazioni UML, grafo delle dipendenze
+tra i file pianificati e contesto ridotto da inviare per ogni singolo file.
+"""
+import ast
+import logging
+import os
+import re
+import threading
+
+# Relazioni PlantUML: "A --> B", "A ..> B", "A <|-- B", "A *-- B", "A \"1\" o-- \"*\" B", ...
+_UML_RELATION = re.compile(
+    r'^\s*"?(\w+)"?\s*(?:"[^"]*"\s*)?'
+    r'(<\|?|\*|o(?=[-.]))?([-.]{2,}|-)(\|?>|\*|o(?=\s))?'
+    r'\s*(?:"[^"]*"\s*)?"?(\w+)"?'
+)
+_UML_CLASS = re.compile(r'\b(?:abstract\s+class|class|interface|enum)\s+"?(\w+)"?')
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """
+    Numero di token del testo (tiktoken se disponibile, altrimenti ~4 caratteri per token).
+    """
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken  # importato al primo conteggio
+                    _encoding = tiktoken.get_encoding("o200k_base")
+                except ImportError:  # conteggio approssimato se tiktoken non è installato
+                    _encoding = False
+                except Exception as e:  # es. codifica non scaricabile senza rete
+                    logger.warning("Codifica tiktoken non disponibile, conteggio approssimato: %s", e)
+                    _encoding = False
+    if _encoding is False:
+        return (len(text) + 3) // 4
+    return len(_encoding.encode(text))
+
+
+def _normalize_name(name: str) -> str:
+    """
+    Normalizza nomi di classi e file per poterli confrontare:
+    "ReservationManager" e "reservation_manager.py" diventano entrambi "reservationmanager".
+    """
+    name = os.path.splitext(os.path.basename(name.strip()))[0]
+    return re.sub(r"[_\-\s]", "", name).lower()
+
+
+def _uml_edges(uml: str):
+    """
+    Restituisce le coppie (dipendente, dipendenza) tra classi ricavate dalle relazioni UML.
+    Le associazioni non orientate ("A -- B") vengono ignorate.
+    """
+    for line in uml.splitlines():
+        match = _UML_RELATION.match(line)
+        if not match:
+            continue
+        left, head, _, tail, right = match.groups()
+        if tail and tail.endswith(">"):      # A --> B, A ..> B, A --|> B
+            yield left, right
+        elif head and head.startswith("<"):  # A <-- B, A <|-- B
+            yield right, left
+        elif head:                           # A *-- B, A o-- B (A contiene B)
+            yield left, right
+        elif tail:                           # A --* B, A --o B (B contiene A)
+            yield right, left
+
+
+def _module_lines(modules: str):
+    """
+    Coppie (nome modulo, descrizione) dalle righe "- nome: descrizione".
+    """
+    for line in modules.splitlines():
+        line = line.strip().lstrip("-*").strip()
+        if ":" not in line:
+            continue
+        module_name, description = line.split(":", 1)
+        yield module_name.strip(" `*"), description.strip()
+
+
+def _python_files(folders: dict) -> dict:
+    """
+    Nome normalizzato -> percorso relativo, per i file Python pianificati.
+    """
+    by_name = {}
+    for folder, files in folders.items():
+        for file_name in files:
+            if file_name.endswith(".py") and file_name != "__init__.py":
+                by_name.setdefault(_normalize_name(file_name), os.path.join(folder, file_name))
+    return by_name
+
+
+def map_classes_to_files(folders: dict, uml: str, modules: str = "") -> dict:
+    """
+    Associa ogni classe UML al file che la definisce: prima per nome
+    ("ReservationManager" -> reservation_manager.py), poi per citazione nella
+    descrizione del modulo ("- models.py: contiene Reservation e Table").
+    """
+    by_name = _python_files(folders)
+    classes = _UML_CLASS.findall(uml)
+    class_to_file = {}
+    for class_name in classes:
+        if _normalize_name(class_name) in by_name:
+            class_to_file[class_name] = by_name[_normalize_name(class_name)]
+    for module_name, description in _module_lines(modules):
+        owner = by_name.get(_normalize_name(module_name))
+        if not owner:
+            continue
+        for class_name in classes:
+            if class_name not in class_to_file and re.search(rf"\b{class_name}\b", description):
+                class_to_file[class_name] = owner
+    return class_to_file
+
+
+def build_dependency_graph(folders: dict, uml: str, modules: str = "", dependencies: dict = None) -> dict:
+    """
+    Ricava il grafo delle dipendenze tra i file pianificati dall'architetto,
+    incrociando le relazioni dell'UML con la sezione "Moduli Principali";
+    dependencies ({file: [file, ...]}) aggiunge le dipendenze dichiarate
+    esplicitamente (documento JSON, vedi ArchitectureSchema.py).
+    Restituisce {"cartella/file.py": {"cartella/altro.py", ...}}, senza cicli.
+    """
+    graph = {os.path.join(folder, file_name): set() for folder, files in folders.items() for file_name in files}
+    by_name = _python_files(folders)
+    class_to_file = map_classes_to_files(folders, uml, modules)
+
+    # Un modulo che cita un altro file nella sua descrizione ne dipende
+    for module_name, description in _module_lines(modules):
+        owner = by_name.get(_normalize_name(module_name))
+        if not owner:
+            continue
+        for path in by_name.values():
+            stem = os.path.splitext(os.path.basename(path))[0]
+            if path != owner and re.search(rf"\b{re.escape(stem)}(?:\.py)?\b", description):
+                graph[owner].add(path)
+
+    for dependent, dependency in _uml_edges(uml):
+        source = class_to_file.get(dependent) or by_name.get(_normalize_name(dependent))
+        target = class_to_file.get(dependency) or by_name.get(_normalize_name(dependency))
+        if source and target and source != target:
+            graph[source].add(target)
+
+    for path, declared in (dependencies or {}).items():
+        if path in graph:
+            graph[path].update(dep for dep in declared if dep in graph and dep != path)
+
+    return _break_cycles(graph)
+
+
+def _break_cycles(graph: dict) -> dict:
+    """
+    Rimuove gli archi all'indietro (visita in profondità in ordine deterministico),
+    così che lo scheduler possa sempre procedere.
+    """
+    state = {}  # 1 = in visita, 2 = completato
+
+    def visit(node):
+        state[node] = 1
+        for dep in sorted(graph[node]):
+            if state.get(dep) == 1:
+                print(f"Dipendenza circolare ignorata: {node} -> {dep}")
+                graph[node].discard(dep)
+            elif dep not in state:
+                visit(dep)
+        state[node] = 2
+
+    for node in list(graph):
+        if node not in state:
+            visit(node)
+    return graph
+
+
+def _uml_class_blocks(uml: str) -> dict:
+    """
+    Nome classe -> testo della sua definizione UML (intestazione e corpo tra graffe).
+    """
+    blocks = {}
+    lines = uml.splitlines()
+    i = 0
+    while i < len(lines):
+        match = _UML_CLASS.search(lines[i])
+        if not match:
+            i += 1
+            continue
+        block = [lines[i]]
+        depth = lines[i].count("{") - lines[i].count("}")
+        while depth > 0 and i + 1 < len(lines):
+            i += 1
+            block.append(lines[i])
+            depth += lines[i].count("{") - lines[i].count("}")
+        blocks[match.group(1)] = "\n".join(block)
+        i += 1
+    return blocks
+
+
+def code_signatures(code: str) -> str:
+    """
+    Interfaccia pubblica di un file Python: classi, funzioni e metodi con la
+    loro firma e la prima riga della docstring, senza i corpi.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return "\n".join(line for line in code.splitlines() if line.lstrip().startswith(("def ", "class ")))
+
+    out = []
+
+    def describe(node, indent):
+        if isinstance(node, ast.ClassDef):
+            bases = ", ".join(ast.unparse(base) for base in node.bases)
+            out.append(f"{indent}class {node.name}({bases}):" if bases else f"{indent}class {node.name}:")
+        else:
+            prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+            returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+            out.append(f"{indent}{prefix} {node.name}({ast.unparse(node.args)}){returns}: ...")
+        doc = ast.get_docstring(node)
+        if doc:
+            out.append(f'{indent}    """{doc.strip().splitlines()[0]}"""')
+        if isinstance(node, ast.ClassDef):
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)) and (
+                    not child.name.startswith("_") or child.name == "__init__"
+                ):
+                    describe(child, indent + "    ")
+
+    for node in tree.body:
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)) and not node.name.startswith("_"):
+            describe(node, "")
+    return "\n".join(out)
+
+
+class ArchitectureIndex:
+    """
+    Indicizza una sola volta l'output dell'architetto (UML, moduli, cartelle)
+    e costruisce per ogni file un contesto ridotto: solo le classi UML che il
+    file definisce, le relazioni che le coinvolgono, la riga del modulo e le
+    firme dei file da cui dipende, invece dell'intera architettura.
+    """
+    def __init__(self, description: str, uml: str, modules: str, folders: dict):
+        self.description = description
+        self.uml = uml
+        self.modules = modules
+        self.class_blocks = _uml_class_blocks(uml)
+        self.relations = [line.strip() for line in uml.splitlines() if _UML_RELATION.match(line)]
+        self.classes_by_file = {}
+        for class_name, path in map_classes_to_files(folders, uml, modules).items():
+            self.classes_by_file.setdefault(path, []).append(class_name)
+        self.module_lines = {
+            _normalize_name(name): f"{name}: {description}" for name, description in _module_lines(modules)
+        }
+
+    def file_section(self, relative_path: str) -> str:
+        """
+        Parte di architettura che riguarda il file: responsabilità del modulo,
+        classi UML da implementare e relazioni che le coinvolgono.
+        """
+        classes = self.classes_by_file.get(relative_path, [])
+        module_line = self.module_lines.get(_normalize_name(relative_path))
+        parts = []
+        if module_line:
+            parts.append(f"- Responsabilità del modulo: {module_line}")
+        if classes and self.class_blocks:
+            blocks = "\n".join(self.class_blocks[c] for c in classes if c in self.class_blocks)
+            relations = "\n".join(
+                r for r in self.relations if any(re.search(rf"\b{c}\b", r) for c in classes)
+            )
+            parts.append(f"- Classi UML da implementare:\n{blocks}" + (f"\n{relations}" if relations else ""))
+        elif not self.class_blocks:
+            # UML non in formato PlantUML: non è possibile estrarne una parte
+            parts.append(f"- UML: {self.uml}")
+        if not module_line and not classes:
+            parts.append(f"- Moduli del progetto:\n{self.modules}")
+        return "\n".join(parts)
+
+    def dependency_interfaces(self, dependencies: list, files: dict) -> str:
+        """
+        Firme pubbliche dei file da cui dipende un file, se già generati.
+        """
+        return "".join(
+            f"\n--- {dep} ---\n{code_signatures(files[dep])}\n" for dep in dependencies if dep in files
+        )
+
+    def file_context(self, relative_path: str, dependencies: list, files: dict) -> str:
+        """
+        Contesto di progetto per un singolo file; files è la mappa
+        {percorso relativo: codice} dei file già generati.
+        """
+        context = (
+            f"Contesto del progetto:\n"
+            f"- Descrizione: {self.description}\n"
+            f"{self.file_section(relative_path)}\n"
+        )
+        interfaces = self.dependency_interfaces(dependencies, files)
+        if interfaces:
+            context += f"\nInterfacce dei file da cui dipende (già generati):{interfaces}"
+        return context
+
+
+FOLDER_SECTION = "Struttura della Cartella del Progetto"
+_FOLDER_BLOCK = re.compile(re.escape(FOLDER_SECTION) + r"[^\n]*\n.*?```[^\n]*\n.*?```", re.DOTALL)
+
+
+class ArchitectureStream:
+    """
+    Parser incrementale della risposta dell'architetto in streaming. feed()
+    restituisce True una sola volta, appena il blocco ``` della sezione
+    "Struttura della Cartella del Progetto" è chiuso: da quel momento planned
+    contiene il testo fino alla fine del blocco, con le sezioni già complete
+    (di solito descrizione, UML e moduli), mentre il resto può ancora arrivare.
+    """
+    def __init__(self):
+        self.text = ""
+        self.planned = None
+
+    def feed(self, delta: str) -> bool:
+        self.text += delta
+        if self.planned is not None or "`" not in delta:
+            return False
+        match = _FOLDER_BLOCK.search(self.text)
+        if match is None:
+            return False
+        self.planned = self.text[:match.end()]
+        return True
@@ -0,0 +1,146 @@
+"""
+Formato strutturato dell'output dell'architetto (SupervisorAgent con
+structured=True, vedi AgentDeveloper.py).
+
+Invece del testo diviso in sezioni "###" con la struttura delle cartelle
+indentata, l'architetto restituisce un documento JSON validato con pydantic:
+
+    {
+      "description": "...",
+      "uml": "@startuml ... @enduml",
+      "modules": [{"name": "models.py", "description": "..."}],
+      "files": [{"path": "root/app/models.py", "depends_on": []}, ...]
+    }
+
+plan() lo converte nel piano usato dal supervisore ({"uml", "modules",
+"folders", "dependencies"}); le dipendenze dichiarate in depends_on si
+aggiungono a quelle ricavate da UML e moduli. validate() restituisce gli
+errori in forma leggibile, da rimandare al modello per la correzione.
+
+Il modulo importa pydantic: AgentDeveloper lo importa solo quando serve.
+"""
+import json
+import posixpath
+import re
+from functools import lru_cache
+from typing import List
+
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
+
+_FENCE = re.compile(r"^```(?:json)?\s*\n(.*?)\n?```\s*$", re.DOTALL)
+
+
+def looks_like_document(text: str) -> bool:
+    """
+    True se il testo sembra un documento JSON (eventualmente in un blocco ```json).
+    """
+    return text.lstrip().startswith(("{", "```json"))
+
+
+def _normalize_path(path: str) -> str:
+    path = path.strip().replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path
+
+
+class ModuleSpec(BaseModel):
+    name: str = Field(description="file del modulo, es. reservation_manager.py")
+    description: str = Field(description="responsabilità del modulo e file che usa")
+
+
+class FileSpec(BaseModel):
+    path: str = Field(description="percorso relativo del file, cartelle separate da /, es. root/app/models.py")
+    depends_on: List[str] = Field(
+        default_factory=list, description="percorsi (tra quelli di files) dei file che questo file importa",
+    )
+
+    @field_validator("path")
+    @classmethod
+    def _relative_path(cls, path: str) -> str:
+        path = _normalize_path(path)
+        parts = path.split("/")
+        if not path or path.startswith("/") or path.endswith("/") or any(part in ("", ".", "..") for part in parts):
+            raise ValueError("deve essere il percorso relativo di un file, senza '..' e senza '/' finale")
+        return path
+
+
+class ArchitectureDocument(BaseModel):
+    description: str = Field(description="descrizione generale del sistema")
+    uml: str = Field(default="", description="diagramma delle classi in PlantUML (@startuml ... @enduml)")
+    modules: List[ModuleSpec] = Field(default_factory=list, description="moduli principali")
+    files: List[FileSpec] = Field(min_length=1, description="tutti i file del progetto da generare")
+
+    @model_validator(mode="after")
+    def _consistent_files(self):
+        paths = [spec.path for spec in self.files]
+        duplicates = sorted({path for path in paths if paths.count(path) > 1})
+        if duplicates:
+            raise ValueError(f"file ripetuti in files: {', '.join(duplicates)}")
+        known = set(paths)
+        unknown = []
+        for spec in self.files:
+            resolved = []
+            for dependency in spec.depends_on:
+                dependency = _normalize_path(dependency)
+                if dependency not in known:
+                    # basta la parte finale del percorso, se nel progetto un solo file corrisponde
+                    candidates = [path for path in paths if path.endswith("/" + dependency)]
+                    dependency = candidates[0] if len(candidates) == 1 else None
+                if dependency is None or dependency == spec.path:
+                    unknown.append(spec.path)
+                elif dependency not in resolved:
+                    resolved.append(dependency)
+            spec.depends_on = resolved
+        if unknown:
+            raise ValueError(
+                "depends_on deve contenere i percorsi di altri file di files "
+                f"(da correggere in: {', '.join(sorted(set(unknown)))})"
+            )
+        return self
+
+    def plan(self) -> dict:
+        """
+        Piano del supervisore: UML, moduli nel formato "- nome: descrizione",
+        cartelle {cartella: [file]} e dipendenze dichiarate {file: [file]}.
+        """
+        folders = {}
+        for spec in self.files:
+            folder, file_name = posixpath.split(spec.path)
+            parts = folder.split("/") if folder else []
+            for depth in range(1, len(parts)):
+                folders.setdefault("/".join(parts[:depth]), [])
+            folders.setdefault(folder, []).append(file_name)
+        return {
+            "uml": self.uml.strip(),
+            "modules": "\n".join(f"- {module.name}: {module.description}" for module in self.modules),
+            "folders": folders,
+            "dependencies": {spec.path: list(spec.depends_on) for spec in self.files if spec.depends_on},
+        }
+
+
+@lru_cache(maxsize=None)
+def schema_text() -> str:
+    """
+    JSON Schema del documento, da includere nel prompt dell'architetto.
+    """
+    return json.dumps(ArchitectureDocument.model_json_schema(), ensure_ascii=False)
+
+
+def validate(text: str):
+    """
+    (ArchitectureDocument, None) se il testo è un documento valido, altrimenti
+    (None, [errori leggibili, es. "files.2.path: ..."]).
+    """
+    text = text.strip()
+    match = _FENCE.match(text)
+    if match:
+        text = match.group(1)
+    try:
+        return ArchitectureDocument.model_validate_json(text), None
+    except ValidationError as e:
+        errors = []
+        for error in e.errors(include_url=False):
+            location = ".".join(str(part) for part in error["loc"]) or "documento"
+            errors.append(f"{location}: {error['msg']}")
+        return None, errors
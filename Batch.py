@@ -0,0 +1,434 @@
+"""
+Modalità batch per generare interi progetti (anche molti insieme) senza
+bisogno di latenza interattiva.
+
+Invece di una richiesta sincrona alla volta, le richieste degli agenti di tutti
+i progetti vengono raccolte in un file JSONL nel formato dell'API batch di
+OpenAI (una riga {"custom_id", "method", "url", "body"} per richiesta),
+inviate con client.batches, attese con polling e poi smistate nei file e
+nella solita pipeline di esecuzione, escalation e riparazione.
+
+BatchBuilder procede a ondate, perché ogni file deve vedere il codice reale
+dei file da cui dipende:
+  1. le architetture dei progetti (quelle non già registrate nel manifest);
+  2. un'ondata per livello del grafo delle dipendenze, con i file di tutti i progetti;
+  3. la documentazione dei file Python (DocumenterAgent), se document=True.
+Le richieste già presenti nella cache di CompletionLayer non vengono inviate e
+le risposte del batch vi vengono registrate. Una richiesta fallita nel batch
+viene ripetuta in modo sincrono.
+
+LocalBatchClient è un sostituto locale dell'API batch (stessi metodi usati da
+BatchRunner) che esegue le richieste con chat.completions: serve per i test e
+per i benchmark contro benchmarks/fake_openai_server.py.
+
+Uso: python Batch.py progetti.txt --output builds [--local] [--poll-interval 30]
+(una descrizione di progetto per riga di progetti.txt)
+"""
+import argparse
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+
+from AgentDeveloper import SupervisorAgent, extract_code, llm
+from Executor import WorkerPool
+from Routing import default_policy
+from Scheduler import priority_scope
+from Tracing import get_tracer
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+MAX_BATCH_REQUESTS = 50000  # limite di richieste per batch dell'API
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def batch_line(custom_id: str, params: dict) -> dict:
+    """
+    Una riga del file di input del batch.
+    """
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": params}
+
+
+class BatchRunner:
+    """
+    Invia richieste chat.completions come batch e ne attende i risultati.
+
+    client deve offrire files.create/content e batches.create/retrieve (un
+    client OpenAI o LocalBatchClient; default: il client di AgentDeveloper.llm).
+    layer è il CompletionLayer la cui cache evita di reinviare richieste già
+    registrate. Gli errori delle singole richieste finiscono in self.errors.
+    """
+    def __init__(self, client=None, poll_interval: float = 30.0, completion_window: str = "24h",
+                 max_requests: int = MAX_BATCH_REQUESTS, layer=None, timeout: float = None):
+        self._client = client
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.max_requests = max(1, max_requests)
+        self.layer = layer or llm
+        self.timeout = timeout
+        self.errors = {}
+
+    @property
+    def client(self):
+        return self._client or self.layer.client
+
+    def run(self, requests: dict) -> dict:
+        """
+        {custom_id: parametri di chat.completions.create} -> {custom_id: ChatCompletion}.
+        Le richieste fallite sono assenti dal risultato (vedi self.errors).
+        """
+        results, pending = {}, {}
+        for custom_id, params in requests.items():
+            cached = self.layer.lookup(params)
+            if cached is not None:
+                results[custom_id] = cached
+            else:
+                pending[custom_id] = params
+        if not pending:
+            return results
+
+        with get_tracer().span("batch.job", requests=len(pending), cached=len(results)) as span:
+            ids = list(pending)
+            batches = [
+                self._submit({custom_id: pending[custom_id] for custom_id in ids[i:i + self.max_requests]})
+                for i in range(0, len(ids), self.max_requests)
+            ]
+            prompt_tokens = completion_tokens = 0
+            for batch in self._wait(batches):
+                for custom_id, completion, error in self._collect(batch):
+                    if completion is None:
+                        self.errors[custom_id] = error
+                        continue
+                    results[custom_id] = completion
+                    self.layer.remember(pending[custom_id], completion)
+                    if completion.usage is not None:
+                        prompt_tokens += completion.usage.prompt_tokens
+                        completion_tokens += completion.usage.completion_tokens
+            for custom_id in pending:
+                if custom_id not in results:
+                    self.errors.setdefault(custom_id, "risposta assente dal batch")
+            span.set(failed=sum(1 for custom_id in pending if custom_id not in results),
+                     prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        return results
+
+    def _submit(self, requests: dict):
+        data = "".join(
+            json.dumps(batch_line(custom_id, params), ensure_ascii=False) + "\n"
+            for custom_id, params in requests.items()
+        ).encode("utf-8")
+        input_file = self.client.files.create(file=("batch.jsonl", data), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window=self.completion_window,
+        )
+        print(f"[BATCH] inviato {batch.id}: {len(requests)} richieste")
+        return batch
+
+    def _wait(self, batches: list) -> list:
+        """
+        Polling dei batch finché non sono tutti in uno stato finale.
+        """
+        start = time.monotonic()
+        pending = {batch.id: batch for batch in batches}
+        done = []
+        while pending:
+            for batch_id in list(pending):
+                batch = self.client.batches.retrieve(batch_id)
+                if batch.status in TERMINAL_STATUSES:
+                    counts = batch.request_counts
+                    print(f"[BATCH] {batch_id}: {batch.status}"
+                          + (f", {counts.completed}/{counts.total} completate" if counts else ""))
+                    done.append(batch)
+                    del pending[batch_id]
+            if pending:
+                if self.timeout is not None and time.monotonic() - start > self.timeout:
+                    raise TimeoutError(f"Batch non completati entro {self.timeout} s: {', '.join(pending)}")
+                time.sleep(self.poll_interval)
+        return done
+
+    def _collect(self, batch):
+        """
+        (custom_id, ChatCompletion o None, errore) per ogni riga dei file di output e di errore.
+        """
+        from openai.types.chat import ChatCompletion
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if record.get("error") or response.get("status_code") != 200:
+                    yield record.get("custom_id"), None, record.get("error") or response.get("body")
+                else:
+                    yield record["custom_id"], ChatCompletion.model_validate(response["body"]), None
+
+
+class _LocalFiles:
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def create(self, file, purpose: str):
+        name, data = file if isinstance(file, tuple) else (getattr(file, "name", "batch.jsonl"), file.read())
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with self._lock:
+            self._files[file_id] = data
+        return SimpleNamespace(id=file_id, filename=name, purpose=purpose, bytes=len(data))
+
+    def content(self, file_id: str):
+        with self._lock:
+            data = self._files[file_id]
+        return SimpleNamespace(content=data, text=data.decode("utf-8"))
+
+
+class _LocalBatches:
+    def __init__(self, client, files: _LocalFiles, max_workers: int):
+        self._client = client
+        self._files = files
+        self._max_workers = max_workers
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def create(self, input_file_id: str, endpoint: str, completion_window: str = "24h", metadata=None):
+        batch = SimpleNamespace(
+            id=f"batch_{uuid.uuid4().hex[:24]}", status="validating", endpoint=endpoint,
+            input_file_id=input_file_id, output_file_id=None, error_file_id=None,
+            completion_window=completion_window, metadata=metadata,
+            request_counts=SimpleNamespace(total=0, completed=0, failed=0),
+        )
+        with self._lock:
+            self._batches[batch.id] = batch
+        threading.Thread(target=self._process, args=(batch,), daemon=True).start()
+        return batch
+
+    def retrieve(self, batch_id: str):
+        with self._lock:
+            return self._batches[batch_id]
+
+    def _process(self, batch):
+        lines = [json.loads(line) for line in self._files.content(batch.input_file_id).text.splitlines() if line.strip()]
+        batch.request_counts.total = len(lines)
+        batch.status = "in_progress"
+        with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+            records = list(pool.map(lambda line: self._execute(batch, line), lines))
+        outputs = [record for record in records if record["error"] is None]
+        errors = [record for record in records if record["error"] is not None]
+        batch.status = "finalizing"
+        if outputs:
+            batch.output_file_id = self._upload(outputs)
+        if errors:
+            batch.error_file_id = self._upload(errors)
+        batch.status = "completed"
+
+    def _execute(self, batch, line):
+        record = {"id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": line["custom_id"], "response": None, "error": None}
+        try:
+            response = self._client.chat.completions.create(**line["body"])
+            record["response"] = {"status_code": 200, "request_id": uuid.uuid4().hex, "body": response.model_dump()}
+        except Exception as e:
+            record["error"] = {"code": type(e).__name__, "message": str(e)}
+        with self._lock:
+            if record["error"] is None:
+                batch.request_counts.completed += 1
+            else:
+                batch.request_counts.failed += 1
+        return record
+
+    def _upload(self, records: list) -> str:
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        return self._files.create(("output.jsonl", data), purpose="batch_output").id
+
+
+class LocalBatchClient:
+    """
+    Sostituto locale dell'API batch: stessi metodi usati da BatchRunner
+    (files.create/content, batches.create/retrieve), ma ogni batch viene
+    eseguito subito in un thread in background, max_workers richieste alla
+    volta, con client.chat.completions.create.
+    """
+    def __init__(self, client, max_workers: int = 16):
+        self.files = _LocalFiles()
+        self.batches = _LocalBatches(client, self.files, max_workers)
+
+
+class BatchBuilder:
+    """
+    Genera più progetti insieme con richieste in batch (vedi la docstring del
+    modulo). Le opzioni restanti vengono passate ai SupervisorAgent, che
+    condividono un solo WorkerPool.
+    """
+    def __init__(self, runner: BatchRunner = None, max_workers: int = 4, document: bool = True, **supervisor_options):
+        self.runner = runner or BatchRunner()
+        self.max_workers = max(1, max_workers)
+        self.document = document
+        self.supervisor_options = supervisor_options
+
+    def build(self, projects: dict) -> dict:
+        """
+        {cartella radice: descrizione del progetto} -> {cartella radice: risultato di manage_project o None}.
+        """
+        executor = WorkerPool(size=self.max_workers)
+        supervisors = {
+            root: SupervisorAgent(max_workers=self.max_workers, root_folder=root, executor=executor,
+                                  **self.supervisor_options)
+            for root in projects
+        }
+        try:
+            with get_tracer().span("batch.build", projects=len(projects)), priority_scope("bulk"):
+                graphs = self.architectures(supervisors, projects)
+                self.develop(supervisors, graphs)
+                for root in graphs:
+                    supervisors[root].check_project()
+                    supervisors[root].run_tests()
+                if self.document:
+                    self.documentation(supervisors, graphs)
+        finally:
+            executor.close()
+
+        for root, supervisor in supervisors.items():
+            print(f"\n=== {root} ===")
+            supervisor.report_repairs()
+        routing = next(iter(supervisors.values())).routing if supervisors else default_policy()
+        routing.stats.save()
+        print("\n--- MODELLI (tasso di successo) ---")
+        print(routing.stats.report())
+        return {root: supervisors[root].result() if root in graphs else None for root in projects}
+
+    @staticmethod
+    def params(supervisor: SupervisorAgent, agent_type: str, content: str) -> dict:
+        """
+        Parametri della richiesta per il primo gradino della scala dell'agente
+        (più quelli propri dell'agente, es. response_format dell'architetto).
+        """
+        agent = supervisor.agents[agent_type]
+        return {"model": supervisor.ladder(agent_type)[0] or agent.model, "messages": agent.build_messages(content),
+                **getattr(agent, "params", dict)()}
+
+    @staticmethod
+    def text(completion) -> str:
+        return completion.choices[0].message.content if completion is not None else None
+
+    def architectures(self, supervisors: dict, projects: dict) -> dict:
+        """
+        Ondata 1: architetture. Restituisce {cartella radice: grafo delle dipendenze}.
+        """
+        requests, pending = {}, {}
+        for index, (root, supervisor) in enumerate(supervisors.items()):
+            context, input_hash, architecture = supervisor.architecture_request(projects[root])
+            if architecture is None:
+                requests[f"{index}:architect"] = self.params(supervisor, "architect", context)
+            pending[root] = (index, context, input_hash, architecture)
+        print(f"[BATCH] architetture: {len(requests)} richieste")
+        responses = self.runner.run(requests)
+
+        graphs = {}
+        for root, (index, context, input_hash, architecture) in pending.items():
+            supervisor = supervisors[root]
+            if architecture is None:
+                architecture = self.text(responses.get(f"{index}:architect"))
+            if architecture is None:
+                architecture = supervisor.route_task("architect", context)
+            graph = supervisor.apply_architecture(input_hash, architecture)
+            if graph is not None:
+                graphs[root] = graph
+        return graphs
+
+    def develop(self, supervisors: dict, graphs: dict) -> None:
+        """
+        Ondate successive: in ognuna i file (di tutti i progetti) le cui
+        dipendenze sono complete. I risultati vengono eseguiti e, se serve,
+        corretti in parallelo prima dell'ondata seguente.
+        """
+        remaining = {root: {path: set(deps) for path, deps in graph.items()} for root, graph in graphs.items()}
+        indexes = {root: index for index, root in enumerate(supervisors)}
+        wave = 0
+        while any(remaining.values()):
+            ready = [(root, path) for root, files in remaining.items() for path, deps in files.items() if not deps]
+            if not ready:
+                print("[BATCH] dipendenze circolari: file rimanenti non generati.")
+                break
+            wave += 1
+            requests, jobs = {}, []
+            for root, path in ready:
+                del remaining[root][path]
+                supervisor = supervisors[root]
+                request = supervisor.file_request(path, sorted(graphs[root][path]))
+                custom_id = f"{indexes[root]}:developer:{path}"
+                if request is not None:
+                    requests[custom_id] = self.params(supervisor, "developer", request[0])
+                jobs.append((root, path, request, custom_id))
+            print(f"[BATCH] ondata {wave}: {len(requests)} file da generare, {len(jobs) - len(requests)} invariati")
+            responses = self.runner.run(requests)
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {}
+                for root, path, request, custom_id in jobs:
+                    text = self.text(responses.get(custom_id))
+                    generated = extract_code(text) if text is not None else None
+                    futures[pool.submit(
+                        contextvars.copy_context().run, supervisors[root].complete_file, path, request, generated
+                    )] = (root, path)
+                for future in as_completed(futures):
+                    root, path = futures[future]
+                    try:
+                        future.result()
+                    except Exception as ex:
+                        print(f"Errore durante la generazione di {root}/{path}: {ex}")
+            for root, path in ready:
+                for deps in remaining[root].values():
+                    deps.discard(path)
+
+    def documentation(self, supervisors: dict, graphs: dict) -> None:
+        """
+        Ultima ondata: documentazione di ogni file Python, scritta in docs/<file>.md nella cartella del progetto.
+        """
+        requests, targets = {}, {}
+        for index, (root, supervisor) in enumerate(supervisors.items()):
+            for path in graphs.get(root, ()):
+                code = supervisor.project_context["files"].get(path)
+                if not path.endswith(".py") or not code:
+                    continue
+                custom_id = f"{index}:documenter:{path}"
+                content = f"File {path}:\n```python\n{code}\n```"
+                requests[custom_id] = self.params(supervisor, "documenter", content)
+                targets[custom_id] = (supervisor, path, content)
+        print(f"[BATCH] documentazione: {len(requests)} richieste")
+        responses = self.runner.run(requests)
+        for custom_id, (supervisor, path, content) in targets.items():
+            text = self.text(responses.get(custom_id))
+            if text is None:
+                text = supervisor.route_task("documenter", content)
+            doc_path = os.path.join(supervisor.root_folder, "docs", f"{path}.md")
+            os.makedirs(os.path.dirname(doc_path), exist_ok=True)
+            with open(doc_path, "w", encoding="utf-8") as f:
+                f.write(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera molti progetti con richieste in batch.")
+    parser.add_argument("projects", help="file di testo con una descrizione di progetto per riga")
+    parser.add_argument("--output", default="builds", help="cartella in cui creare i progetti")
+    parser.add_argument("--local", action="store_true", help="esegue i batch in locale (LocalBatchClient)")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="secondi tra due controlli dello stato")
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--no-docs", action="store_true", help="non genera la documentazione")
+    args = parser.parse_args(argv)
+
+    with open(args.projects, "r", encoding="utf-8") as f:
+        descriptions = [line.strip() for line in f if line.strip()]
+    projects = {os.path.join(args.output, f"project_{i:03d}"): text for i, text in enumerate(descriptions)}
+    client = LocalBatchClient(llm.client) if args.local else None
+    builder = BatchBuilder(BatchRunner(client, poll_interval=args.poll_interval),
+                           max_workers=args.max_workers, document=not args.no_docs)
+    results = builder.build(projects)
+    print(f"\nProgetti completati: {sum(1 for result in results.values() if result)}/{len(results)}")
+
+
+if __name__ == "__main__":
+    main()
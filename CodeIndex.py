@@ -0,0 +1,408 @@
+"""
+Indice locale dei file dello spazio di lavoro, per cercare codice senza
+leggere file interi (tool search_code e get_symbol di MAS.py).
+
+Ogni file di testo sotto la radice viene diviso in blocchi: per un file Python
+uno per funzione o metodo, uno per l'intestazione di ogni classe e finestre
+per il codice al livello del modulo (dall'AST); per gli altri file, e per un
+file Python che non compila, finestre di CHUNK_LINES righe. Sui blocchi:
+  - BM25 sui termini (identificatori interi e spezzati su _ e camelCase);
+  - trigrammi del vocabolario: un termine della ricerca che non compare
+    nell'indice si espande nei termini simili ("reserv" trova Reservation),
+    con peso ridotto;
+  - la tabella dei simboli (classi, funzioni e metodi con nome qualificato).
+
+L'indice è incrementale: update_file (chiamato da write_code_to_file) riscrive
+le voci di un solo file; refresh, prima delle ricerche e al massimo ogni
+REFRESH_INTERVAL secondi, confronta dimensione e mtime dei file e reindicizza
+solo quelli cambiati. I tempi di costruzione, aggiornamento e ricerca sono in
+stats() e negli span index.*.
+"""
+import ast
+import math
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+from Tracing import get_tracer
+
+CHUNK_LINES = 40          # righe per finestra (file non Python, codice al livello del modulo)
+SNIPPET_LINES = 60        # righe massime di un blocco restituito da search
+SYMBOL_LINES = 200        # righe massime di un simbolo restituito da symbol
+MAX_FILE_BYTES = 1_000_000
+MAX_FILES = 5000
+REFRESH_INTERVAL = 2.0    # secondi tra due scansioni della cartella
+TEXT_EXTENSIONS = {
+    ".py", ".pyi", ".md", ".rst", ".txt", ".json", ".toml", ".yaml", ".yml", ".cfg", ".ini",
+    ".html", ".css", ".js", ".ts", ".sql", ".sh",
+}
+SKIP_DIRS = {"node_modules", "venv", "env", "build", "dist", "site-packages"}
+K1, B = 1.5, 0.75          # parametri BM25
+TRIGRAM_MIN = 0.6          # frazione minima di trigrammi in comune per espandere un termine
+TRIGRAM_WEIGHT = 0.7       # peso di un termine espanso rispetto a uno esatto
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_WORD_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def terms(text: str) -> list:
+    """
+    Termini di un testo: ogni identificatore in minuscolo e, se composto, le
+    sue parti (reservation_manager, ReservationManager -> reservation, manager).
+    """
+    result = []
+    for word in _IDENTIFIER.findall(text):
+        result.append(word.lower())
+        parts = [part.lower() for piece in word.split("_") for part in _WORD_PART.findall(piece)]
+        if len(parts) > 1:
+            result.extend(parts)
+    return result
+
+
+def _trigrams(term: str) -> set:
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+@dataclass
+class Symbol:
+    name: str     # nome qualificato, es. ReservationManager.cancel
+    kind: str     # class, function, method
+    path: str
+    start: int    # prima riga (decoratori compresi), da 1
+    end: int      # ultima riga, inclusa
+
+
+@dataclass
+class SearchHit:
+    path: str
+    start: int
+    end: int
+    symbol: str   # nome qualificato del blocco, vuoto per le finestre di righe
+    score: float
+    snippet: str
+
+
+def _windows(start: int, end: int, symbol: str = "") -> list:
+    return [(line, min(line + CHUNK_LINES - 1, end), symbol) for line in range(start, end + 1, CHUNK_LINES)]
+
+
+def _python_blocks(tree: ast.Module, lines: list):
+    """
+    ([(prima riga, ultima riga, simbolo)], [Symbol senza path]) di un modulo.
+    """
+    blocks, symbols, covered = [], [], set()
+
+    def visit(node, prefix: str, in_class: bool):
+        for child in node.body:
+            if not isinstance(child, _DEFINITIONS):
+                continue
+            start = min([child.lineno] + [decorator.lineno for decorator in child.decorator_list])
+            name = prefix + child.name
+            if isinstance(child, ast.ClassDef):
+                symbols.append(Symbol(name, "class", "", start, child.end_lineno))
+                inner = [item for item in child.body if isinstance(item, _DEFINITIONS)]
+                header_end = min(item.lineno for item in inner) - 1 if inner else child.end_lineno
+                blocks.append((start, header_end, name))
+                visit(child, name + ".", True)
+            else:
+                symbols.append(Symbol(name, "method" if in_class else "function", "", start, child.end_lineno))
+                blocks.append((start, child.end_lineno, name))
+            if not prefix:
+                covered.update(range(start, child.end_lineno + 1))
+
+    visit(tree, "", False)
+    # codice al livello del modulo (import, costanti, blocco __main__): righe non coperte
+    run_start = None
+    for number in range(1, len(lines) + 2):
+        free = number <= len(lines) and number not in covered
+        if free and run_start is None:
+            run_start = number
+        elif not free and run_start is not None:
+            if any(lines[i - 1].strip() for i in range(run_start, number)):
+                blocks.extend(_windows(run_start, number - 1))
+            run_start = None
+    return blocks, symbols
+
+
+class CodeIndex:
+    """
+    Indice dei file sotto root. I percorsi sono relativi a root, separati da
+    "/" (assoluti per i file indicizzati fuori da root).
+    """
+    def __init__(self, root: str = ".", refresh_interval: float = REFRESH_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._files = {}      # percorso -> {"stat", "lines", "chunks", "symbols"}
+        self._chunks = {}     # id -> (percorso, prima riga, ultima riga, simbolo, {termine: frequenza}, lunghezza)
+        self._postings = {}   # termine -> {id: frequenza}
+        self._trigrams = {}   # trigramma -> {termine}
+        self._symbols = {}    # nome (qualificato e semplice) -> [Symbol]
+        self._next_id = 0
+        self._total_length = 0
+        self._last_refresh = None
+        self._stats = {
+            "build_seconds": 0.0, "updates": 0, "update_seconds": 0.0,
+            "refreshes": 0, "refresh_seconds": 0.0, "queries": 0, "query_seconds": 0.0,
+        }
+
+    def _relative(self, path: str) -> str:
+        path = os.path.abspath(path)
+        relative = os.path.relpath(path, self.root)
+        return path if relative.startswith("..") else relative.replace(os.sep, "/")
+
+    def _absolute(self, path: str) -> str:
+        return path if os.path.isabs(path) else os.path.join(self.root, path)
+
+    def _stat(self, path: str):
+        try:
+            stat = os.stat(self._absolute(path))
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    # --- voci dell'indice -------------------------------------------------
+
+    def _add(self, path: str, text: str, stat) -> None:
+        lines = text.splitlines()
+        blocks, symbols = [], []
+        if path.endswith((".py", ".pyi")):
+            try:
+                blocks, symbols = _python_blocks(ast.parse(text), lines)
+            except (SyntaxError, ValueError):
+                pass
+        if not blocks and not symbols:
+            blocks = _windows(1, len(lines))
+        chunk_ids = []
+        for start, end, symbol in blocks:
+            counts = {}
+            # il percorso e il nome del simbolo contano come parte del blocco
+            for term in terms(" ".join(lines[start - 1:end]) + f" {path} {symbol}"):
+                counts[term] = counts.get(term, 0) + 1
+            chunk_id = self._next_id
+            self._next_id += 1
+            length = sum(counts.values())
+            self._chunks[chunk_id] = (path, start, end, symbol, counts, length)
+            self._total_length += length
+            for term, frequency in counts.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    for trigram in _trigrams(term):
+                        self._trigrams.setdefault(trigram, set()).add(term)
+                postings[chunk_id] = frequency
+            chunk_ids.append(chunk_id)
+        for symbol in symbols:
+            symbol.path = path
+            for key in {symbol.name, symbol.name.rsplit(".", 1)[-1]}:
+                self._symbols.setdefault(key, []).append(symbol)
+        self._files[path] = {"stat": stat, "lines": lines, "chunks": chunk_ids, "symbols": symbols}
+
+    def _remove(self, path: str) -> None:
+        entry = self._files.pop(path, None)
+        if entry is None:
+            return
+        for chunk_id in entry["chunks"]:
+            counts, length = self._chunks.pop(chunk_id)[4:]
+            self._total_length -= length
+            for term in counts:
+                postings = self._postings[term]
+                del postings[chunk_id]
+                if not postings:
+                    del self._postings[term]
+                    for trigram in _trigrams(term):
+                        self._trigrams[trigram].discard(term)
+                        if not self._trigrams[trigram]:
+                            del self._trigrams[trigram]
+        for symbol in entry["symbols"]:
+            for key in {symbol.name, symbol.name.rsplit(".", 1)[-1]}:
+                remaining = [other for other in self._symbols[key] if other is not symbol]
+                if remaining:
+                    self._symbols[key] = remaining
+                else:
+                    del self._symbols[key]
+
+    def _index_file(self, path: str, text: str = None) -> None:
+        stat = self._stat(path)
+        if text is None:
+            if stat is None or stat[0] > MAX_FILE_BYTES:
+                self._remove(path)
+                return
+            try:
+                with open(self._absolute(path), "r", encoding="utf-8", errors="replace") as f:
+                    text = f.read()
+            except OSError:
+                self._remove(path)
+                return
+        self._remove(path)
+        self._add(path, text, stat)
+
+    def update_file(self, path: str, content: str = None) -> None:
+        """
+        Reindicizza un file appena scritto (content: il contenuto, se già noto).
+        """
+        start = time.perf_counter()
+        path = self._relative(path)
+        with get_tracer().span("index.update", file=path), self._lock:
+            self._index_file(path, content)
+            self._stats["updates"] += 1
+            self._stats["update_seconds"] += time.perf_counter() - start
+
+    def remove_file(self, path: str) -> None:
+        with self._lock:
+            self._remove(self._relative(path))
+
+    def _scan(self) -> dict:
+        """
+        {percorso: (dimensione, mtime)} dei file di testo sotto root.
+        """
+        found = {}
+        for directory, subdirectories, file_names in os.walk(self.root):
+            subdirectories[:] = sorted(
+                d for d in subdirectories if not d.startswith((".", "__")) and d not in SKIP_DIRS
+            )
+            for name in sorted(file_names):
+                if os.path.splitext(name)[1] not in TEXT_EXTENSIONS:
+                    continue
+                path = self._relative(os.path.join(directory, name))
+                stat = self._stat(path)
+                if stat is not None and stat[0] <= MAX_FILE_BYTES:
+                    found[path] = stat
+                if len(found) >= MAX_FILES:
+                    return found
+        return found
+
+    def refresh(self, force: bool = False) -> None:
+        """
+        Allinea l'indice ai file su disco: indicizza i file nuovi o cambiati
+        (dimensione o mtime diversi) e rimuove quelli cancellati. Senza force,
+        al massimo una scansione ogni refresh_interval secondi.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._last_refresh is not None and now - self._last_refresh < self.refresh_interval:
+                return
+            first = self._last_refresh is None
+            start = time.perf_counter()
+            with get_tracer().span("index.build" if first else "index.refresh") as span:
+                found = self._scan()
+                for path in list(self._files):
+                    if path not in found:
+                        # file fuori da root (scritti da update_file) o oltre MAX_FILES: si controllano da soli
+                        stat = self._stat(path)
+                        if stat is None:
+                            self._remove(path)
+                        elif stat != self._files[path]["stat"]:
+                            self._index_file(path)
+                changed = [path for path, stat in found.items()
+                           if path not in self._files or self._files[path]["stat"] != stat]
+                for path in changed:
+                    self._index_file(path)
+                span.set(files=len(self._files), changed=len(changed))
+            elapsed = time.perf_counter() - start
+            if first:
+                self._stats["build_seconds"] = elapsed
+            else:
+                self._stats["refreshes"] += 1
+                self._stats["refresh_seconds"] += elapsed
+            self._last_refresh = time.monotonic()
+
+    # --- ricerca ----------------------------------------------------------
+
+    def _expand(self, term: str) -> dict:
+        """
+        {termine dell'indice: peso} per un termine della ricerca: sé stesso se
+        indicizzato, altrimenti i termini con abbastanza trigrammi in comune.
+        """
+        if term in self._postings:
+            return {term: 1.0}
+        query = _trigrams(term)
+        if not query:
+            return {}
+        shared = {}
+        for trigram in query:
+            for candidate in self._trigrams.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        return {candidate: TRIGRAM_WEIGHT * count / len(query)
+                for candidate, count in shared.items() if count / len(query) >= TRIGRAM_MIN}
+
+    def search(self, query: str, k: int = 5) -> list:
+        """
+        I k blocchi più rilevanti per la ricerca (SearchHit, dal più rilevante).
+        """
+        self.refresh()
+        start = time.perf_counter()
+        with get_tracer().span("index.search", k=k) as span, self._lock:
+            count = len(self._chunks)
+            average = self._total_length / count if count else 0.0
+            scores = {}
+            for term in dict.fromkeys(terms(query)):
+                for indexed, weight in self._expand(term).items():
+                    postings = self._postings[indexed]
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for chunk_id, frequency in postings.items():
+                        length = self._chunks[chunk_id][5]
+                        tf = frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average))
+                        scores[chunk_id] = scores.get(chunk_id, 0.0) + weight * idf * tf
+            best = sorted(scores, key=lambda chunk_id: (-scores[chunk_id], chunk_id))[:max(1, k)]
+            hits = []
+            for chunk_id in best:
+                path, first, last, symbol = self._chunks[chunk_id][:4]
+                hits.append(SearchHit(path, first, last, symbol, round(scores[chunk_id], 4),
+                                      self._source(path, first, last, SNIPPET_LINES)))
+            span.set(candidates=len(scores), hits=len(hits))
+            self._stats["queries"] += 1
+            self._stats["query_seconds"] += time.perf_counter() - start
+        return hits
+
+    def symbol(self, name: str) -> list:
+        """
+        Definizioni di name, nome semplice (cancel) o qualificato
+        (ReservationManager.cancel): [(Symbol, sorgente)].
+        """
+        self.refresh()
+        start = time.perf_counter()
+        with get_tracer().span("index.symbol", symbol=name) as span, self._lock:
+            symbols = sorted(self._symbols.get(name.strip(), ()), key=lambda symbol: (symbol.path, symbol.start))
+            found = [(symbol, self._source(symbol.path, symbol.start, symbol.end, SYMBOL_LINES))
+                     for symbol in symbols]
+            span.set(found=len(found))
+            self._stats["queries"] += 1
+            self._stats["query_seconds"] += time.perf_counter() - start
+        return found
+
+    def _source(self, path: str, start: int, end: int, limit: int) -> str:
+        lines = self._files[path]["lines"][start - 1:end]
+        if len(lines) > limit:
+            lines = lines[:limit] + [f"... ({len(lines) - limit} righe omesse)"]
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        """
+        Dimensione dell'indice e tempi: costruzione, aggiornamenti e ricerche
+        (totali e medie in secondi).
+        """
+        with self._lock:
+            stats = dict(self._stats, files=len(self._files), chunks=len(self._chunks), terms=len(self._postings))
+        for name, count in (("update", "updates"), ("refresh", "refreshes"), ("query", "queries")):
+            stats[f"{name}_seconds_avg"] = stats[f"{name}_seconds"] / stats[count] if stats[count] else 0.0
+        return stats
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def default_index() -> CodeIndex:
+    """
+    Indice condiviso dal processo, sulla cartella CODE_INDEX_ROOT (default: la
+    cartella corrente, dove i tool di MAS scrivono i file).
+    """
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = CodeIndex(os.environ.get("CODE_INDEX_ROOT", "."))
+        return _default_index
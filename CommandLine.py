@@ -0,0 +1,142 @@
+"""
+Punto di ingresso a riga di comando dei due orchestratori (comando "mas",
+installato con pip install .):
+
+    mas chat [--stream] [--session ID] [--headless]
+        conversazione con il Triage Agent di MAS.py;
+    mas build "descrizione del progetto" [--root DIR] [--structured] [--headless]
+        generazione di un progetto con il SupervisorAgent di AgentDeveloper.py;
+    mas serve ... / mas batch ... / mas test ...
+        il server di Sessions.py, i batch di Batch.py e i test in shard
+        paralleli di TestRunner.py, con le loro opzioni.
+
+I moduli degli orchestratori (e l'SDK openai) vengono importati solo dal
+sottocomando che li usa: "mas --help" e i worker non ne pagano il costo.
+
+In modalità headless non c'è nessun prompt e stdout contiene solo righe JSON:
+  - chat: ogni riga di stdin è un messaggio; per ogni turno
+        {"type": "reply", "agent": "...", "content": "..."}
+    (preceduta dagli eventi {"type": "token", ...} con --stream);
+  - build: i messaggi di avanzamento vanno su stderr e al termine viene scritto
+        {"root": "...", "files": [...], "folders": {...}, "repairs": {...}}.
+"""
+import argparse
+import contextlib
+import json
+import sys
+
+
+def _emit(payload: dict, stream=None) -> None:
+    print(json.dumps(payload, ensure_ascii=False), file=stream or sys.stdout, flush=True)
+
+
+def chat(args) -> int:
+    import MAS
+
+    if not args.headless:
+        MAS.run_interaction_loop(stream=args.stream, session_id=args.session)
+        return 0
+
+    from ConversationStore import SessionMemories, default_store
+    from Routing import default_policy
+
+    agent, memories, store = MAS.triage_agent, None, None
+    if args.session:
+        store = default_store()
+        memories = SessionMemories(store, args.session)
+        agent = MAS.find_agent(store.agent(args.session) or "") or agent
+    output = sys.stdout
+    # le stampe dei tool vanno su stderr: stdout resta JSON
+    with MAS.memory_scope(memories), contextlib.redirect_stdout(sys.stderr):
+        for line in sys.stdin:
+            message = line.strip()
+            if not message:
+                continue
+            reply = None
+            for event in MAS.iter_full_turn(agent, message, stream=args.stream):
+                if event["type"] == "token":
+                    _emit({"type": "token", "agent": event["agent"], "content": event["content"]}, output)
+                elif event["type"] == "message" and event["message"].content:
+                    reply = event["message"].content
+                elif event["type"] == "done":
+                    agent = event["response"].agent
+                    if store is not None:
+                        store.end_turn(args.session, agent.name)
+                    _emit({"type": "reply", "agent": agent.name, "content": reply}, output)
+    default_policy().stats.save()
+    return 0
+
+
+def build(args) -> int:
+    from AgentDeveloper import SupervisorAgent
+
+    supervisor = SupervisorAgent(max_workers=args.max_workers, stream=args.stream and not args.headless,
+                                 root_folder=args.root, repair_candidates=args.repair_candidates,
+                                 repair_rounds=args.repair_rounds, structured=args.structured)
+    output = sys.stderr if args.headless else sys.stdout
+    with supervisor, contextlib.redirect_stdout(output):
+        result = supervisor.manage_project(args.description)
+    if result is None:
+        print("Generazione non riuscita: architettura non valida.", file=sys.stderr)
+        return 1
+    if args.headless:
+        _emit({
+            "root": supervisor.root_folder,
+            "files": sorted(supervisor.project_context["files"]),
+            "folders": result["folders"],
+            "repairs": supervisor.repair_stats,
+        })
+    return 0
+
+
+def serve(args) -> int:
+    import Sessions
+    Sessions.main(args.options)
+    return 0
+
+
+def batch(args) -> int:
+    import Batch
+    Batch.main(args.options)
+    return 0
+
+
+def test(args) -> int:
+    import TestRunner
+    return TestRunner.main(args.options)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="mas", description="Sistema multi-agente per lo sviluppo di progetti.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    chat_parser = commands.add_parser("chat", help="conversazione con il Triage Agent")
+    chat_parser.add_argument("--stream", action="store_true", help="risposte token per token")
+    chat_parser.add_argument("--session", help="id della conversazione da salvare e riprendere")
+    chat_parser.add_argument("--headless", action="store_true", help="messaggi da stdin, risposte JSON su stdout")
+    chat_parser.set_defaults(handler=chat)
+
+    build_parser = commands.add_parser("build", help="genera un progetto da una descrizione")
+    build_parser.add_argument("description", help="descrizione del progetto")
+    build_parser.add_argument("--root", default="root", help="cartella del progetto")
+    build_parser.add_argument("--max-workers", type=int, default=4)
+    build_parser.add_argument("--repair-candidates", type=int, default=3)
+    build_parser.add_argument("--repair-rounds", type=int, default=2)
+    build_parser.add_argument("--stream", action="store_true", help="mostra l'architettura mentre arriva")
+    build_parser.add_argument("--structured", action="store_true", help="architettura come documento JSON validato")
+    build_parser.add_argument("--headless", action="store_true", help="avanzamento su stderr, risultato JSON su stdout")
+    build_parser.set_defaults(handler=build)
+
+    for name, handler, help_text in (("serve", serve, "server di conversazioni (Sessions.py)"),
+                                     ("batch", batch, "generazione di molti progetti (Batch.py)"),
+                                     ("test", test, "test di un progetto generato (TestRunner.py)")):
+        passthrough = commands.add_parser(name, help=help_text, add_help=False)
+        passthrough.add_argument("options", nargs=argparse.REMAINDER)
+        passthrough.set_defaults(handler=handler)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+Compattazione della memoria degli agenti di MAS.py con un budget di token.
+
+Ogni Agent può avere una CompactionPolicy. Prima di ogni chiamata al modello
+si contano i token della memoria:
+  - oltre trigger * max_tokens, la parte vecchia della conversazione viene
+    riassunta in background (un thread, richiesta con priorità "bulk") e il
+    riassunto sostituisce quella parte alla chiamata successiva;
+  - oltre max_tokens, la compattazione avviene subito, prima della chiamata.
+Restano sempre invariati i messaggi di sistema iniziali, gli ultimi keep_turns
+turni (un turno inizia con un messaggio "user") e le chiamate a tool le cui
+risposte sono nella parte conservata. Con summarize=False, o se il riassunto
+fallisce, la parte vecchia viene scartata.
+
+I riassunti in background sono indicizzati per lista della memoria ma non la
+trattengono: un job conserva solo un riferimento debole (dove la lista lo
+ammette, es. ConversationStore.StoredMemory) e il messaggio di confine; la
+tabella ha al più max_jobs voci e i job conclusi scadono dopo job_ttl secondi,
+così le sessioni chiuse o rimosse (vedi discard) non restano in memoria.
+
+Ogni compattazione apre uno span "memory.compact" (agente, token prima e dopo,
+messaggi rimossi, modalità), viene registrata nel log e in Compactor.events.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from pydantic import BaseModel
+
+from Architecture import count_tokens
+from Scheduler import priority_scope
+from Tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Riepilogo della conversazione precedente:"
+MESSAGE_OVERHEAD = 4  # token di formattazione per messaggio
+
+
+class CompactionPolicy(BaseModel):
+    max_tokens: int = 8000            # budget della memoria dell'agente
+    trigger: float = 0.75             # frazione del budget oltre cui si riassume in background
+    keep_turns: int = 4               # ultimi turni conservati alla lettera
+    summarize: bool = True            # False: la parte vecchia viene scartata
+    summary_model: str = "gpt-4o-mini"
+    summary_tokens: int = 400         # lunghezza massima del riassunto
+
+
+def _field(message, name):
+    return message.get(name) if isinstance(message, dict) else getattr(message, name, None)
+
+
+def _tool_calls(message) -> list:
+    calls = _field(message, "tool_calls") or []
+    return [call if isinstance(call, dict) else call.model_dump() for call in calls]
+
+
+def message_tokens(message) -> int:
+    """
+    Token di un messaggio (dict o oggetto dell'SDK): contenuto, nomi e argomenti dei tool.
+    """
+    text = _field(message, "content") or ""
+    for call in _tool_calls(message):
+        text += call["function"]["name"] + call["function"]["arguments"]
+    return count_tokens(text) + MESSAGE_OVERHEAD
+
+
+def _is_summary(message) -> bool:
+    return _field(message, "role") == "system" and (_field(message, "content") or "").startswith(SUMMARY_PREFIX)
+
+
+def split_point(memory: list, keep_turns: int):
+    """
+    (numero di messaggi di sistema iniziali, indice da cui la memoria va conservata).
+    La parte da compattare è memory[pinned:cut]; se è vuota, cut == pinned.
+    """
+    pinned = 0
+    while pinned < len(memory) and _field(memory[pinned], "role") == "system" and not _is_summary(memory[pinned]):
+        pinned += 1
+    user_indexes = [i for i in range(pinned, len(memory)) if _field(memory[i], "role") == "user"]
+    if len(user_indexes) <= keep_turns:
+        return pinned, pinned
+    cut = user_indexes[-keep_turns] if keep_turns > 0 else len(memory)
+    # Le chiamate a tool con risposte nella parte conservata restano con le loro risposte
+    answered = {_field(m, "tool_call_id") for m in memory[cut:] if _field(m, "role") == "tool"}
+    for i in range(cut - 1, pinned - 1, -1):
+        if any(call["id"] in answered for call in _tool_calls(memory[i])):
+            cut = i
+    return pinned, max(cut, pinned)
+
+
+def transcript(messages: list) -> str:
+    lines = []
+    for message in messages:
+        content = _field(message, "content") or ""
+        calls = ", ".join(f"{call['function']['name']}({call['function']['arguments']})" for call in _tool_calls(message))
+        lines.append(f"{_field(message, 'role')}: {content}" + (f" [tool: {calls}]" if calls else ""))
+    return "\n".join(lines)
+
+
+class _Job:
+    def __init__(self, memory: list, pinned: int, cut: int, future):
+        try:
+            self.memory = weakref.ref(memory)
+        except TypeError:  # list semplice: resta il controllo sul messaggio di confine
+            self.memory = None
+        self.pinned = pinned
+        self.cut = cut
+        self.last = memory[cut - 1]
+        self.future = future
+        self.created = time.monotonic()
+
+    def belongs_to(self, memory: list) -> bool:
+        if self.memory is not None and self.memory() is not memory:
+            return False
+        return len(memory) >= self.cut and memory[self.cut - 1] is self.last
+
+    def expired(self, now: float, ttl: float) -> bool:
+        if self.memory is not None and self.memory() is None:
+            return True  # memoria già liberata
+        return self.future.done() and now - self.created > ttl
+
+
+class Compactor:
+    """
+    Applica le CompactionPolicy; llm è il CompletionLayer usato per i riassunti.
+    max_jobs e job_ttl limitano i riassunti in background conservati.
+    """
+    def __init__(self, llm, max_events: int = 1000, max_jobs: int = 1024, job_ttl: float = 600):
+        self.llm = llm
+        self.events = deque(maxlen=max_events)
+        self.max_jobs = max_jobs
+        self.job_ttl = job_ttl
+        self._jobs = OrderedDict()  # id(lista della memoria) -> _Job, dal più vecchio
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="compaction")
+            return self._pool.submit(contextvars.copy_context().run, fn, *args)
+
+    def summarize(self, policy: CompactionPolicy, messages: list) -> str:
+        """
+        Riassunto della parte vecchia della conversazione, oppure None se non è possibile.
+        """
+        if not policy.summarize:
+            return None
+        try:
+            with priority_scope("bulk"):
+                response = self.llm.create(
+                    model=policy.summary_model,
+                    max_tokens=policy.summary_tokens,
+                    messages=[
+                        {"role": "system", "content": (
+                            "Riassumi in modo conciso la conversazione seguente tra un utente e un sistema "
+                            "multi-agente: richieste, decisioni, file e risultati dei tool ancora rilevanti."
+                        )},
+                        {"role": "user", "content": transcript(messages)},
+                    ],
+                )
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.warning("Riassunto della memoria non riuscito: %s", e)
+            return None
+
+    def discard(self, memory: list) -> None:
+        """
+        Dimentica il riassunto in background della memoria (es. sessione chiusa).
+        """
+        with self._lock:
+            self._jobs.pop(id(memory), None)
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, job in self._jobs.items() if job.expired(now, self.job_ttl)]:
+                del self._jobs[key]
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+    def compact(self, agent_name: str, policy: CompactionPolicy, memory: list) -> Optional[list]:
+        """
+        Nuova memoria compattata, oppure None se la memoria resta com'è.
+        """
+        self._prune()
+        job = self._jobs.get(id(memory))
+        if job is not None and not job.belongs_to(memory):
+            # un'altra lista con lo stesso id, o una memoria sostituita: il riassunto non vale
+            self.discard(memory)
+            job = None
+        if job is not None and job.future.done():
+            # la memoria nel frattempo è solo cresciuta in coda: il riassunto vale ancora
+            self.discard(memory)
+            return self._apply(agent_name, memory, job.pinned, job.cut, job.future.result(), background=True)
+
+        tokens = sum(message_tokens(message) for message in memory)
+        if tokens <= policy.trigger * policy.max_tokens:
+            return None
+        pinned, cut = split_point(memory, policy.keep_turns)
+        if cut == pinned:
+            return None
+        if tokens > policy.max_tokens:
+            if job is not None:
+                self.discard(memory)
+            summary = self.summarize(policy, memory[pinned:cut])
+            return self._apply(agent_name, memory, pinned, cut, summary, background=False, tokens=tokens)
+        if job is None:
+            future = self._submit(self.summarize, policy, list(memory[pinned:cut]))
+            with self._lock:
+                self._jobs[id(memory)] = _Job(memory, pinned, cut, future)
+        return None
+
+    def _apply(self, agent_name, memory, pinned, cut, summary, background, tokens=None) -> list:
+        compacted = list(memory[:pinned])
+        if summary:
+            compacted.append({"role": "system", "content": f"{SUMMARY_PREFIX}\n{summary}"})
+        compacted.extend(memory[cut:])
+        before = tokens if tokens is not None else sum(message_tokens(message) for message in memory)
+        after = sum(message_tokens(message) for message in compacted)
+        event = {
+            "agent": agent_name, "mode": "summary" if summary else "drop", "background": background,
+            "removed_messages": cut - pinned, "tokens_before": before, "tokens_after": after,
+        }
+        with get_tracer().span("memory.compact", **event):
+            self.events.append(event)
+        logger.info("Memoria di %s compattata: %s", agent_name, json.dumps(event))
+        return compacted
@@ -0,0 +1,545 @@
+"""
+Livello di completamento condiviso da MAS.py e AgentDeveloper.py.
+
+Tutte le chiamate a chat.completions.create passano da CompletionLayer.create,
+che può servire le risposte da una cache indicizzata per contenuto: la chiave è
+l'hash di (modello, messaggi, tool, parametri di campionamento). Le richieste
+che arrivano al client passano dallo scheduler condiviso (vedi Scheduler.py):
+limiti per modello, priorità e ripetizioni con backoff.
+
+L'SDK openai viene importato e il client costruito solo alla prima richiesta:
+importare i moduli degli agenti (test, strumenti, worker) resta leggero.
+
+La cache ha due livelli:
+  - in memoria (LRU, numero massimo di voci);
+  - su disco (SQLite), con limite di dimensione e scadenza (TTL).
+
+Modalità (parametro mode o variabile d'ambiente LLM_CACHE_MODE):
+  - "off":    nessuna cache, le richieste vanno direttamente al client;
+  - "record": legge dalla cache e registra le risposte mancanti;
+  - "replay": usa solo la cache e solleva ReplayMiss se una risposta manca,
+              così una pipeline registrata può essere rieseguita offline.
+
+Uno stream viene registrato solo se arriva a un finish_reason. Gli stream
+chiusi prima, dentro partial_scope (request_code smette di leggere a fine
+blocco di codice), sono registrati sotto una chiave a parte, riproposta solo
+alle richieste in streaming fatte dentro partial_scope.
+"""
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from Scheduler import RequestScheduler, default_scheduler, pooled_async_http_client, pooled_http_client
+from Streaming import StreamAccumulator
+from Tracing import get_tracer, record_usage
+
+MODES = ("off", "record", "replay")
+
+# Parametri che non cambiano il contenuto della risposta
+_UNCACHED_PARAMS = {"stream", "stream_options", "timeout", "extra_headers", "extra_query", "extra_body", "user"}
+
+_accept_partial = contextvars.ContextVar("llm_accept_partial", default=False)
+
+
+class ReplayMiss(LookupError):
+    """
+    Risposta assente dalla cache in modalità "replay".
+    """
+
+
+def _to_json(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    return str(value)
+
+
+def cache_key(params: dict) -> str:
+    """
+    Hash stabile dei parametri di una richiesta (i messaggi possono contenere
+    oggetti dell'SDK, che vengono serializzati con model_dump).
+    """
+    payload = {k: v for k, v in params.items() if k not in _UNCACHED_PARAMS and v is not None}
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=_to_json)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def partial_key(key: str) -> str:
+    """
+    Chiave delle risposte parziali (stream chiusi prima del finish_reason).
+    """
+    return f"{key}:partial"
+
+
+class partial_scope:
+    """
+    Context manager: gli stream aperti nel blocco e chiusi prima della fine
+    vengono registrati come risposte parziali, e le richieste in streaming del
+    blocco possono essere servite da una risposta parziale registrata.
+    """
+    def __init__(self):
+        self._token = None
+
+    def __enter__(self):
+        self._token = _accept_partial.set(True)
+        return self
+
+    def __exit__(self, *exc):
+        _accept_partial.reset(self._token)
+        return False
+
+
+class CompletionCache:
+    """
+    Cache a due livelli: LRU in memoria davanti a un archivio SQLite.
+    path=None disattiva il livello su disco.
+    """
+    def __init__(self, path=None, max_entries: int = 256, max_bytes: int = 256 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            if self._db is None:
+                return None
+            row = self._db.execute("SELECT value, created FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            now = time.time()
+            if self.ttl is not None and now - created > self.ttl:
+                self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE completions SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, value)
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._remember(key, value)
+            if self._db is None:
+                return
+            now = time.time()
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now):
+        """
+        Elimina le voci scadute e, se serve, le meno usate di recente
+        finché l'archivio non rientra in max_bytes.
+        """
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM completions WHERE created < ?", (now - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM completions ORDER BY accessed").fetchall():
+            self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache() -> CompletionCache:
+    """
+    Cache condivisa dal processo, su disco in LLM_CACHE_DIR (default .llm_cache).
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            directory = os.environ.get("LLM_CACHE_DIR", ".llm_cache")
+            ttl = os.environ.get("LLM_CACHE_TTL")
+            _default_cache = CompletionCache(
+                path=os.path.join(directory, "completions.sqlite"),
+                ttl=float(ttl) if ttl else None,
+            )
+        return _default_cache
+
+
+def default_client():
+    """
+    Client OpenAI sincrono sul trasporto condiviso (chiave e base_url dalle
+    variabili d'ambiente OPENAI_*); le ripetizioni sono gestite dallo scheduler.
+    """
+    from openai import OpenAI
+    return OpenAI(http_client=pooled_http_client(), max_retries=0)
+
+
+def _completion_types():
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+    return ChatCompletion, ChatCompletionChunk
+
+
+class _ReplayStream:
+    """
+    Ripropone una risposta in cache come stream di chunk, per i chiamanti
+    che hanno chiesto stream=True (iterabile sia con for sia con async for).
+    """
+    def __init__(self, completion):
+        self._completion = completion
+
+    def _chunks(self):
+        completion = self._completion
+        message = completion.choices[0].message
+        delta = {"role": "assistant"}
+        if message.content:
+            delta["content"] = message.content
+        if message.tool_calls:
+            delta["tool_calls"] = [
+                {"index": i, **tool_call.model_dump(exclude_none=True)}
+                for i, tool_call in enumerate(message.tool_calls)
+            ]
+        yield _completion_types()[1].model_validate({
+            "id": completion.id,
+            "object": "chat.completion.chunk",
+            "created": completion.created,
+            "model": completion.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": completion.choices[0].finish_reason}],
+        })
+
+    def __iter__(self):
+        return self._chunks()
+
+    async def __aiter__(self):
+        for chunk in self._chunks():
+            yield chunk
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+class _RecordingStream:
+    """
+    Inoltra uno stream reale e registra la risposta ricostruita con on_complete
+    quando lo stream arriva a un finish_reason. Se il chiamante lo chiude prima
+    dopo aver ricevuto del contenuto, la risposta parziale va a on_partial (se
+    dato), con finish_reason "stop". Uno stream interrotto da un errore non
+    viene registrato.
+    """
+    def __init__(self, stream, on_complete, on_partial=None):
+        self._stream = stream
+        self._on_complete = on_complete
+        self._on_partial = on_partial
+        self._accumulator = StreamAccumulator()
+        self._first = None
+        self._recorded = False
+
+    def _feed(self, chunk):
+        if self._first is None:
+            self._first = chunk
+        self._accumulator.feed(chunk)
+
+    def _complete(self):
+        first, accumulator = self._first, self._accumulator
+        if first is None or self._recorded:
+            return
+        self._recorded = True
+        record = self._on_complete if accumulator.finish_reason else self._on_partial
+        if record is None:
+            return
+        record(_completion_types()[0].model_validate({
+            "id": first.id,
+            "object": "chat.completion",
+            "created": first.created,
+            "model": first.model,
+            "choices": [{
+                "index": 0,
+                "finish_reason": accumulator.finish_reason or "stop",
+                "message": accumulator.message().model_dump(exclude_none=True),
+            }],
+        }))
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                self._feed(chunk)
+                yield chunk
+        except GeneratorExit:  # il chiamante ha smesso di leggere
+            self._complete()
+            raise
+        self._complete()
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                self._feed(chunk)
+                yield chunk
+        except GeneratorExit:
+            self._complete()
+            raise
+        self._complete()
+
+    def close(self):
+        self._complete()
+        self._stream.close()
+
+    async def aclose(self):
+        self._complete()
+        await self._stream.close()
+
+
+class _TracedStream:
+    """
+    Inoltra uno stream e chiude lo span della chiamata quando lo stream finisce
+    (o viene chiuso), annotando tempo al primo chunk e token dell'ultimo chunk.
+    """
+    def __init__(self, stream, tracer, span):
+        self._stream = stream
+        self._tracer = tracer
+        self._span = span
+
+    def _observe(self, chunk):
+        if "first_chunk_ms" not in self._span.attributes:
+            self._span.set(first_chunk_ms=round(self._span.duration * 1000, 1))
+        record_usage(self._span, getattr(chunk, "usage", None))
+
+    def __iter__(self):
+        error = None
+        try:
+            for chunk in self._stream:
+                self._observe(chunk)
+                yield chunk
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            self._tracer.finish(self._span, error)
+
+    async def __aiter__(self):
+        error = None
+        try:
+            async for chunk in self._stream:
+                self._observe(chunk)
+                yield chunk
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            self._tracer.finish(self._span, error)
+
+    def close(self):
+        self._stream.close()
+        self._tracer.finish(self._span)
+
+    async def aclose(self):
+        close = getattr(self._stream, "aclose", None) or self._stream.close
+        await close()
+        self._tracer.finish(self._span)
+
+
+class CompletionLayer:
+    """
+    Sostituto di client.chat.completions.create con cache e record/replay.
+    acreate è la variante asincrona, con la stessa cache; se async_client non
+    è dato viene ricavato da client (stessa chiave, base_url e timeout), sul
+    trasporto keep-alive condiviso dell'event loop (Scheduler.pooled_async_http_client).
+    Senza client viene usato default_client(), creato alla prima richiesta.
+    scheduler (default: Scheduler.default_scheduler()) regola l'invio delle richieste.
+    """
+    def __init__(self, client=None, cache: CompletionCache = None, mode: str = None, async_client=None,
+                 scheduler: RequestScheduler = None):
+        self._client = client
+        self.mode = mode or os.environ.get("LLM_CACHE_MODE", "off")
+        if self.mode not in MODES:
+            raise ValueError(f"Modalità cache non valida: {self.mode} (attese: {', '.join(MODES)})")
+        self._cache = cache
+        self._async_client = async_client
+        self._async_client_for = client if async_client is not None else None
+        self._async_http_client = None  # trasporto condiviso del client asincrono ricavato
+        self._scheduler = scheduler
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = default_client()
+        return self._client
+
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
+
+    @property
+    def cache(self) -> CompletionCache:
+        if self._cache is None:
+            self._cache = default_cache()
+        return self._cache
+
+    @property
+    def scheduler(self) -> RequestScheduler:
+        if self._scheduler is None:
+            self._scheduler = default_scheduler()
+        return self._scheduler
+
+    @property
+    def async_client(self):
+        # usato dentro l'event loop; ricreato se nel frattempo client è stato
+        # sostituito o se il loop (e quindi il trasporto condiviso) è cambiato
+        if self._async_client is not None and self._async_client_for is self.client \
+                and self._async_http_client is None:
+            return self._async_client  # client asincrono fornito dal chiamante
+        http_client = pooled_async_http_client()
+        if self._async_client is None or self._async_client_for is not self.client \
+                or self._async_http_client is not http_client:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(
+                api_key=self.client.api_key,
+                organization=self.client.organization,
+                base_url=self.client.base_url,
+                timeout=self.client.timeout,
+                max_retries=self.client.max_retries,
+                http_client=http_client,
+            )
+            self._async_client_for = self.client
+            self._async_http_client = http_client
+        return self._async_client
+
+    def create(self, **params):
+        tracer = get_tracer()
+        if not params.get("stream"):
+            with tracer.span("llm.call", model=params.get("model"), stream=False) as span:
+                response = self._create(span, params)
+                record_usage(span, getattr(response, "usage", None))
+                return response
+
+        span = self._start_stream_span(tracer, params)
+        try:
+            stream = self._create(span, params)
+        except Exception as exc:
+            tracer.finish(span, exc)
+            raise
+        return _TracedStream(stream, tracer, span) if tracer.enabled else stream
+
+    async def acreate(self, **params):
+        tracer = get_tracer()
+        if not params.get("stream"):
+            with tracer.span("llm.call", model=params.get("model"), stream=False) as span:
+                response = await self._acreate(span, params)
+                record_usage(span, getattr(response, "usage", None))
+                return response
+
+        span = self._start_stream_span(tracer, params)
+        try:
+            stream = await self._acreate(span, params)
+        except Exception as exc:
+            tracer.finish(span, exc)
+            raise
+        return _TracedStream(stream, tracer, span) if tracer.enabled else stream
+
+    def lookup(self, params: dict):
+        """
+        Risposta registrata per params (ChatCompletion) oppure None, senza
+        chiamare il client: serve a chi invia le richieste per altre vie (es. i
+        batch di Batch.py) per non ripetere quelle già in cache.
+        """
+        if self.mode == "off":
+            return None
+        cached = self.cache.get(cache_key(params))
+        if cached is not None:
+            self.hits += 1
+            return _completion_types()[0].model_validate_json(cached)
+        return None
+
+    def remember(self, params: dict, response) -> None:
+        """
+        Registra in cache una risposta ottenuta fuori da create (es. da un batch).
+        """
+        if self.mode != "off":
+            self.misses += 1
+            self.cache.put(cache_key(params), response.model_dump_json())
+
+    @staticmethod
+    def _start_stream_span(tracer, params: dict):
+        if tracer.enabled:
+            # l'ultimo chunk riporta i token usati
+            params.setdefault("stream_options", {"include_usage": True})
+        return tracer.start_span("llm.call", model=params.get("model"), stream=True)
+
+    def _create(self, span, params: dict):
+        key, cached = self._lookup(span, params)
+        if cached is not None:
+            return cached
+        return self._store(key, params, self.scheduler.call(self.client.chat.completions.create, params, span))
+
+    async def _acreate(self, span, params: dict):
+        key, cached = self._lookup(span, params)
+        if cached is not None:
+            return cached
+        return self._store(key, params, await self.scheduler.acall(self.async_client.chat.completions.create, params, span))
+
+    def _lookup(self, span, params: dict):
+        """
+        (chiave, risposta in cache o None); chiave None se la cache è spenta.
+        """
+        if self.mode == "off":
+            return None, None
+
+        key = cache_key(params)
+        cached = self.cache.get(key)
+        if cached is None and params.get("stream") and _accept_partial.get():
+            cached = self.cache.get(partial_key(key))
+        if cached is not None:
+            self.hits += 1
+            span.set(cache="hit")
+            completion = _completion_types()[0].model_validate_json(cached)
+            return key, _ReplayStream(completion) if params.get("stream") else completion
+
+        self.misses += 1
+        span.set(cache="miss")
+        if self.mode == "replay":
+            raise ReplayMiss(f"Nessuna risposta registrata per la richiesta {key[:12]} (modello {params.get('model')})")
+        return key, None
+
+    def _store(self, key, params: dict, response):
+        if key is None:
+            return response
+        if params.get("stream"):
+            on_partial = None
+            if _accept_partial.get():
+                def on_partial(completion):
+                    self.cache.put(partial_key(key), completion.model_dump_json())
+            return _RecordingStream(response, lambda completion: self.cache.put(key, completion.model_dump_json()),
+                                    on_partial)
+        self.cache.put(key, response.model_dump_json())
+        return response
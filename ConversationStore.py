@@ -0,0 +1,289 @@
+"""
+Archivio persistente delle conversazioni di MAS.py (SQLite).
+
+Ogni messaggio viene salvato in forma normalizzata e compatta (ruolo,
+contenuto, tool_calls, tool_call_id: niente oggetti dell'SDK né campi vuoti),
+in coda alla memoria del suo agente nella sua sessione: i turni si aggiungono
+senza riscrivere la conversazione. Per ogni sessione viene registrato anche
+l'agente corrente, così una conversazione riprende dopo un riavvio dal punto
+in cui era rimasta.
+
+SessionMemories è il dizionario {nome agente: messaggi} da passare a
+MAS.memory_scope: carica dal disco la memoria di un agente solo quando serve,
+e solo la finestra usata per il prossimo prompt (gli ultimi window messaggi,
+più il messaggio di sistema iniziale), che in RAM non supera quella dimensione.
+
+Percorso di default: variabile d'ambiente CONVERSATION_DB (default
+.sessions/conversations.sqlite).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+DEFAULT_WINDOW = 200
+
+
+def normalize_message(message) -> dict:
+    """
+    Forma compatta di un messaggio (dict o oggetto dell'SDK), accettata dall'API così com'è.
+    """
+    if not isinstance(message, dict):
+        message = message.model_dump(exclude_none=True) if hasattr(message, "model_dump") else dict(vars(message))
+    normalized = {"role": message["role"], "content": message.get("content")}
+    if message.get("tool_calls"):
+        normalized["tool_calls"] = [
+            {
+                "id": call["id"],
+                "type": call.get("type", "function"),
+                "function": {"name": call["function"]["name"], "arguments": call["function"]["arguments"]},
+            }
+            for call in (
+                call if isinstance(call, dict) else call.model_dump() for call in message["tool_calls"]
+            )
+        ]
+    if message.get("tool_call_id"):
+        normalized["tool_call_id"] = message["tool_call_id"]
+    return normalized
+
+
+class ConversationStore:
+    """
+    Sessioni e messaggi su SQLite. ttl (secondi) fa rimuovere da purge() le
+    sessioni non aggiornate da più tempo.
+    """
+    def __init__(self, path: str, ttl: float = None):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, agent TEXT, turns INTEGER NOT NULL DEFAULT 0, "
+            "created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "session TEXT NOT NULL, agent TEXT NOT NULL, seq INTEGER NOT NULL, "
+            "role TEXT NOT NULL, content TEXT, tool_calls TEXT, tool_call_id TEXT, "
+            "PRIMARY KEY (session, agent, seq)) WITHOUT ROWID"
+        )
+        self._db.commit()
+
+    def _touch(self, session_id: str, now: float) -> None:
+        self._db.execute(
+            "INSERT INTO sessions (id, created, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET updated = excluded.updated",
+            (session_id, now, now),
+        )
+
+    def _insert(self, session_id: str, agent: str, first_seq: int, messages: list) -> None:
+        self._db.executemany(
+            "INSERT INTO messages (session, agent, seq, role, content, tool_calls, tool_call_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (session_id, agent, first_seq + i, m["role"], m.get("content"),
+                 json.dumps(m["tool_calls"], ensure_ascii=False, separators=(",", ":")) if m.get("tool_calls") else None,
+                 m.get("tool_call_id"))
+                for i, m in enumerate(messages)
+            ],
+        )
+
+    def append(self, session_id: str, agent: str, messages: list, first_seq: int = None) -> int:
+        """
+        Aggiunge messaggi (già normalizzati) in coda; restituisce il prossimo numero di sequenza.
+        """
+        with self._lock:
+            if first_seq is None:
+                first_seq = self._db.execute(
+                    "SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE session = ? AND agent = ?",
+                    (session_id, agent),
+                ).fetchone()[0]
+            self._touch(session_id, time.time())
+            self._insert(session_id, agent, first_seq, messages)
+            self._db.commit()
+        return first_seq + len(messages)
+
+    def replace(self, session_id: str, agent: str, messages: list) -> int:
+        """
+        Sostituisce la memoria dell'agente nella sessione (es. reset dopo un handoff).
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM messages WHERE session = ? AND agent = ?", (session_id, agent))
+            self._touch(session_id, time.time())
+            self._insert(session_id, agent, 0, messages)
+            self._db.commit()
+        return len(messages)
+
+    def window(self, session_id: str, agent: str, size: int = DEFAULT_WINDOW):
+        """
+        (ultimi size messaggi dell'agente, preceduti dal messaggio di sistema
+        iniziale se c'è, prossimo numero di sequenza).
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, role, content, tool_calls, tool_call_id FROM messages "
+                "WHERE session = ? AND agent = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, agent, size),
+            ).fetchall()[::-1]
+            if rows and rows[0][0] > 0:
+                first = self._db.execute(
+                    "SELECT seq, role, content, tool_calls, tool_call_id FROM messages "
+                    "WHERE session = ? AND agent = ? AND seq = 0 AND role = 'system'",
+                    (session_id, agent),
+                ).fetchone()
+                if first:
+                    rows.insert(0, first)
+        messages = []
+        for seq, role, content, tool_calls, tool_call_id in rows:
+            message = {"role": role, "content": content}
+            if tool_calls:
+                message["tool_calls"] = json.loads(tool_calls)
+            if tool_call_id:
+                message["tool_call_id"] = tool_call_id
+            messages.append(message)
+        return messages, (rows[-1][0] + 1 if rows else 0)
+
+    def agent(self, session_id: str):
+        """
+        Nome dell'agente corrente della sessione, oppure None se la sessione non esiste.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT agent FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is not None
+
+    def end_turn(self, session_id: str, agent: str) -> None:
+        """
+        Registra l'agente a cui tocca il prossimo messaggio della sessione.
+        """
+        with self._lock:
+            now = time.time()
+            self._touch(session_id, now)
+            self._db.execute(
+                "UPDATE sessions SET agent = ?, turns = turns + 1 WHERE id = ?", (agent, session_id)
+            )
+            self._db.commit()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM messages WHERE session = ?", (session_id,))
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.commit()
+
+    def purge(self, now: float = None) -> int:
+        """
+        Rimuove le sessioni non aggiornate da più di ttl secondi; restituisce quante.
+        """
+        if self.ttl is None:
+            return 0
+        cutoff = (now or time.time()) - self.ttl
+        with self._lock:
+            expired = [row[0] for row in self._db.execute("SELECT id FROM sessions WHERE updated < ?", (cutoff,))]
+            for session_id in expired:
+                self._db.execute("DELETE FROM messages WHERE session = ?", (session_id,))
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.commit()
+        return len(expired)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class StoredMemory(list):
+    """
+    Memoria di un agente in una sessione: ogni append viene salvato subito
+    nell'archivio e in RAM restano al più window messaggi (oltre a quello di
+    sistema iniziale), senza lasciare risposte di tool senza la loro chiamata.
+    """
+    def __init__(self, store: ConversationStore, session_id: str, agent: str, messages: list,
+                 next_seq: int, window: int = DEFAULT_WINDOW):
+        super().__init__(messages)
+        self._store = store
+        self._session_id = session_id
+        self._agent = agent
+        self._next_seq = next_seq
+        self._window = window
+        self._trim()
+
+    def append(self, message) -> None:
+        message = normalize_message(message)
+        self._next_seq = self._store.append(self._session_id, self._agent, [message], self._next_seq)
+        super().append(message)
+        self._trim()
+
+    def _trim(self) -> None:
+        pinned = 1 if self and self[0]["role"] == "system" else 0
+        excess = len(self) - pinned - self._window
+        if excess > 0:
+            del self[pinned:pinned + excess]
+        while len(self) > pinned and self[pinned]["role"] == "tool":
+            del self[pinned]
+
+
+class SessionMemories(MutableMapping):
+    """
+    {nome agente: StoredMemory} di una sessione, caricate dal disco al primo accesso.
+    Assegnare una lista sostituisce la memoria dell'agente (come MAS.set_memory).
+    """
+    def __init__(self, store: ConversationStore, session_id: str, window: int = DEFAULT_WINDOW):
+        self.store = store
+        self.session_id = session_id
+        self.window = window
+        self._loaded = {}
+
+    def __getitem__(self, agent: str) -> StoredMemory:
+        memory = self._loaded.get(agent)
+        if memory is None:
+            messages, next_seq = self.store.window(self.session_id, agent, self.window)
+            memory = self._loaded[agent] = StoredMemory(
+                self.store, self.session_id, agent, messages, next_seq, self.window
+            )
+        return memory
+
+    def __setitem__(self, agent: str, messages: list) -> None:
+        messages = [normalize_message(message) for message in messages]
+        next_seq = self.store.replace(self.session_id, agent, messages)
+        self._loaded[agent] = StoredMemory(self.store, self.session_id, agent, messages, next_seq, self.window)
+
+    def __delitem__(self, agent: str) -> None:
+        self.store.replace(self.session_id, agent, [])
+        self._loaded.pop(agent, None)
+
+    def __iter__(self):
+        return iter(self._loaded)
+
+    def __len__(self) -> int:
+        return len(self._loaded)
+
+    def setdefault(self, agent: str, default=None) -> StoredMemory:
+        # ogni agente ha sempre una memoria (eventualmente vuota) sul disco
+        return self[agent]
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def default_store() -> ConversationStore:
+    """
+    Archivio condiviso dal processo, in CONVERSATION_DB (TTL opzionale in CONVERSATION_TTL, secondi).
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            ttl = os.environ.get("CONVERSATION_TTL")
+            _default_store = ConversationStore(
+                os.environ.get("CONVERSATION_DB", os.path.join(".sessions", "conversations.sqlite")),
+                ttl=float(ttl) if ttl else None,
+            )
+        return _default_store
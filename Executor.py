@@ -0,0 +1,468 @@
+"""
+Esecuzione isolata dei file Python generati.
+
+WorkerPool mantiene un gruppo di interpreti Python già avviati (e con i moduli
+più comuni già importati). Per ogni esecuzione il worker fa fork di un figlio
+che esegue il file in un modulo __main__ nuovo (come "python file.py"), con limiti
+di tempo reale, CPU e memoria, e stdout/stderr catturati fino a una dimensione
+massima. Un crash o un ciclo infinito del codice generato termina solo il
+figlio: il worker e l'orchestratore proseguono.
+
+Sui sistemi senza fork (Windows) si ripiega su subprocess.run con timeout.
+"""
+import builtins
+import hashlib
+import marshal
+import os
+import pickle
+import queue
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import types
+from dataclasses import asdict, dataclass
+
+from Tracing import get_tracer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Moduli importati una volta nel worker: i figli li ereditano già caricati
+PRELOAD_MODULES = (
+    "abc", "argparse", "collections", "dataclasses", "datetime", "decimal", "enum", "functools",
+    "itertools", "json", "logging", "math", "pathlib", "random", "re", "sqlite3", "typing", "unittest", "uuid",
+)
+
+
+@dataclass
+class ExecutionResult:
+    """
+    Esito di un'esecuzione, con gli stessi campi principali di subprocess.CompletedProcess.
+    """
+    returncode: int
+    stdout: str
+    stderr: str
+    duration: float = 0.0
+    timed_out: bool = False
+    truncated: bool = False
+    cached: bool = False  # bytecode riutilizzato, senza ricompilare
+    cancelled: bool = False  # interrotta su richiesta (vedi WorkerPool.run)
+
+
+def _apply_limits(cpu_seconds, memory_bytes):
+    if resource is None:
+        return
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+
+# Job in corso nel worker, per l'annullamento via SIGUSR1
+_current_child = None
+_cancel_requested = False
+
+
+def _cancel_current(signum, frame):
+    """
+    Handler di SIGUSR1 nel worker: termina il figlio del job in corso
+    (o quello che sta per partire).
+    """
+    global _cancel_requested
+    _cancel_requested = True
+    if _current_child is not None:
+        try:
+            os.killpg(_current_child, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+# Bytecode già compilato nel worker: {sha256(percorso + sorgente): code object}.
+# I figli nati da fork lo ereditano, quindi un file invariato non viene ricompilato.
+_code_cache = {}
+
+
+def _load_code(path, cache_dir=None):
+    """
+    Restituisce (code object, True se preso dalla cache). La cache su disco
+    (marshal, una voce per hash) è condivisa tra i worker.
+    """
+    with open(path, "rb") as f:
+        source = f.read()
+    key = hashlib.sha256(path.encode("utf-8") + b"\0" + source).hexdigest()
+    if key in _code_cache:
+        return _code_cache[key], True
+    cache_file = os.path.join(cache_dir, f"{key}.{sys.implementation.cache_tag}") if cache_dir else None
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, "rb") as f:
+                code = marshal.load(f)
+            _code_cache[key] = code
+            return code, True
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+    code = compile(source, path, "exec", dont_inherit=True)
+    _code_cache[key] = code
+    if cache_file:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(temp_file, "wb") as f:
+                marshal.dump(code, f)
+            os.replace(temp_file, cache_file)
+        except OSError:
+            pass
+    return code, False
+
+
+def _run_child(path, code, cwd, out_w, err_w, cpu_seconds, memory_bytes):
+    """
+    Corpo del processo figlio: non ritorna mai.
+    """
+    exit_code = 1
+    try:
+        os.setsid()  # gruppo di processi proprio, per poter terminare anche i nipoti
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        _apply_limits(cpu_seconds, memory_bytes)
+        if cwd:
+            os.chdir(cwd)
+        sys.argv = [path]
+        sys.path[0] = os.path.dirname(os.path.abspath(path))
+        # Modulo __main__ nuovo, come con "python file.py": unittest.main(), pickle
+        # e gli import di __main__ devono vedere il file eseguito, non il worker
+        module = types.ModuleType("__main__")
+        module.__file__ = path
+        module.__builtins__ = builtins
+        module.__cached__ = None
+        sys.modules["__main__"] = module
+        exec(code, module.__dict__)
+        exit_code = 0
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException as e:
+        # Nascondiamo i frame dell'executor: il traceback parte dal file eseguito
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != path:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+
+def _fork_and_run(job):
+    """
+    Eseguito nel worker: fork del figlio, raccolta dell'output e attesa con timeout.
+    """
+    global _current_child
+    path, cwd = job["path"], job["cwd"]
+    timeout, max_output = job["timeout"], job["max_output"]
+    start = time.monotonic()
+    try:
+        code, cached = _load_code(path, job.get("cache_dir"))
+    except (OSError, SyntaxError, ValueError) as e:
+        # Errori di lettura o di sintassi: nessun bisogno di avviare un processo
+        return ExecutionResult(
+            returncode=1, stdout="", stderr="".join(traceback.format_exception_only(type(e), e)),
+            duration=time.monotonic() - start,
+        )
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.close(out_r)
+        os.close(err_r)
+        _run_child(path, code, cwd, out_w, err_w, job["cpu_seconds"], job["memory_bytes"])
+    _current_child = pid
+    if _cancel_requested:  # annullamento arrivato prima del fork
+        _cancel_current(signal.SIGUSR1, None)
+    os.close(out_w)
+    os.close(err_w)
+
+    deadline = start + timeout
+    buffers = {out_r: bytearray(), err_r: bytearray()}
+    open_fds = [out_r, err_r]
+    timed_out = truncated = False
+    status = None
+    while open_fds:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        ready, _, _ = select.select(open_fds, [], [], remaining)
+        for fd in ready:
+            data = os.read(fd, 65536)
+            if not data:
+                open_fds.remove(fd)
+                continue
+            buffer = buffers[fd]
+            room = max_output - len(buffer)
+            if len(data) > room:
+                truncated = True
+            buffer.extend(data[:max(room, 0)])
+
+    while status is None:
+        finished, status_code = os.waitpid(pid, os.WNOHANG)
+        if finished:
+            status = status_code
+        elif timed_out or time.monotonic() >= deadline:
+            timed_out = True
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            status = os.waitpid(pid, 0)[1]
+        else:
+            time.sleep(0.001)
+    _current_child = None
+    for fd in (out_r, err_r):
+        os.close(fd)
+
+    returncode = os.waitstatus_to_exitcode(status)
+    stderr = buffers[err_r].decode("utf-8", errors="replace")
+    if _cancel_requested:
+        stderr += "\n[ANNULLATO] Esecuzione interrotta su richiesta."
+    elif timed_out:
+        stderr += f"\n[TIMEOUT] Esecuzione interrotta dopo {timeout} secondi."
+    elif returncode < 0:
+        stderr += f"\n[CRASH] Processo terminato dal segnale {signal.Signals(-returncode).name}."
+    if truncated:
+        stderr += f"\n[OUTPUT TRONCATO] Oltre {max_output} byte."
+    return ExecutionResult(
+        returncode=returncode,
+        stdout=buffers[out_r].decode("utf-8", errors="replace"),
+        stderr=stderr,
+        duration=time.monotonic() - start,
+        timed_out=timed_out,
+        truncated=truncated,
+        cached=cached,
+        cancelled=_cancel_requested,
+    )
+
+
+def _worker_main():
+    """
+    Ciclo del worker, avviato come "python Executor.py --worker": riceve i job
+    (pickle) su stdin e risponde su stdout. I descrittori originali vengono
+    sostituiti subito, così nulla di ciò che il worker stampa finisce nel protocollo.
+    """
+    requests = os.fdopen(os.dup(0), "rb")
+    replies = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C è gestito dall'orchestratore
+    signal.signal(signal.SIGUSR1, _cancel_current)
+    for module in sys.argv[2:]:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+    global _cancel_requested
+    while True:
+        try:
+            job = pickle.load(requests)
+        except EOFError:
+            break
+        # un annullamento arrivato in ritardo riguarda il job precedente
+        _cancel_requested = False
+        try:
+            result = _fork_and_run(job)
+        except Exception as e:
+            result = ExecutionResult(returncode=1, stdout="", stderr=f"[ERRORE EXECUTOR] {e}")
+        pickle.dump(asdict(result), replies)
+        replies.flush()
+
+
+class _Worker:
+    def __init__(self, preload):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", *preload],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+
+    def run(self, job, cancel: threading.Event = None) -> ExecutionResult:
+        pickle.dump(job, self.process.stdin)
+        self.process.stdin.flush()
+        if cancel is not None:
+            # Attesa della risposta; con cancel impostato il worker termina il figlio.
+            # Il segnale viene ripetuto: uno arrivato prima che il worker legga il job va perso.
+            while not select.select([self.process.stdout], [], [], 0.01)[0]:
+                if cancel.is_set():
+                    os.kill(self.process.pid, signal.SIGUSR1)
+        return ExecutionResult(**pickle.load(self.process.stdout))
+
+    def stop(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+
+
+class WorkerPool:
+    """
+    Pool di interpreti pronti per eseguire file Python con limiti di risorse.
+    I worker vengono avviati al primo utilizzo e sostituiti se muoiono.
+    Dopo close() il pool non accetta altre esecuzioni: i worker inattivi si
+    fermano subito, quelli occupati appena terminano l'esecuzione in corso.
+    """
+    def __init__(self, size: int = None, timeout: float = 30, cpu_seconds: int = 30,
+                 memory_bytes: int = 1024 * 1024 * 1024, max_output: int = 64 * 1024,
+                 preload=PRELOAD_MODULES, cache_dir: str = None):
+        self.size = size or os.cpu_count() or 1
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.max_output = max_output
+        self.preload = tuple(preload)
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+        self._forking = hasattr(os, "fork")
+        self._idle = queue.Queue()
+        self._started = 0  # worker vivi, inattivi o occupati
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("WorkerPool chiuso")
+                if self._idle.empty() and self._started < self.size:
+                    self._started += 1
+                    return _Worker(self.preload)
+            # attesa a intervalli: nel frattempo un worker può morire (posto libero) o il pool chiudersi
+            try:
+                return self._idle.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def _release(self, worker):
+        with self._lock:
+            if not self._closed:
+                self._idle.put(worker)
+                return
+            self._started -= 1
+        worker.stop()
+
+    def run(self, path: str, cwd: str = None, timeout: float = None,
+            cancel: threading.Event = None) -> ExecutionResult:
+        """
+        Esegue il file come "python path" e ne restituisce l'esito.
+        Se cancel viene impostato durante l'esecuzione, il processo viene
+        terminato e il risultato ha cancelled=True (solo con fork).
+        """
+        with get_tracer().span("code.execute", file=path) as span:
+            result = self._run(path, cwd, timeout or self.timeout, cancel)
+            span.set(returncode=result.returncode, timed_out=result.timed_out, cached=result.cached,
+                     cancelled=result.cancelled)
+            return result
+
+    def _run(self, path, cwd, timeout, cancel):
+        if not self._forking:
+            return self._run_subprocess(path, cwd, timeout)
+        job = {
+            "path": os.path.abspath(path),
+            "cwd": cwd,
+            "timeout": timeout,
+            "cpu_seconds": self.cpu_seconds,
+            "memory_bytes": self.memory_bytes,
+            "max_output": self.max_output,
+            "cache_dir": self.cache_dir,
+        }
+        worker = self._acquire()
+        try:
+            result = worker.run(job, cancel)
+        except (OSError, EOFError) as e:
+            # Il worker è morto: lo sostituiamo al prossimo utilizzo
+            worker.stop()
+            with self._lock:
+                self._started -= 1
+            return ExecutionResult(returncode=1, stdout="", stderr=f"[ERRORE EXECUTOR] Worker terminato: {e}")
+        self._release(worker)
+        return result
+
+    def _run_subprocess(self, path, cwd, timeout):
+        start = time.monotonic()
+        try:
+            process = subprocess.run(
+                [sys.executable, path], capture_output=True, text=True, cwd=cwd, timeout=timeout
+            )
+        except subprocess.TimeoutExpired as e:
+            stdout = e.stdout.decode("utf-8", errors="replace") if isinstance(e.stdout, bytes) else (e.stdout or "")
+            return ExecutionResult(
+                returncode=-1, stdout=stdout[:self.max_output],
+                stderr=f"[TIMEOUT] Esecuzione interrotta dopo {timeout} secondi.",
+                duration=time.monotonic() - start, timed_out=True,
+            )
+        return ExecutionResult(
+            returncode=process.returncode,
+            stdout=process.stdout[:self.max_output],
+            stderr=process.stderr[:self.max_output],
+            duration=time.monotonic() - start,
+            truncated=len(process.stdout) > self.max_output or len(process.stderr) > self.max_output,
+        )
+
+    def close(self):
+        """
+        Chiude il pool: ferma i worker inattivi; quelli occupati vengono fermati
+        da _release al termine dell'esecuzione in corso.
+        """
+        with self._lock:
+            self._closed = True
+            idle = []
+            while not self._idle.empty():
+                idle.append(self._idle.get())
+            self._started -= len(idle)
+        for worker in idle:
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool() -> WorkerPool:
+    """
+    Pool condiviso dal processo, con cache del bytecode in EXECUTOR_CACHE_DIR
+    (default .executor_cache).
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = WorkerPool(cache_dir=os.environ.get("EXECUTOR_CACHE_DIR", ".executor_cache"))
+        return _default_pool
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--worker"]:
+    _worker_main()
@@ -1,92 +1,500 @@
-from openai import OpenAI
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from typing import Optional, List, Dict
+import asyncio
+import contextvars
+import inspect
 import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from Utility import function_to_schema
+from Streaming import StreamAccumulator
+from Compaction import CompactionPolicy, Compactor
+from Completion import CompletionLayer
+from PreRouter import PreRouter
+from ConversationStore import SessionMemories, default_store
+from Routing import default_policy
+from Scheduler import priority_scope
+from Tracing import agent_scope, get_tracer
+
+# client OpenAI creato alla prima richiesta (Completion.default_client): importare MAS non carica l'SDK
+llm = CompletionLayer()  # cache/record/replay: see Completion.py
+compactor = Compactor(llm)  # riassume la memoria oltre il budget dell'agente
+logger = logging.getLogger(__name__)
+
+
+def __getattr__(name):
+    # MAS.client resta disponibile: è il client di llm, creato al primo accesso
+    if name == "client":
+        return llm.client
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Tipi JSON che possiamo verificare sugli argomenti prodotti dal modello
+_JSON_TYPES = (str, int, float, bool, list, dict)
+
+
+def _make_validator(func):
+    """
+    Build an argument validator for a tool from its signature.
+    """
+    params = inspect.signature(func).parameters
+    accepts_kwargs = any(p.kind is p.VAR_KEYWORD for p in params.values())
+    required = {
+        name for name, p in params.items()
+        if p.default is p.empty and p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)
+    }
+    types = {name: p.annotation for name, p in params.items() if p.annotation in _JSON_TYPES}
+
+    def validate(args):
+        if not isinstance(args, dict):
+            raise TypeError(f"{func.__name__}() expects a JSON object of arguments")
+        missing = required - args.keys()
+        if missing:
+            raise TypeError(f"{func.__name__}() missing required arguments: {sorted(missing)}")
+        if not accepts_kwargs:
+            unexpected = args.keys() - params.keys()
+            if unexpected:
+                raise TypeError(f"{func.__name__}() got unexpected arguments: {sorted(unexpected)}")
+        for name, expected in types.items():
+            value = args.get(name)
+            if value is None or isinstance(value, expected) or (expected is float and isinstance(value, int)):
+                continue
+            raise TypeError(f"{func.__name__}() argument '{name}' must be {expected.__name__}")
+
+    return validate
+
+
+class ToolRegistry:
+    """
+    Compiled view of a tool list: OpenAI schemas, name -> callable map and
+    argument validators. Built once per distinct tool list and shared by every
+    agent (and session) that uses the same tools.
+    """
+    def __init__(self, tools):
+        self.tools = tuple(tools)
+        self.schemas = [function_to_schema(tool) for tool in self.tools]
+        self.functions = {tool.__name__: tool for tool in self.tools}
+        self.validators = {tool.__name__: _make_validator(tool) for tool in self.tools}
+        self.parallel = {tool.__name__ for tool in self.tools if getattr(tool, "parallel", False)}
+
+    def call(self, name, args):
+        if name not in self.functions:
+            raise ValueError(f"Unknown tool: {name}")
+        self.validators[name](args)
+        return self.functions[name](**args)
+
+
+_registry_cache: Dict[tuple, ToolRegistry] = {}
+_registry_lock = threading.Lock()
+
+
+def compile_tools(tools) -> ToolRegistry:
+    """
+    Return the (cached) ToolRegistry for a list of tools.
+    """
+    key = tuple(tools)
+    registry = _registry_cache.get(key)
+    if registry is None:
+        with _registry_lock:
+            registry = _registry_cache.get(key)
+            if registry is None:
+                registry = _registry_cache[key] = ToolRegistry(key)
+    return registry
 
-client = OpenAI()
 
 class Agent(BaseModel):
     name: str = "Agent"
     model: str = "gpt-4o-mini"
+    models: List[str] = []  # Scala di modelli (dal più economico); vuota = sempre model
     instructions: str = "You are a helpful Agent"
     tools: list = []
     memory: List[Dict[str, str]] = []  # Memoria locale per ogni agente
+    # Budget di token della memoria (vedi Compaction.py); None = nessuna compattazione
+    compaction: Optional[CompactionPolicy] = CompactionPolicy()
+    _registry: Optional[ToolRegistry] = PrivateAttr(default=None)
+
+    @property
+    def registry(self) -> ToolRegistry:
+        # Ricompiliamo solo se la lista dei tool è cambiata
+        if self._registry is None or self._registry.tools != tuple(self.tools):
+            self._registry = compile_tools(self.tools)
+        return self._registry
 
         
 class Response(BaseModel):
     agent: Optional[Agent]
     messages: list
+
+
+# Memoria delle sessioni: se impostata (vedi memory_scope), ogni agente legge e
+# scrive la propria memoria nel dizionario della sessione invece che in agent.memory,
+# così le definizioni degli agenti restano condivise e le conversazioni isolate.
+_session_memory = contextvars.ContextVar("session_memory", default=None)
+
+
+class memory_scope:
+    """
+    Context manager: dentro il blocco la memoria degli agenti è quella del
+    dizionario memories ({nome agente: messaggi}) di una sessione.
+    """
+    def __init__(self, memories: dict):
+        self._memories = memories
+        self._token = None
+
+    def __enter__(self):
+        self._token = _session_memory.set(self._memories)
+        return self._memories
+
+    def __exit__(self, *exc):
+        _session_memory.reset(self._token)
+        return False
+
+
+def find_agent(name: str):
+    """
+    Agente definito in questo modulo con quel nome (es. per riprendere una sessione salvata), oppure None.
+    """
+    for value in list(globals().values()):
+        if isinstance(value, Agent) and value.name == name:
+            return value
+    return None
+
+
+def get_memory(agent) -> list:
+    memories = _session_memory.get()
+    if memories is None:
+        return agent.memory
+    return memories.setdefault(agent.name, [])
+
+
+def set_memory(agent, memory: list) -> None:
+    memories = _session_memory.get()
+    if memories is None:
+        agent.memory = memory
+    else:
+        memories[agent.name] = memory
         
         
-def run_full_turn(agent, message):
-    current_agent = agent
-    current_agent.memory.append({"role": "user", "content": message})  # Aggiungi il messaggio alla memoria locale
-    print(f'CURRENT AGENT MEMORY {current_agent} \n\n')
+class _Cascade:
+    """
+    Model ladder of the agent handling the turn: start from the cheapest model
+    and move one rung up after a reply whose tool calls failed.
+    """
+    def __init__(self, agent):
+        self.reset(agent)
+
+    def reset(self, agent) -> None:
+        self.agent = agent
+        self.ladder = default_policy().ladder(agent.name, agent.models) if agent.models else [agent.model]
+        self.level = 0
+
+    @property
+    def model(self) -> str:
+        return self.ladder[self.level]
+
+    def record(self, success: bool, seconds: float) -> None:
+        if not self.agent.models:
+            return
+        default_policy().record(self.agent.name, self.model, success, seconds)
+        if not success and self.level + 1 < len(self.ladder):
+            self.level += 1
+            logger.debug("Escalating %s to %s", self.agent.name, self.model)
+
+
+def run_full_turn(agent, message, stream=False):
+    """
+    Run a full turn and return the final Response.
+    With stream=True the agent replies are printed token by token as they arrive.
+    """
+    streaming_line = False
+    with get_tracer().span("agent.turn", agent=agent.name) as span:
+        for event in iter_full_turn(agent, message, stream=stream):
+            if event["type"] == "token":
+                if not streaming_line:
+                    print(f"{event['agent']}: ", end="")
+                    streaming_line = True
+                print(event["content"], end="", flush=True)
+            elif event["type"] == "message":
+                if streaming_line:
+                    print()
+                    streaming_line = False
+                elif event["message"].content:  # print agent response
+                    print(f"{event['agent']}:", event["message"].content)
+            elif event["type"] == "done":
+                span.set(final_agent=event["response"].agent.name)
+                return event["response"]
+
+
+def iter_full_turn(agent, message, stream=False):
+    """
+    Generator version of run_full_turn. Yields events as dicts:
+      {"type": "token", "agent", "content"}    text delta (stream=True only)
+      {"type": "message", "agent", "message"}  complete assistant message
+      {"type": "handoff", "agent"}             transfer to another agent
+      {"type": "done", "response"}             final Response
+    """
+    current_agent = _preroute(agent, message)
+    if current_agent is None:
+        current_agent = agent
+        get_memory(current_agent).append({"role": "user", "content": message})  # Aggiungi il messaggio alla memoria locale
+    else:
+        yield {"type": "handoff", "agent": current_agent.name}
+    logger.debug("Current agent %s, memory: %s", current_agent.name, get_memory(current_agent))
+    cascade = _Cascade(current_agent)
     while True:
-        # turn python functions into tools and save a reverse map
-        tool_schemas = [function_to_schema(tool) for tool in current_agent.tools]
-        tools = {tool.__name__: tool for tool in current_agent.tools}
+        # compiled once per tool list: schemas, reverse map and validators
+        registry = current_agent.registry
 
         # === 1. get openai completion ===
-        response = client.chat.completions.create(
-            model=current_agent.model,
-            messages=[{"role": "system", "content": current_agent.instructions}]
-            + current_agent.memory,  # Usa solo la memoria dell'agente corrente
-            tools=tool_schemas or None,
-        )
-        message = response.choices[0].message
-        current_agent.memory.append(message)  # Memorizza la risposta
-
-        if message.content:  # print agent response
-            print(f"{current_agent.name}:", message.content)
+        _compact_memory(current_agent)
+        start = time.monotonic()
+        with agent_scope(current_agent.name), priority_scope("interactive"):
+            response = llm.create(**_completion_params(current_agent, stream, cascade.model))
+        if stream:
+            # tool call deltas are assembled as they arrive
+            accumulator = StreamAccumulator()
+            for chunk in response:
+                text = accumulator.feed(chunk)
+                if text:
+                    yield {"type": "token", "agent": current_agent.name, "content": text}
+            message = accumulator.message()
+        else:
+            message = response.choices[0].message
+        get_memory(current_agent).append(message)  # Memorizza la risposta
+        yield {"type": "message", "agent": current_agent.name, "message": message}
 
         if not message.tool_calls:  # if finished handling tool calls, break
+            cascade.record(True, time.monotonic() - start)
             break
 
         # === 2. handle tool calls ===
-        for tool_call in message.tool_calls:
-            try:
-                result = execute_tool_call(tool_call, tools, current_agent.name)
-                if type(result) is Agent:  # if agent transfer, update current agent
+        # parallel tools may run concurrently, results are applied in tool_call order
+        results = execute_tool_calls(message.tool_calls, registry, current_agent.name)
+        cascade.record(all(error is None for _, error in results), time.monotonic() - start)
+        previous_agent = current_agent
+        current_agent, handoffs = _apply_tool_results(current_agent, message.tool_calls, results)
+        if handoffs:
+            cascade.reset(current_agent)
+            prerouter.record_hop(previous_agent.name, time.monotonic() - start)
+        for name in handoffs:
+            yield {"type": "handoff", "agent": name}
+
+    # ==== 3. return last agent used and new messages =====
+    yield {"type": "done", "response": Response(agent=current_agent, messages=get_memory(current_agent))}
+
+
+async def arun_full_turn(agent, message, stream=False):
+    """
+    Async version of run_full_turn for servers: returns the final Response
+    without printing. Inside memory_scope the conversation uses the session memory.
+    """
+    with get_tracer().span("agent.turn", agent=agent.name) as span:
+        async for event in aiter_full_turn(agent, message, stream=stream):
+            if event["type"] == "done":
+                span.set(final_agent=event["response"].agent.name)
+                return event["response"]
+
+
+async def aiter_full_turn(agent, message, stream=False):
+    """
+    Async generator version of iter_full_turn, with the same events. The model
+    is awaited through llm.acreate; blocking tools run in worker threads.
+    """
+    current_agent = _preroute(agent, message)
+    if current_agent is None:
+        current_agent = agent
+        get_memory(current_agent).append({"role": "user", "content": message})
+    else:
+        yield {"type": "handoff", "agent": current_agent.name}
+    cascade = _Cascade(current_agent)
+    while True:
+        if current_agent.compaction is not None:
+            # un eventuale riassunto sincrono non blocca l'event loop
+            await asyncio.to_thread(_compact_memory, current_agent)
+        start = time.monotonic()
+        with agent_scope(current_agent.name), priority_scope("interactive"):
+            response = await llm.acreate(**_completion_params(current_agent, stream, cascade.model))
+        if stream:
+            accumulator = StreamAccumulator()
+            async for chunk in response:
+                text = accumulator.feed(chunk)
+                if text:
+                    yield {"type": "token", "agent": current_agent.name, "content": text}
+            message = accumulator.message()
+        else:
+            message = response.choices[0].message
+        get_memory(current_agent).append(message)
+        yield {"type": "message", "agent": current_agent.name, "message": message}
+
+        if not message.tool_calls:
+            cascade.record(True, time.monotonic() - start)
+            break
+
+        # to_thread copies the context: tools and transfer_to_* see the session memory
+        results = await asyncio.to_thread(
+            execute_tool_calls, message.tool_calls, current_agent.registry, current_agent.name
+        )
+        cascade.record(all(error is None for _, error in results), time.monotonic() - start)
+        previous_agent = current_agent
+        current_agent, handoffs = _apply_tool_results(current_agent, message.tool_calls, results)
+        if handoffs:
+            cascade.reset(current_agent)
+            prerouter.record_hop(previous_agent.name, time.monotonic() - start)
+        for name in handoffs:
+            yield {"type": "handoff", "agent": name}
+
+    yield {"type": "done", "response": Response(agent=current_agent, messages=get_memory(current_agent))}
+
+
+def _preroute(agent, message):
+    """
+    Hand the message straight to a specialist agent when the pre-router is
+    confident (see PreRouter.py). Returns the new agent, or None to let the agent handle it.
+    """
+    if agent is not prerouter.entry_agent:
+        return None
+    transfer = prerouter.route(message)
+    return transfer(message) if transfer is not None else None
+
+
+def _compact_memory(agent):
+    """
+    Apply the agent's compaction policy to its memory before the next model call.
+    """
+    if agent.compaction is None:
+        return
+    compacted = compactor.compact(agent.name, agent.compaction, get_memory(agent))
+    if compacted is not None:
+        set_memory(agent, compacted)
+
+
+def _completion_params(agent, stream, model=None):
+    return dict(
+        model=model or agent.model,
+        messages=[{"role": "system", "content": agent.instructions}]
+        + get_memory(agent),  # Usa solo la memoria dell'agente corrente
+        tools=agent.registry.schemas or None,
+        stream=stream,
+    )
+
+
+def _apply_tool_results(current_agent, tool_calls, results):
+    """
+    Store the tool results in memory, in tool_call order. Returns the agent
+    that continues the turn and the names of the agents handed off to.
+    """
+    handoffs = []
+    for tool_call, (result, error) in zip(tool_calls, results):
+        try:
+            if error is not None:
+                raise error
+            if type(result) is Agent:  # if agent transfer, update current agent
+                with get_tracer().span("agent.handoff", agent=current_agent.name, target=result.name):
                     current_agent = result
-                    current_agent.memory = [  # Reset memoria per il nuovo agente
+                    memory = [  # Reset memoria per il nuovo agente
                         {"role": "system", "content": current_agent.instructions}
                     ]
                     transfer_message = json.loads(tool_call.function.arguments).get("message", "")
                     if transfer_message:
-                        current_agent.memory.append({"role": "user", "content": transfer_message})
-                    print(f"Transferred to {current_agent.name} with memory reset: \n{current_agent.memory}")
-                    continue  # Restart the loop with the new agent
-
-                result_message = {
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": result,
-                }
-                current_agent.memory.append(result_message)  # Memorizza il risultato
-            except Exception as e:
-                error_message = {
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": f"Error occurred: {str(e)}",
-                }
-                current_agent.memory.append(error_message)
-
-    # ==== 3. return last agent used and new messages =====
-    return Response(agent=current_agent, messages=current_agent.memory)
-
-def execute_tool_call(tool_call, tools, agent_name):
+                        memory.append({"role": "user", "content": transfer_message})
+                    set_memory(current_agent, memory)
+                logger.debug("Transferred to %s with memory reset: %s", current_agent.name, memory)
+                handoffs.append(current_agent.name)
+                continue  # Restart the loop with the new agent
+
+            result_message = {
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": result,
+            }
+            get_memory(current_agent).append(result_message)  # Memorizza il risultato
+        except Exception as e:
+            error_message = {
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": f"Error occurred: {str(e)}",
+            }
+            get_memory(current_agent).append(error_message)
+    return current_agent, handoffs
+
+
+def execute_tool_call(tool_call, registry, agent_name):
     name = tool_call.function.name
     args = json.loads(tool_call.function.arguments)
 
-    print(f"{agent_name}:", f"{name}({args})")
+    print(f"{agent_name}: {name}({args})")
+
+    with get_tracer().span("tool.execute", agent=agent_name, tool=name):
+        return registry.call(name, args)  # validate and call corresponding function
+
+
+_tool_pool = None
+_tool_pool_lock = threading.Lock()
 
-    return tools[name](**args)  # call corresponding function with provided arguments
+
+def _get_tool_pool():
+    global _tool_pool
+    with _tool_pool_lock:
+        if _tool_pool is None:
+            _tool_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool")
+        return _tool_pool
+
+
+def _call_tool(tool_call, registry, agent_name):
+    try:
+        return execute_tool_call(tool_call, registry, agent_name), None
+    except Exception as e:
+        return None, e
+
+
+def execute_tool_calls(tool_calls, registry, agent_name):
+    """
+    Execute the tool calls of one model message and return a (result, error)
+    pair for each, in the original order. Consecutive calls to parallel tools
+    run concurrently; every other call (including agent handoffs) runs alone,
+    in order.
+    """
+    results = []
+    batch = []
+
+    def flush():
+        if len(batch) > 1:
+            # each task runs in a copy of the current context, so its spans nest under the turn
+            futures = [
+                _get_tool_pool().submit(contextvars.copy_context().run, _call_tool, tc, registry, agent_name)
+                for tc in batch
+            ]
+            results.extend(future.result() for future in futures)
+        elif batch:
+            results.append(_call_tool(batch[0], registry, agent_name))
+        batch.clear()
+
+    for tool_call in tool_calls:
+        if tool_call.function.name in registry.parallel:
+            batch.append(tool_call)
+            continue
+        flush()
+        results.append(_call_tool(tool_call, registry, agent_name))
+    flush()
+    return results
+
+
+def parallel_tool(func):
+    """
+    Mark a tool as side-effect-independent (or purely I/O bound): when the model
+    requests several parallel tools in one message they run concurrently.
+    """
+    func.parallel = True
+    return func
 
 from typing import Optional
 import os
 import shutil
+from CodeIndex import default_index
+from Executor import default_pool
+from TestRunner import REPORT_NAME, TestReport, TestRunner, discover_tests, source_folders
 
 #################################################################
 #                       TOOLS IMPLEMENTATION                    #
@@ -99,20 +507,22 @@ def write_code_to_file(file_name: str, code: str):
     os.makedirs(os.path.dirname(file_name), exist_ok=True)
     with open(file_name, "w", encoding="utf-8") as f:
         f.write(code)
+    default_index().update_file(file_name, code)
     return f"Code written to {file_name}"
 
 def execute_code_from_file(file_name: str):
     """
-    Execute Python code from a specified file.
+    Execute Python code from a specified file and return its output.
     """
-    try:
-        with open(file_name, "r", encoding="utf-8") as f:
-            code = f.read()
-        exec(code, {})
-        return "Code executed successfully"
-    except Exception as e:
-        return f"Execution failed: {e}"
-
+    # Eseguito in un processo isolato (timeout, limiti di memoria), mai nel processo degli agenti
+    result = default_pool().run(file_name)
+    output = f"\nstdout:\n{result.stdout}" if result.stdout else ""
+    if result.returncode == 0:
+        errors = f"\nstderr:\n{result.stderr}" if result.stderr else ""
+        return f"Code executed successfully{output}{errors}"
+    return f"Execution failed (exit code {result.returncode}):\n{result.stderr}{output}"
+
+@parallel_tool
 def read_file(file_name: str):
     """
     Read the content of a specified file.
@@ -122,6 +532,33 @@ def read_file(file_name: str):
     with open(file_name, "r", encoding="utf-8") as f:
         return f.read()
 
+@parallel_tool
+def search_code(query: str, k: int = 5):
+    """
+    Search the workspace for the k snippets (functions, classes or file
+    sections) most relevant to the query, with their file and line range.
+    """
+    hits = default_index().search(query, k)
+    if not hits:
+        return f"No results for '{query}'."
+    return "\n\n".join(
+        f"{hit.path}:{hit.start}-{hit.end}" + (f" ({hit.symbol})" if hit.symbol else "") + f"\n{hit.snippet}"
+        for hit in hits
+    )
+
+@parallel_tool
+def get_symbol(name: str):
+    """
+    Return the source of the classes, functions or methods with the given name,
+    simple (cancel) or qualified (ReservationManager.cancel).
+    """
+    found = default_index().symbol(name)
+    if not found:
+        return f"Symbol {name} not found."
+    return "\n\n".join(f"{symbol.path}:{symbol.start}-{symbol.end} ({symbol.kind} {symbol.name})\n{source}"
+                       for symbol, source in found)
+
+@parallel_tool
 def create_folder(folder_path: str):
     """
     Create a folder at the specified path.
@@ -132,6 +569,7 @@ def create_folder(folder_path: str):
     except Exception as e:
         return f"Error creating folder '{folder_path}': {e}"
 
+@parallel_tool
 def create_project_structure(base_path: str):
     """
     Create the main folders for the project at the specified base path.
@@ -150,6 +588,7 @@ def create_project_structure(base_path: str):
         results.append(f"Created folder: {full_path}")
     return "\n".join(results)
 
+@parallel_tool
 def write_tests(base_path: str):
     """
     Write test files for the project at the specified base path.
@@ -161,6 +600,24 @@ def write_tests(base_path: str):
         test_content
     )
 
+def run_tests(base_path: str, failed_only: bool = False):
+    """
+    Run the project's tests in parallel shards and report the failing ones.
+    With failed_only, re-run only the shards that failed in the last run.
+    """
+    runner = TestRunner(base_path, sys_path=source_folders(base_path))
+    report_path = os.path.join(base_path, REPORT_NAME)
+    previous = TestReport.load(report_path) if failed_only else None
+    if previous is not None:
+        report = runner.rerun(previous)
+    else:
+        report = runner.run(discover_tests(base_path))
+    report.save(report_path)
+    failures = "".join(f"\n\n{result.test_id} ({result.outcome}):\n{result.traceback}"
+                       for result in report.failures())
+    return report.summary() + failures
+
+@parallel_tool
 def write_documentation(base_path: str):
     """
     Write documentation files for the project at the specified base path.
@@ -172,6 +629,7 @@ def write_documentation(base_path: str):
         doc_content
     )
 
+@parallel_tool
 def write_project_code(base_path: str):
     """
     Write main project code (e.g. library management system) inside src/.
@@ -214,6 +672,7 @@ write_code_agent = Agent(
         "Il mio compito è di scrivere codice in un file specificato. "
         "Dopo aver completato il mio compito, restituisco sempre il controllo al Triage Agent."
     ),
+    models=["gpt-4o-mini", "gpt-4o"],
     tools=[write_code_to_file],
 )
 
@@ -237,10 +696,12 @@ file_manager_agent = Agent(
         "Opero in un ambiente multi-agente che include: Planner Agent, Triage Agent, "
         "Write Code Agent, Execute Code Agent, Project Structure Agent, "
         "Test Writer Agent, Documentation Agent, Project Code Agent, e Project Manager Agent. "
-        "Il mio compito è di leggere contenuti da file. "
+        "Il mio compito è di leggere contenuti da file e cercare nel codice. "
+        "Per trovare codice uso search_code (solo i frammenti rilevanti) e get_symbol "
+        "(il sorgente di una classe o funzione); leggo un file intero con read_file solo se serve. "
         "Dopo aver fornito le informazioni lette, restituisco sempre il controllo al Triage Agent."
     ),
-    tools=[read_file],
+    tools=[read_file, search_code, get_symbol],
 )
 
 project_structure_agent = Agent(
@@ -263,10 +724,12 @@ test_writer_agent = Agent(
         "Opero in un ambiente multi-agente che include: Planner Agent, Triage Agent, "
         "Write Code Agent, Execute Code Agent, File Manager Agent, Project Structure Agent, "
         "Documentation Agent, Project Code Agent, e Project Manager Agent. "
-        "Il mio compito è scrivere test per il progetto. "
+        "Il mio compito è scrivere test per il progetto ed eseguirli con run_tests "
+        "(con failed_only=True rieseguo solo gli shard falliti dopo una correzione). "
         "Dopo aver scritto i test, passo sempre il controllo al Triage Agent."
     ),
-    tools=[write_tests],
+    models=["gpt-4o-mini", "gpt-4o"],
+    tools=[write_tests, run_tests],
 )
 
 documentation_agent = Agent(
@@ -292,6 +755,7 @@ project_code_agent = Agent(
         "Il mio compito è scrivere il codice principale del progetto. "
         "Dopo aver completato la scrittura, passo sempre il controllo al Triage Agent."
     ),
+    models=["gpt-4o-mini", "gpt-4o"],
     tools=[write_project_code],
 )
 
@@ -303,66 +767,74 @@ project_code_agent = Agent(
 
 def transfer_to_write_code_agent(message=None):
     """Transfer to the Write Code Agent with an optional message."""
-    write_code_agent.memory = [{"role": "system", "content": write_code_agent.instructions}]
+    memory = [{"role": "system", "content": write_code_agent.instructions}]
     if message:
-        write_code_agent.memory.append({"role": "user", "content": message})
-    print(f"Transferring to Write Code Agent with memory reset: \n{write_code_agent.memory}")
+        memory.append({"role": "user", "content": message})
+    set_memory(write_code_agent, memory)
+    logger.debug("Transferring to Write Code Agent with memory reset: %s", memory)
     return write_code_agent
 
 def transfer_to_execute_code_agent(message=None):
     """Transfer to the Execute Code Agent with an optional message."""
-    execute_code_agent.memory = [{"role": "system", "content": execute_code_agent.instructions}]
+    memory = [{"role": "system", "content": execute_code_agent.instructions}]
     if message:
-        execute_code_agent.memory.append({"role": "user", "content": message})
-    print(f"Transferring to Execute Code Agent with memory reset: \n{execute_code_agent.memory}")
+        memory.append({"role": "user", "content": message})
+    set_memory(execute_code_agent, memory)
+    logger.debug("Transferring to Execute Code Agent with memory reset: %s", memory)
     return execute_code_agent
 
 def transfer_to_file_manager_agent(message=None):
     """Transfer to the File Manager Agent with an optional message."""
-    file_manager_agent.memory = [{"role": "system", "content": file_manager_agent.instructions}]
+    memory = [{"role": "system", "content": file_manager_agent.instructions}]
     if message:
-        file_manager_agent.memory.append({"role": "user", "content": message})
-    print(f"Transferring to File Manager Agent with memory reset: \n{file_manager_agent.memory}")
+        memory.append({"role": "user", "content": message})
+    set_memory(file_manager_agent, memory)
+    logger.debug("Transferring to File Manager Agent with memory reset: %s", memory)
     return file_manager_agent
 
 def transfer_to_project_structure_agent(message=None):
     """Transfer to the Project Structure Agent with an optional message."""
-    project_structure_agent.memory = [{"role": "system", "content": project_structure_agent.instructions}]
+    memory = [{"role": "system", "content": project_structure_agent.instructions}]
     if message:
-        project_structure_agent.memory.append({"role": "user", "content": message})
-    print(f"Transferring to Project Structure Agent with memory reset: \n{project_structure_agent.memory}")
+        memory.append({"role": "user", "content": message})
+    set_memory(project_structure_agent, memory)
+    logger.debug("Transferring to Project Structure Agent with memory reset: %s", memory)
     return project_structure_agent
 
 def transfer_to_test_writer_agent(message=None):
     """Transfer to the Test Writer Agent with an optional message."""
-    test_writer_agent.memory = [{"role": "system", "content": test_writer_agent.instructions}]
+    memory = [{"role": "system", "content": test_writer_agent.instructions}]
     if message:
-        test_writer_agent.memory.append({"role": "user", "content": message})
-    print(f"Transferring to Test Writer Agent with memory reset: \n{test_writer_agent.memory}")
+        memory.append({"role": "user", "content": message})
+    set_memory(test_writer_agent, memory)
+    logger.debug("Transferring to Test Writer Agent with memory reset: %s", memory)
     return test_writer_agent
 
 def transfer_to_documentation_agent(message=None):
     """Transfer to the Documentation Agent with an optional message."""
-    documentation_agent.memory = [{"role": "system", "content": documentation_agent.instructions}]
+    memory = [{"role": "system", "content": documentation_agent.instructions}]
     if message:
-        documentation_agent.memory.append({"role": "user", "content": message})
-    print(f"Transferring to Documentation Agent with memory reset: \n{documentation_agent.memory}")
+        memory.append({"role": "user", "content": message})
+    set_memory(documentation_agent, memory)
+    logger.debug("Transferring to Documentation Agent with memory reset: %s", memory)
     return documentation_agent
 
 def transfer_to_project_code_agent(message=None):
     """Transfer to the Project Code Agent with an optional message."""
-    project_code_agent.memory = [{"role": "system", "content": project_code_agent.instructions}]
+    memory = [{"role": "system", "content": project_code_agent.instructions}]
     if message:
-        project_code_agent.memory.append({"role": "user", "content": message})
-    print(f"Transferring to Project Code Agent with memory reset: \n{project_code_agent.memory}")
+        memory.append({"role": "user", "content": message})
+    set_memory(project_code_agent, memory)
+    logger.debug("Transferring to Project Code Agent with memory reset: %s", memory)
     return project_code_agent
 
 def transfer_to_planner_agent(message=None):
     """Transfer to the Planner Agent with an optional message."""
-    planner_agent.memory = [{"role": "system", "content": planner_agent.instructions}]
+    memory = [{"role": "system", "content": planner_agent.instructions}]
     if message:
-        planner_agent.memory.append({"role": "user", "content": message})
-    print(f"Transferring to Planner Agent with memory reset: \n{planner_agent.memory}")
+        memory.append({"role": "user", "content": message})
+    set_memory(planner_agent, memory)
+    logger.debug("Transferring to Planner Agent with memory reset: %s", memory)
     return planner_agent
 
 
@@ -405,6 +877,18 @@ triage_agent = Agent(
     ],
 )
 
+# Instradamento locale davanti al Triage: le richieste ovvie saltano la sua chiamata al modello
+prerouter = PreRouter(triage_agent, {
+    transfer_to_planner_agent: planner_agent,
+    transfer_to_write_code_agent: write_code_agent,
+    transfer_to_execute_code_agent: execute_code_agent,
+    transfer_to_file_manager_agent: file_manager_agent,
+    transfer_to_project_structure_agent: project_structure_agent,
+    transfer_to_test_writer_agent: test_writer_agent,
+    transfer_to_documentation_agent: documentation_agent,
+    transfer_to_project_code_agent: project_code_agent,
+})
+
 #################################################################
 #                     PROJECT MANAGEMENT AGENT                  #
 #################################################################
@@ -435,16 +919,36 @@ project_manager_agent = Agent(
 #                    OPTIONAL INTERACTION LOOP                  #
 #################################################################
 
-def run_interaction_loop():
+def run_interaction_loop(stream=False, session_id=None):
     """
     Optional loop for user input, if needed.
+    With session_id the conversation is saved in the conversation store
+    (see ConversationStore.py) and resumes from where it stopped.
     """
     # Ciclo di esecuzione
     current_agent = triage_agent
-    while True:
-        user_input = input("User: ")
-        response = run_full_turn(current_agent, user_input)
-        current_agent = response.agent
+    memories = None
+    if session_id:
+        store = default_store()
+        memories = SessionMemories(store, session_id)
+        current_agent = find_agent(store.agent(session_id) or "") or triage_agent
+    try:
+        with memory_scope(memories):
+            while True:
+                user_input = input("User: ")
+                response = run_full_turn(current_agent, user_input, stream=stream)
+                current_agent = response.agent
+                if memories is not None:
+                    store.end_turn(session_id, current_agent.name)
+    except (KeyboardInterrupt, EOFError):
+        print()
+    finally:
+        tracer = get_tracer()
+        if tracer.enabled:  # TRACE_FILE impostata: riepilogo di tempi e token
+            print(tracer.summary())
+        if prerouter.stats["messages"]:
+            print(prerouter.summary())
+        default_policy().stats.save()
 
 if __name__ == "__main__":
     run_interaction_loop()
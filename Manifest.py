@@ -0,0 +1,89 @@
+"""
+Manifest di build per SupervisorAgent.manage_project.
+
+Il file .manifest.json nella cartella di output registra, per ogni file
+generato, l'hash degli input del prompt che lo hanno prodotto, l'hash del
+contenuto scritto e lo stato di esecuzione/debug; registra anche l'output
+dell'architetto. Una nuova esecuzione (dopo un'interruzione o una modifica)
+rigenera solo ciò che è cambiato.
+"""
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST_NAME = ".manifest.json"
+
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """
+    Stato persistente della build. Ogni aggiornamento viene salvato subito
+    (scrittura atomica), così un'interruzione perde al più il file in corso.
+    """
+    def __init__(self, root_folder: str):
+        self.path = os.path.join(root_folder, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self.data = {"architecture": {}, "files": {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                print(f"Manifest {self.path} illeggibile: verrà ricreato.")
+
+    def architecture(self, input_hash: str):
+        """
+        Output dell'architetto registrato per questi input, oppure None.
+        """
+        entry = self.data.get("architecture", {})
+        return entry.get("text") if entry.get("input_hash") == input_hash else None
+
+    def record_architecture(self, input_hash: str, text: str) -> None:
+        with self._lock:
+            self.data["architecture"] = {"input_hash": input_hash, "text": text}
+            self._save()
+
+    def file(self, relative_path: str) -> dict:
+        return self.data.get("files", {}).get(relative_path, {})
+
+    def is_current(self, relative_path: str, input_hash: str, file_path: str) -> bool:
+        """
+        True se il file è stato generato con gli stessi input e su disco
+        c'è ancora esattamente il contenuto registrato.
+        """
+        entry = self.file(relative_path)
+        if entry.get("input_hash") != input_hash or not os.path.exists(file_path):
+            return False
+        with open(file_path, "r", encoding="utf-8") as f:
+            return content_hash(f.read()) == entry.get("output_hash")
+
+    def record_file(self, relative_path: str, **fields) -> None:
+        """
+        Aggiorna i campi della voce di un file (input_hash, output_hash, status, ...).
+        """
+        with self._lock:
+            self.data.setdefault("files", {}).setdefault(relative_path, {}).update(fields)
+            self._save()
+
+    def forget_file(self, relative_path: str) -> None:
+        """
+        Rimuove la voce di un file che non fa più parte del progetto.
+        """
+        with self._lock:
+            if self.data.get("files", {}).pop(relative_path, None) is not None:
+                self._save()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,220 @@
+"""
+Instradamento locale dei messaggi, davanti al Triage Agent di MAS.py.
+
+Ogni messaggio rivolto al Triage costa una chiamata al modello solo per
+scegliere uno dei tool transfer_to_*, e poi l'agente scelto ne fa un'altra.
+PreRouter prova a decidere senza modello:
+  - regole: espressioni regolari per le richieste ovvie ("leggi il file X",
+    "esegui Y.py", ...);
+  - un classificatore offline: similarità coseno TF-IDF tra il messaggio e le
+    istruzioni (più alcune parole chiave) di ogni agente di destinazione.
+Il punteggio di una destinazione è la similarità più RULE_WEIGHT se una sua
+regola corrisponde. Il passaggio diretto avviene solo se il punteggio migliore
+supera threshold con almeno margin sul secondo; i messaggi con più richieste
+concatenate ("e poi", "then", "e correggi", più righe), con una negazione
+("non eseguire", "don't run"), in cui corrispondono le regole di più
+destinazioni o troppo lunghi vanno sempre al Triage, che può consultare il
+Planner.
+
+PreRouter.stats riporta quanti messaggi sono stati instradati direttamente e
+la latenza risparmiata, stimata con la durata media di un passaggio del Triage
+misurata sui messaggi che lo attraversano. Con la variabile d'ambiente
+PREROUTER=0 l'instradamento locale è disattivato.
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from Tracing import get_tracer
+
+RULE_WEIGHT = 0.6
+MAX_WORDS = 40
+
+# Parole chiave (italiano e inglese) e regole per i tool di handoff del Triage
+DEFAULT_ROUTES = {
+    "transfer_to_file_manager_agent": (
+        "leggi lettura mostra contenuto apri file read show open content cat print "
+        "cerca trova dove definita definito search find where defined symbol grep",
+        [r"\b(leggi|leggere|read|mostra(mi)?|show|apri|open|cat|stampa)\b.*\b(file|[\w/.-]+\.\w+)",
+         r"\b(cerca|trova|search|find|grep)\b.*"
+         r"\b(codice|code|class[ei]?|funzion[ei]|functions?|metod[oi]|methods?|simbol[oi]|symbols?)\b",
+         r"\bdove\b.*\bdefinit[oa]\b|\bwhere\b.*\bdefined\b"],
+    ),
+    "transfer_to_execute_code_agent": (
+        "esegui esecuzione lancia avvia run execute launch script python",
+        [r"\b(esegui|eseguire|lancia|avvia|run|execute|launch)\b.*[\w/.-]+\.py\b"],
+    ),
+    "transfer_to_write_code_agent": (
+        "scrivi codice salva funzione script write code save function implement",
+        [r"\b(scrivi|scrivere|salva|implementa|write|save|implement)\b.*\b(codice|code|script|funzion[ei]|functions?)\b"],
+    ),
+    "transfer_to_project_structure_agent": (
+        "crea cartella cartelle struttura directory create folder folders structure mkdir",
+        [r"\b(crea|creare|create|make|mkdir)\b.*\b(cartell[ae]|folders?|director(y|ies)|struttura|structure)\b"],
+    ),
+    "transfer_to_test_writer_agent": (
+        "test unit test pytest unittest scrivi genera write generate",
+        [r"\b(scrivi|scrivere|genera|aggiungi|crea|write|generate|add|create)\b.*\b(test|tests|unit ?test)\b"],
+    ),
+    "transfer_to_documentation_agent": (
+        "documentazione documenta readme docs documentation document",
+        [r"\b(documentazione|documenta|documentation|document|docs|readme)\b"],
+    ),
+    "transfer_to_project_code_agent": (
+        "codice principale progetto main code project",
+        [r"\b(scrivi|scrivere|genera|implementa|write|generate|implement)\b.*\b(codice principale|main code)\b"],
+    ),
+    "transfer_to_planner_agent": (
+        "piano pianifica pianificazione ordine passi plan planning roadmap steps",
+        [r"\b(piano|pianifica|pianificazione|plan|planning|roadmap)\b"],
+    ),
+}
+
+# Verbi di una seconda richiesta dopo "e"/"and" ("mostrami main.py e correggi il bug")
+_ACTIONS = (
+    "leggi|mostra|apri|stampa|esegui|lancia|avvia|scrivi|salva|implementa|crea|genera|aggiungi|"
+    "documenta|cerca|trova|pianifica|correggi|sistema|modifica|cambia|aggiorna|rimuovi|elimina|"
+    "spiega|rinomina|read|show|open|print|run|execute|launch|write|save|implement|create|make|"
+    "generate|add|document|search|find|plan|fix|modify|change|update|remove|delete|explain|"
+    "rename|refactor|test"
+)
+_CHAINED = re.compile(
+    r"\b(e poi|poi|quindi|dopodiché|and then|then|after that|afterwards)\b|\n|;"
+    rf"|\b(e|ed|and)\s+(anche\s+|also\s+)?({_ACTIONS})\w*"
+)
+_NEGATED = re.compile(r"\b(non|senza|mai|never|not|don'?t|doesn'?t|without)\b")
+_WORD = re.compile(r"[a-zà-ù0-9_]+")
+
+
+def tokenize(text: str) -> list:
+    """
+    Parole del testo, ridotte a una radice grezza (primi 5 caratteri) per
+    avvicinare le forme della stessa parola ("esegui", "esecuzione").
+    """
+    return [word[:5] for word in _WORD.findall(text.lower()) if len(word) > 1]
+
+
+class _Route:
+    def __init__(self, transfer, agent, keywords: str, patterns):
+        self.transfer = transfer
+        self.agent = agent
+        self.text = f"{agent.instructions} {keywords}"
+        self.patterns = [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+        self.vector = None
+
+
+class PreRouter:
+    """
+    Instradamento locale davanti a entry_agent. targets: {funzione transfer_to_*:
+    agente di destinazione}; routes: {nome del tool: (parole chiave, regole)}.
+    """
+    def __init__(self, entry_agent, targets: dict, routes: dict = None,
+                 threshold: float = 0.6, margin: float = 0.25, enabled: bool = None):
+        self.entry_agent = entry_agent
+        self.threshold = threshold
+        self.margin = margin
+        self.enabled = os.environ.get("PREROUTER", "1") != "0" if enabled is None else enabled
+        routes = DEFAULT_ROUTES if routes is None else routes
+        self._routes = [
+            _Route(transfer, agent, *routes.get(transfer.__name__, ("", [])))
+            for transfer, agent in targets.items()
+        ]
+        self._idf = None
+        self._lock = threading.Lock()
+        self.stats = {"messages": 0, "routed": 0, "fallback": 0, "by_agent": {},
+                      "triage_hops": 0, "triage_seconds": 0.0}
+
+    def _vector(self, tokens: list) -> dict:
+        counts = Counter(token for token in tokens if token in self._idf)
+        vector = {token: count * self._idf[token] for token, count in counts.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        return {token: value / norm for token, value in vector.items()}
+
+    def _build(self) -> None:
+        """
+        Indice TF-IDF delle destinazioni, costruito al primo messaggio. Le parole
+        presenti in tutte le istruzioni (l'elenco degli agenti) hanno peso nullo.
+        """
+        documents = [tokenize(route.text) for route in self._routes]
+        frequency = Counter(token for document in documents for token in set(document))
+        total = len(documents)
+        self._idf = {token: math.log((1 + total) / (1 + df)) for token, df in frequency.items()}
+        for route, document in zip(self._routes, documents):
+            route.vector = self._vector(document)
+
+    def scores(self, message: str) -> list:
+        """
+        [(punteggio, regola corrisposta, destinazione)] in ordine decrescente.
+        """
+        with self._lock:
+            if self._idf is None:
+                self._build()
+        vector = self._vector(tokenize(message))
+        scored = []
+        for route in self._routes:
+            similarity = sum(value * route.vector.get(token, 0.0) for token, value in vector.items())
+            rule = any(pattern.search(message) for pattern in route.patterns)
+            scored.append((similarity + (RULE_WEIGHT if rule else 0.0), rule, route))
+        return sorted(scored, key=lambda item: item[0], reverse=True)
+
+    def route(self, message: str):
+        """
+        Funzione transfer_to_* a cui passare direttamente il messaggio, oppure
+        None se la decisione spetta all'entry agent.
+        """
+        if not self.enabled or not self._routes:
+            return None
+        with get_tracer().span("router.preroute") as span:
+            route, score, rule = None, 0.0, False
+            text = message.lower()
+            if len(message.split()) <= MAX_WORDS and not _CHAINED.search(text) and not _NEGATED.search(text):
+                ranked = self.scores(message)
+                score, rule, best = ranked[0]
+                runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+                ambiguous = sum(1 for _, matched, _ in ranked if matched) > 1
+                if score >= self.threshold and score - runner_up >= self.margin and not ambiguous:
+                    route = best
+            span.set(routed=route is not None, score=round(score, 3), rule=rule,
+                     target=route.agent.name if route else None)
+        with self._lock:
+            self.stats["messages"] += 1
+            if route is None:
+                self.stats["fallback"] += 1
+                return None
+            self.stats["routed"] += 1
+            by_agent = self.stats["by_agent"]
+            by_agent[route.agent.name] = by_agent.get(route.agent.name, 0) + 1
+        return route.transfer
+
+    def record_hop(self, agent_name: str, seconds: float) -> None:
+        """
+        Registra la durata di un passaggio dell'entry agent (chiamata al modello e handoff).
+        """
+        if agent_name != self.entry_agent.name:
+            return
+        with self._lock:
+            self.stats["triage_hops"] += 1
+            self.stats["triage_seconds"] += seconds
+
+    @property
+    def hit_rate(self) -> float:
+        return self.stats["routed"] / self.stats["messages"] if self.stats["messages"] else 0.0
+
+    @property
+    def saved_seconds(self):
+        """
+        Latenza risparmiata stimata, oppure None se nessun passaggio del Triage è stato misurato.
+        """
+        if not self.stats["triage_hops"]:
+            return None
+        return self.stats["routed"] * self.stats["triage_seconds"] / self.stats["triage_hops"]
+
+    def summary(self) -> str:
+        saved = self.saved_seconds
+        return (
+            f"Pre-router: {self.stats['routed']}/{self.stats['messages']} messaggi instradati "
+            f"direttamente ({self.hit_rate:.0%}), latenza risparmiata "
+            + (f"~{saved:.2f} s" if saved is not None else "non stimabile (nessun passaggio del Triage misurato)")
+        )
@@ -0,0 +1,129 @@
+"""
+Instradamento dei modelli "a cascata".
+
+Ogni agente dichiara una scala di modelli, dal più economico al più capace
+(es. ("gpt-4o-mini", "gpt-4o")). Un compito parte dal primo gradino e sale al
+successivo solo se il risultato non supera le verifiche (esecuzione del file
+generato, errori dei tool, ...).
+
+ModelStats registra per ogni coppia (agente, modello) tentativi, successi e
+latenza, e li salva in un file JSON (variabile d'ambiente ROUTING_STATS_FILE,
+default .sessions/routing_stats.json, accanto all'archivio delle
+conversazioni) per poter regolare le scale; il file viene scritto solo se ci
+sono nuovi tentativi da registrare. Con
+ROUTING_MIN_SUCCESS_RATE impostata, i gradini che su almeno min_samples
+tentativi hanno un tasso di successo inferiore vengono saltati.
+
+Riepilogo delle statistiche salvate: python Routing.py [file]
+"""
+import json
+import os
+import sys
+import threading
+
+STATS_FILE = os.path.join(".sessions", "routing_stats.json")
+
+
+class ModelStats:
+    """
+    Tentativi, successi e secondi spesi per {agente: {modello: ...}}.
+    """
+    def __init__(self, path: str = None):
+        self.path = path
+        self.data = {}
+        self._dirty = False  # tentativi registrati dopo l'ultimo salvataggio
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                print(f"Statistiche di routing {path} illeggibili: verranno ricreate.")
+
+    def record(self, agent: str, model: str, success: bool, seconds: float = 0.0) -> None:
+        with self._lock:
+            entry = self.data.setdefault(agent, {}).setdefault(model, {"attempts": 0, "successes": 0, "seconds": 0.0})
+            entry["attempts"] += 1
+            entry["successes"] += int(success)
+            entry["seconds"] += seconds
+            self._dirty = True
+
+    def success_rate(self, agent: str, model: str, min_samples: int = 1):
+        """
+        Tasso di successo, oppure None se i tentativi sono meno di min_samples.
+        """
+        entry = self.data.get(agent, {}).get(model)
+        if not entry or entry["attempts"] < max(min_samples, 1):
+            return None
+        return entry["successes"] / entry["attempts"]
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+            self._dirty = False
+
+    def report(self) -> str:
+        with self._lock:
+            lines = [f"{'agente':<24}{'modello':<20}{'tentativi':>10}{'successo':>10}{'media s':>9}"]
+            for agent, models in sorted(self.data.items()):
+                for model, entry in models.items():
+                    attempts = entry["attempts"] or 1
+                    lines.append(
+                        f"{agent[:23]:<24}{model[:19]:<20}{entry['attempts']:>10}"
+                        f"{entry['successes'] / attempts:>10.0%}{entry['seconds'] / attempts:>9.2f}"
+                    )
+            return "\n".join(lines)
+
+
+class RoutingPolicy:
+    """
+    Decide la scala effettiva di un agente: i gradini iniziali con tasso di
+    successo sotto min_success_rate (su almeno min_samples tentativi) vengono
+    saltati; l'ultimo gradino resta sempre.
+    """
+    def __init__(self, stats: ModelStats = None, min_success_rate: float = 0.0, min_samples: int = 20):
+        self.stats = stats or ModelStats()
+        self.min_success_rate = min_success_rate
+        self.min_samples = min_samples
+
+    def ladder(self, agent: str, models) -> list:
+        models = list(models)
+        while len(models) > 1 and self.min_success_rate > 0:
+            rate = self.stats.success_rate(agent, models[0], self.min_samples)
+            if rate is None or rate >= self.min_success_rate:
+                break
+            models.pop(0)
+        return models
+
+    def record(self, agent: str, model: str, success: bool, seconds: float = 0.0) -> None:
+        self.stats.record(agent, model, success, seconds)
+
+
+_default_policy = None
+_default_policy_lock = threading.Lock()
+
+
+def default_policy() -> RoutingPolicy:
+    """
+    Politica condivisa dal processo, configurata da ROUTING_STATS_FILE e ROUTING_MIN_SUCCESS_RATE.
+    """
+    global _default_policy
+    with _default_policy_lock:
+        if _default_policy is None:
+            _default_policy = RoutingPolicy(
+                ModelStats(os.environ.get("ROUTING_STATS_FILE", STATS_FILE)),
+                min_success_rate=float(os.environ.get("ROUTING_MIN_SUCCESS_RATE", 0)),
+            )
+        return _default_policy
+
+
+if __name__ == "__main__":
+    print(ModelStats(sys.argv[1] if len(sys.argv) > 1 else STATS_FILE).report())
@@ -0,0 +1,364 @@
+"""
+Scheduler condiviso delle richieste LLM, usato da CompletionLayer (e quindi
+da MAS.py, AgentDeveloper.py e Sessions.py).
+
+Prima di ogni richiesta si stima il numero di token (prompt + completamento
+atteso) e si attende che i limiti del modello lo permettano: un token bucket
+per le richieste al minuto e uno per i token al minuto. Chi attende viene
+servito per classe di priorità ("interactive" prima di "normal" e "bulk"),
+scelta con priority_scope: i turni del Triage non restano in coda dietro alla
+generazione di un progetto.
+
+Le richieste fallite per rate limit (429), timeout, errori di connessione o
+errori 5xx vengono ripetute con backoff esponenziale con jitter, rispettando
+gli header retry-after / retry-after-ms; un 429 sospende per quel tempo tutte
+le richieste allo stesso modello. La quota esaurita (insufficient_quota) non
+viene ripetuta.
+
+Configurazione (variabili d'ambiente):
+  - LLM_RATE_LIMITS: limiti per modello in JSON, es.
+        {"gpt-4o": {"rpm": 500, "tpm": 30000}, "gpt-4o-mini": {"rpm": 500, "tpm": 200000}}
+    (i modelli senza limiti non vengono accodati);
+  - LLM_MAX_RETRIES: tentativi ripetuti al massimo (default 6).
+
+pooled_http_client() è il trasporto HTTP keep-alive condiviso da tutti i
+client OpenAI sincroni del processo; pooled_async_http_client() è la sua
+controparte asincrona (stessi limiti di connessione), una per event loop.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+
+from Architecture import count_tokens
+
+PRIORITIES = {"interactive": 0, "normal": 1, "bulk": 2}
+DEFAULT_COMPLETION_TOKENS = 512  # stima del completamento se max_tokens non è dato
+
+_current_priority = contextvars.ContextVar("llm_priority", default="normal")
+
+
+@lru_cache(maxsize=None)
+def _retryable():
+    # import differito: l'SDK è già caricato quando una richiesta fallisce
+    import openai
+    return (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+
+def _is_rate_limit(error) -> bool:
+    return isinstance(error, _retryable()[0])
+
+
+class priority_scope:
+    """
+    Context manager: le richieste LLM fatte nel blocco hanno questa classe di priorità.
+    """
+    def __init__(self, name: str):
+        if name not in PRIORITIES:
+            raise ValueError(f"Priorità non valida: {name} (attese: {', '.join(PRIORITIES)})")
+        self._name = name
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_priority.set(self._name)
+        return self
+
+    def __exit__(self, *exc):
+        _current_priority.reset(self._token)
+        return False
+
+
+class TokenBucket:
+    """
+    per_minute unità al minuto, con raffica massima pari a un minuto di capacità.
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Secondi da attendere perché ci siano amount unità (una richiesta più
+        grande della capacità passa a bucket pieno).
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _ModelState:
+    def __init__(self, limits: dict):
+        self.requests = TokenBucket(limits["rpm"]) if limits.get("rpm") else None
+        self.tokens = TokenBucket(limits["tpm"]) if limits.get("tpm") else None
+        self.cooldown_until = 0.0
+        self.queue = []  # heap di (priorità, ordine di arrivo)
+
+    @property
+    def limited(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+
+def estimate_tokens(params: dict) -> int:
+    """
+    Stima pre-volo dei token di una richiesta: prompt (messaggi e tool) più il completamento atteso.
+    """
+    prompt = json.dumps([params.get("messages", []), params.get("tools") or []], ensure_ascii=False, default=str)
+    completion = params.get("max_completion_tokens") or params.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return count_tokens(prompt) + completion * (params.get("n") or 1)
+
+
+def retry_after(error) -> float:
+    """
+    Attesa suggerita dal server (header retry-after-ms o retry-after), oppure None.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class RequestScheduler:
+    """
+    limits: {modello: {"rpm": richieste al minuto, "tpm": token al minuto}}.
+    Il backoff del tentativo k è uniforme in [0, min(max_backoff, base_backoff * 2**k)],
+    o il retry-after indicato dal server.
+    """
+    def __init__(self, limits: dict = None, max_retries: int = 6, base_backoff: float = 0.5, max_backoff: float = 30.0):
+        self.limits = limits or {}
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._models = {}
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "queued_seconds": 0.0}
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            with self._cond:
+                state = self._models.setdefault(model, _ModelState(self.limits.get(model, {})))
+        return state
+
+    def _try_acquire(self, state: _ModelState, ticket, tokens: int):
+        """
+        0 se la richiesta può partire (e ne consuma la capacità), altrimenti i
+        secondi da attendere, o None se davanti in coda c'è qualcun altro.
+        Va chiamata con self._cond acquisito.
+        """
+        now = time.monotonic()
+        if now < state.cooldown_until:
+            return state.cooldown_until - now
+        if state.queue[0] != ticket:
+            return None
+        delay = max(
+            state.requests.wait_time(1, now) if state.requests else 0.0,
+            state.tokens.wait_time(tokens, now) if state.tokens else 0.0,
+        )
+        if delay > 0:
+            return delay
+        if state.requests:
+            state.requests.take(1)
+        if state.tokens:
+            state.tokens.take(tokens)
+        return 0
+
+    def _needs_queue(self, state: _ModelState) -> bool:
+        return state.limited or time.monotonic() < state.cooldown_until
+
+    def acquire(self, model: str, tokens: int, priority: str = None) -> float:
+        """
+        Attende il proprio turno e la capacità del modello; restituisce i secondi attesi.
+        """
+        state = self._state(model)
+        if not self._needs_queue(state):
+            return 0.0
+        start = time.monotonic()
+        with self._cond:
+            ticket = (PRIORITIES[priority or _current_priority.get()], next(self._order))
+            heapq.heappush(state.queue, ticket)
+            try:
+                while (delay := self._try_acquire(state, ticket, tokens)) != 0:
+                    self._cond.wait(delay)
+            finally:
+                state.queue.remove(ticket)
+                heapq.heapify(state.queue)
+                self._cond.notify_all()
+        return time.monotonic() - start
+
+    async def aacquire(self, model: str, tokens: int, priority: str = None) -> float:
+        state = self._state(model)
+        if not self._needs_queue(state):
+            return 0.0
+        start = time.monotonic()
+        with self._cond:
+            ticket = (PRIORITIES[priority or _current_priority.get()], next(self._order))
+            heapq.heappush(state.queue, ticket)
+        try:
+            while True:
+                with self._cond:
+                    delay = self._try_acquire(state, ticket, tokens)
+                if delay == 0:
+                    break
+                await asyncio.sleep(min(delay, 0.05) if delay is not None else 0.005)
+        finally:
+            with self._cond:
+                state.queue.remove(ticket)
+                heapq.heapify(state.queue)
+                self._cond.notify_all()
+        return time.monotonic() - start
+
+    def _backoff(self, model: str, attempt: int, error) -> float:
+        """
+        Attesa prima del prossimo tentativo; un 429 sospende tutto il modello.
+        """
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        if _is_rate_limit(error):
+            state = self._state(model)
+            with self._cond:
+                state.cooldown_until = max(state.cooldown_until, time.monotonic() + delay)
+                self.stats["rate_limited"] += 1
+        with self._cond:
+            self.stats["retries"] += 1
+        return delay
+
+    def _give_up(self, attempt: int, error) -> bool:
+        return attempt >= self.max_retries or getattr(error, "code", None) == "insufficient_quota"
+
+    def _settle(self, model: str, estimated: int, response) -> None:
+        """
+        Corregge il bucket dei token con l'uso effettivo (risposte non in streaming).
+        """
+        state = self._state(model)
+        usage = getattr(response, "usage", None)
+        if state.tokens is None or usage is None:
+            return
+        with self._cond:
+            state.tokens.give_back(estimated - usage.total_tokens)
+            self._cond.notify_all()
+
+    def call(self, create, params: dict, span=None):
+        """
+        create(**params) con limiti, priorità e ripetizioni.
+        """
+        model = params.get("model")
+        tokens = estimate_tokens(params) if self._state(model).limited else 0
+        queued = 0.0
+        for attempt in itertools.count():
+            queued += self.acquire(model, tokens)
+            try:
+                response = create(**params)
+            except _retryable() as error:
+                if self._give_up(attempt, error):
+                    raise
+                time.sleep(self._backoff(model, attempt, error))
+                continue
+            self._record(span, attempt, queued)
+            self._settle(model, tokens, response)
+            return response
+
+    async def acall(self, create, params: dict, span=None):
+        """
+        Come call, per create asincrona.
+        """
+        model = params.get("model")
+        tokens = estimate_tokens(params) if self._state(model).limited else 0
+        queued = 0.0
+        for attempt in itertools.count():
+            queued += await self.aacquire(model, tokens)
+            try:
+                response = await create(**params)
+            except _retryable() as error:
+                if self._give_up(attempt, error):
+                    raise
+                await asyncio.sleep(self._backoff(model, attempt, error))
+                continue
+            self._record(span, attempt, queued)
+            self._settle(model, tokens, response)
+            return response
+
+    def _record(self, span, retries: int, queued: float) -> None:
+        with self._cond:
+            self.stats["requests"] += 1
+            self.stats["queued_seconds"] += queued
+        if span is not None and (retries or queued):
+            span.set(retries=retries, queued_ms=round(queued * 1000, 1))
+
+
+_default_scheduler = None
+_pooled_client = None
+_pooled_async_clients = weakref.WeakKeyDictionary()  # event loop -> client HTTP asincrono
+_default_lock = threading.Lock()
+
+
+def default_scheduler() -> RequestScheduler:
+    """
+    Scheduler condiviso dal processo, configurato da LLM_RATE_LIMITS e LLM_MAX_RETRIES.
+    """
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler(
+                json.loads(os.environ.get("LLM_RATE_LIMITS") or "{}"),
+                max_retries=int(os.environ.get("LLM_MAX_RETRIES", 6)),
+            )
+        return _default_scheduler
+
+
+def pooled_http_client():
+    """
+    Client HTTP keep-alive condiviso da tutti i client OpenAI sincroni del processo.
+    """
+    global _pooled_client
+    with _default_lock:
+        if _pooled_client is None:
+            import openai
+            _pooled_client = openai.DefaultHttpxClient()
+        return _pooled_client
+
+
+def pooled_async_http_client():
+    """
+    Client HTTP asincrono keep-alive condiviso dai client AsyncOpenAI del
+    processo, con gli stessi limiti di pooled_http_client. Le connessioni
+    asincrone appartengono all'event loop che le ha aperte: c'è un client per
+    loop, liberato con il loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _default_lock:
+        client = _pooled_async_clients.get(loop)
+        if client is None:
+            import openai
+            client = _pooled_async_clients[loop] = openai.DefaultAsyncHttpxClient()
+        return client
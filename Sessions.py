@@ -0,0 +1,262 @@
+"""
+Server asincrono di conversazioni per MAS.py: molte sessioni contemporanee in
+un solo processo.
+
+Le definizioni degli agenti (istruzioni, modello, tool) sono condivise; ogni
+sessione ha solo il proprio stato: la memoria di ogni agente e l'agente a cui
+tocca il prossimo messaggio. I turni di una sessione sono serializzati (o
+limitati a max_turns_per_session), quelli di sessioni diverse procedono in
+parallelo fino a max_active_turns; le sessioni inattive da più di idle_timeout
+secondi vengono rimosse dalla memoria.
+
+Con un ConversationStore (default nel server: ConversationStore.default_store())
+i messaggi vengono salvati su disco man mano e in RAM resta solo la finestra
+usata per i prompt; una sessione rimossa per inattività, o dopo un riavvio del
+server, riprende dal disco con il suo agente corrente.
+
+Protocollo del server (una riga JSON per messaggio, su TCP):
+    -> {"session": "abc", "message": "Crea un file...", "stream": false}
+    <- {"session": "abc", "type": "token", "agent": "...", "content": "..."}   (solo con stream)
+    <- {"session": "abc", "type": "reply", "agent": "...", "content": "..."}
+Senza "session" viene creata una nuova sessione, il cui id è nella risposta.
+
+Uso: python Sessions.py --host 127.0.0.1 --port 8765
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import MAS
+from ConversationStore import DEFAULT_WINDOW, ConversationStore, SessionMemories, default_store
+from Routing import default_policy
+from Tracing import get_tracer
+
+
+class Session:
+    """
+    Stato di una conversazione: memoria per agente e agente corrente.
+    """
+    def __init__(self, session_id: str, agent, max_turns: int = 1, memories=None):
+        self.id = session_id
+        self.agent = agent
+        self.memories = memories if memories is not None else {}
+        self.created = self.last_active = time.monotonic()
+        self.turns = 0
+        self.active = 0
+        self._semaphore = asyncio.Semaphore(max_turns)
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+    def idle_for(self, now: float = None) -> float:
+        return (now or time.monotonic()) - self.last_active
+
+
+class SessionManager:
+    """
+    Gestisce le sessioni e ne esegue i turni con MAS.aiter_full_turn.
+    store (opzionale) rende le conversazioni persistenti; window è il numero
+    massimo di messaggi per agente tenuti in RAM.
+    """
+    def __init__(self, entry_agent=None, max_sessions: int = 10000, idle_timeout: float = 1800,
+                 max_turns_per_session: int = 1, max_active_turns: int = 256,
+                 store: ConversationStore = None, window: int = DEFAULT_WINDOW):
+        self.entry_agent = entry_agent or MAS.triage_agent
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_turns_per_session = max_turns_per_session
+        self.store = store
+        self.window = window
+        self.sessions = {}
+        self._active_turns = asyncio.Semaphore(max_active_turns)
+        self._sweeper = None
+
+    def get(self, session_id: str = None) -> Session:
+        """
+        Restituisce la sessione (creandola, o riprendendola dall'archivio, se non è in memoria).
+        """
+        session = self.sessions.get(session_id) if session_id else None
+        if session is None:
+            if len(self.sessions) >= self.max_sessions:
+                self._evict_least_recent()
+            session_id = session_id or uuid.uuid4().hex
+            agent, memories = self.entry_agent, None
+            if self.store is not None:
+                memories = SessionMemories(self.store, session_id, self.window)
+                agent = MAS.find_agent(self.store.agent(session_id) or "") or self.entry_agent
+            session = self.sessions[session_id] = Session(session_id, agent, self.max_turns_per_session, memories)
+        return session
+
+    def close_session(self, session_id: str, forget: bool = False) -> None:
+        """
+        Rimuove la sessione dalla memoria; con forget=True anche dall'archivio.
+        """
+        self._drop(self.sessions.pop(session_id, None))
+        if forget and self.store is not None:
+            self.store.delete(session_id)
+
+    async def stream_turn(self, session_id: str, message: str, stream: bool = False):
+        """
+        Esegue un turno della sessione e ne restituisce gli eventi (come
+        MAS.iter_full_turn). Il turno gira in un task separato, con la
+        memoria della sessione nel proprio contesto.
+        """
+        session = self.get(session_id)
+        session.active += 1
+        events = asyncio.Queue()
+        task = asyncio.create_task(self._run_turn(session, message, stream, events))
+        try:
+            while True:
+                event = await events.get()
+                if isinstance(event, BaseException):
+                    raise event
+                yield event
+                if event["type"] == "done":
+                    break
+        finally:
+            if not task.done():
+                task.cancel()
+            session.active -= 1
+            session.touch()
+
+    async def run_turn(self, session_id: str, message: str, stream: bool = False):
+        """
+        Esegue un turno e restituisce la Response finale.
+        """
+        async for event in self.stream_turn(session_id, message, stream):
+            if event["type"] == "done":
+                return event["response"]
+
+    async def _run_turn(self, session, message, stream, events):
+        try:
+            async with session._semaphore, self._active_turns:
+                session.touch()
+                with MAS.memory_scope(session.memories), \
+                        get_tracer().span("session.turn", session=session.id, agent=session.agent.name) as span:
+                    async for event in MAS.aiter_full_turn(session.agent, message, stream=stream):
+                        if event["type"] == "done":
+                            session.agent = event["response"].agent
+                            session.turns += 1
+                            if self.store is not None:
+                                self.store.end_turn(session.id, session.agent.name)
+                            span.set(final_agent=session.agent.name)
+                        events.put_nowait(event)
+        except Exception as e:
+            events.put_nowait(e)
+
+    def evict_idle(self, now: float = None) -> int:
+        """
+        Rimuove le sessioni senza turni in corso e inattive da più di idle_timeout.
+        """
+        now = now or time.monotonic()
+        expired = [
+            session_id for session_id, session in self.sessions.items()
+            if not session.active and session.idle_for(now) > self.idle_timeout
+        ]
+        for session_id in expired:
+            self._drop(self.sessions.pop(session_id))
+        return len(expired)
+
+    def _evict_least_recent(self) -> None:
+        idle = [session for session in self.sessions.values() if not session.active]
+        if not idle:
+            raise RuntimeError(f"Troppe sessioni attive (massimo {self.max_sessions}).")
+        self._drop(self.sessions.pop(min(idle, key=lambda session: session.last_active).id))
+
+    @staticmethod
+    def _drop(session) -> None:
+        # i riassunti in background della sessione non servono più
+        if session is not None:
+            for memory in session.memories.values():
+                MAS.compactor.discard(memory)
+
+    def start(self) -> None:
+        """
+        Avvia la rimozione periodica delle sessioni inattive (richiede un event loop attivo).
+        """
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 4, 1))
+            self.evict_idle()
+            if self.store is not None:
+                self.store.purge()
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for session in self.sessions.values():
+            self._drop(session)
+        self.sessions.clear()
+        default_policy().stats.save()
+
+
+async def handle_client(manager: SessionManager, reader, writer):
+    """
+    Una connessione TCP: richieste e risposte sono righe JSON (vedi docstring del modulo).
+    """
+    async def send(payload):
+        writer.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
+
+    try:
+        while line := await reader.readline():
+            try:
+                request = json.loads(line)
+                session = manager.get(request.get("session"))
+                reply = None
+                async for event in manager.stream_turn(session.id, request["message"], request.get("stream", False)):
+                    if event["type"] == "token":
+                        await send({"session": session.id, "type": "token",
+                                    "agent": event["agent"], "content": event["content"]})
+                    elif event["type"] == "message" and event["message"].content:
+                        reply = event["message"].content
+                    elif event["type"] == "done":
+                        await send({"session": session.id, "type": "reply",
+                                    "agent": event["response"].agent.name, "content": reply})
+            except (ValueError, KeyError, TypeError) as e:
+                await send({"type": "error", "error": f"Richiesta non valida: {e}"})
+            except Exception as e:
+                await send({"type": "error", "error": str(e)})
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8765, **options):
+    manager = SessionManager(**options)
+    manager.start()
+    server = await asyncio.start_server(lambda r, w: handle_client(manager, r, w), host, port)
+    print(f"Server MAS in ascolto su {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await manager.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Server di conversazioni multi-sessione per MAS.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--idle-timeout", type=float, default=1800, help="secondi prima di rimuovere una sessione inattiva")
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--max-active-turns", type=int, default=256, help="turni contemporanei nel processo")
+    parser.add_argument("--no-store", action="store_true", help="conversazioni solo in memoria (perse al riavvio)")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, idle_timeout=args.idle_timeout,
+                          max_sessions=args.max_sessions, max_active_turns=args.max_active_turns,
+                          store=None if args.no_store else default_store()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+Verifica statica dei file Python generati, nel processo dell'orchestratore,
+prima di eseguirli con Executor.WorkerPool.
+
+Per ogni file:
+  - compilazione in bytecode (errori di sintassi, con riga e colonna);
+  - import eseguiti al caricamento (corpo del modulo, blocchi with e
+    if __name__ == "__main__"; i blocchi try e gli altri if restano
+    all'esecuzione): i moduli del progetto sono risolti sulla mappa delle
+    cartelle pianificate come li risolverebbe "python file.py" (sys.path[0] è
+    la cartella del file, seguita dalle cartelle di search, es. quelle dei
+    sorgenti per i test eseguiti da TestRunner), gli altri devono essere installati;
+  - nomi presi da moduli del progetto già generati (from m import X, m.X):
+    devono essere definiti al livello più alto del modulo (salvo moduli con
+    __getattr__, import * o globals()).
+
+Gli errori sono riportati nel formato di un traceback Python, così il
+DebuggerAgent li riceve come un errore di esecuzione, ma senza avviare un
+processo. L'analisi di ogni modulo è conservata per contenuto: verificare
+l'intero albero (check_tree) costa una sola analisi per file.
+"""
+import ast
+import importlib.util
+import posixpath
+import sys
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+
+from Tracing import get_tracer
+
+_BLOCK_FIELDS = ("body", "orelse", "finalbody", "handlers", "cases")
+
+
+@dataclass
+class Diagnostic:
+    """
+    Un errore che l'esecuzione del file solleverebbe.
+    """
+    line: int
+    kind: str           # tipo dell'eccezione (SyntaxError, ImportError, ...)
+    message: str
+    source: str = ""    # riga di codice interessata
+    offset: int = None  # colonna (solo errori di sintassi)
+
+
+def format_diagnostics(file_path: str, diagnostics: list) -> str:
+    """
+    Testo nel formato di un traceback Python, come lo stderr di un'esecuzione.
+    """
+    blocks = []
+    for diagnostic in diagnostics:
+        block = f'  File "{file_path}", line {diagnostic.line}\n'
+        if diagnostic.source:
+            block += f"    {diagnostic.source.strip()}\n"
+            if diagnostic.offset:
+                indent = len(diagnostic.source) - len(diagnostic.source.lstrip())
+                block += "    " + " " * max(diagnostic.offset - 1 - indent, 0) + "^\n"
+        blocks.append(block + f"{diagnostic.kind}: {diagnostic.message}")
+    return "Verifica statica (il file non è stato eseguito):\n" + "\n".join(blocks) + "\n"
+
+
+@lru_cache(maxsize=None)
+def _installed(name: str) -> bool:
+    if name in sys.modules or name in sys.builtin_module_names:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return True  # nel dubbio decide l'esecuzione
+
+
+def _stored_names(node) -> set:
+    """
+    Nomi assegnati in un'istruzione, esclusi i blocchi annidati.
+    """
+    names = set()
+    for field, value in ast.iter_fields(node):
+        if field in _BLOCK_FIELDS:
+            continue
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, ast.AST):
+                names.update(n.id for n in ast.walk(item) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store))
+    return names
+
+
+def _blocks(node) -> list:
+    statements = []
+    for field in ("body", "orelse", "finalbody"):
+        statements.extend(getattr(node, field, None) or [])
+    for child in (getattr(node, "handlers", None) or []) + (getattr(node, "cases", None) or []):
+        statements.extend(child.body)
+    return statements
+
+
+def _is_main_guard(test) -> bool:
+    return (
+        isinstance(test, ast.Compare) and isinstance(test.left, ast.Name) and test.left.id == "__name__"
+        and any(isinstance(c, ast.Constant) and c.value == "__main__" for c in test.comparators)
+    )
+
+
+def _executed_imports(body: list):
+    """
+    Import eseguiti sicuramente al caricamento del modulo come script.
+    """
+    for statement in body:
+        if isinstance(statement, (ast.Import, ast.ImportFrom)):
+            yield statement
+        elif isinstance(statement, (ast.With, ast.AsyncWith)):
+            yield from _executed_imports(statement.body)
+        elif isinstance(statement, ast.If) and _is_main_guard(statement.test):
+            yield from _executed_imports(statement.body)
+
+
+class _Module:
+    """
+    Analisi di un modulo: albero sintattico e nomi definiti al livello più alto.
+    """
+    def __init__(self, tree: ast.Module):
+        self.tree = tree
+        self.names = set()
+        self.dynamic = any(isinstance(n, ast.Name) and n.id in ("globals", "vars") for n in ast.walk(tree))
+        self._bind(tree.body)
+
+    def _bind(self, body: list) -> None:
+        # tutti i rami contano: meglio accettare un nome in più che segnalare un falso errore
+        for statement in body:
+            if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.names.add(statement.name)
+                if statement.name == "__getattr__":
+                    self.dynamic = True
+                continue
+            if isinstance(statement, ast.Import):
+                self.names.update(alias.asname or alias.name.split(".")[0] for alias in statement.names)
+            elif isinstance(statement, ast.ImportFrom):
+                for alias in statement.names:
+                    if alias.name == "*":
+                        self.dynamic = True
+                    self.names.add(alias.asname or alias.name)
+            else:
+                self.names.update(_stored_names(statement))
+            self._bind(_blocks(statement))
+
+
+class _Project:
+    """
+    File e cartelle pianificati, con percorsi relativi separati da "/".
+    """
+    def __init__(self, folders: dict, files: dict):
+        self.files = {posixpath.join(folder, name) for folder, names in folders.items() for name in names}
+        self.files.update(path.replace("\\", "/") for path in files)
+        self.dirs = set(folders)
+        for path in self.files:
+            parent = posixpath.dirname(path)
+            while parent and parent not in self.dirs:
+                self.dirs.add(parent)
+                parent = posixpath.dirname(parent)
+
+    def resolve(self, dotted: str, base: str):
+        """
+        (percorso del modulo del progetto o None, errore o None). Il percorso è
+        un file .py o, per un package, la sua cartella; (None, None) indica un
+        modulo esterno al progetto.
+        """
+        parts = dotted.split(".")
+        current = base
+        for depth, part in enumerate(parts, 1):
+            candidate = posixpath.join(current, part) if current else part
+            last = depth == len(parts)
+            package = candidate in self.dirs
+            if package and posixpath.join(candidate, "__init__.py") in self.files:
+                pass
+            elif candidate + ".py" in self.files:
+                if last:
+                    return candidate + ".py", None
+                name = ".".join(parts[:depth])
+                return None, ("ModuleNotFoundError", f"No module named '{dotted}'; '{name}' is not a package")
+            elif not package:
+                if depth == 1:
+                    return None, None
+                return None, ("ModuleNotFoundError", f"No module named '{'.'.join(parts[:depth])}'")
+            if last:
+                return candidate, None
+            current = candidate
+
+
+class StaticChecker:
+    """
+    Verifica statica dei file di un progetto; folders è la mappa delle cartelle
+    pianificate ({cartella: [file]}), files i file generati ({percorso: codice}).
+    """
+    def __init__(self):
+        self._modules = {}  # (percorso, codice) -> _Module, oppure None se il codice non compila
+        self._lock = threading.Lock()
+
+    def _module(self, relative_path: str, code: str):
+        key = (relative_path, code)
+        with self._lock:
+            if key in self._modules:
+                return self._modules[key]
+        try:
+            module = _Module(ast.parse(code, relative_path))
+        except (SyntaxError, ValueError):
+            module = None
+        with self._lock:
+            self._modules[key] = module
+        return module
+
+    def _exports(self, target: str, project: _Project, files: dict):
+        """
+        Nomi importabili da un modulo del progetto, oppure None se non si possono
+        stabilire (modulo non ancora generato, dinamico o non valido).
+        """
+        if target.endswith(".py"):
+            code = files.get(target)
+            module = self._module(target, code) if code is not None else None
+            return None if module is None or module.dynamic else module.names
+        # package: nomi di __init__.py e sottomoduli
+        names = {posixpath.splitext(posixpath.basename(path))[0]
+                 for path in project.files if posixpath.dirname(path) == target and path.endswith(".py")}
+        names.update(posixpath.basename(folder) for folder in project.dirs if posixpath.dirname(folder) == target)
+        init = posixpath.join(target, "__init__.py")
+        if init in files:
+            module = self._module(init, files[init])
+            if module is None or module.dynamic:
+                return None
+            names.update(module.names)
+        elif init in project.files:
+            return None
+        return names
+
+    def check(self, relative_path: str, code: str, folders: dict, files: dict, search: list = ()) -> list:
+        """
+        Errori del file (lista di Diagnostic, vuota se la verifica è superata).
+        code è il contenuto da verificare (es. un candidato del debugger);
+        search, altre cartelle del progetto nel percorso di import.
+        """
+        with get_tracer().span("code.check", file=relative_path) as span:
+            diagnostics = self._check(relative_path.replace("\\", "/"), code, _Project(folders, files), files, search)
+            span.set(errors=len(diagnostics))
+            return diagnostics
+
+    def check_tree(self, folders: dict, files: dict, search: dict = None) -> dict:
+        """
+        Verifica in una passata tutti i file Python generati: {percorso: [Diagnostic]}
+        per i soli file con errori. search: {percorso: [cartelle]} come in check.
+        """
+        search = search or {}
+        project = _Project(folders, files)
+        results = {}
+        with get_tracer().span("code.check_tree", files=len(files)) as span:
+            for relative_path, code in files.items():
+                if relative_path.endswith(".py"):
+                    diagnostics = self._check(relative_path.replace("\\", "/"), code, project, files,
+                                              search.get(relative_path, ()))
+                    if diagnostics:
+                        results[relative_path] = diagnostics
+            span.set(failed=len(results))
+        return results
+
+    def _check(self, relative_path: str, code: str, project: _Project, files: dict, search=()) -> list:
+        lines = code.splitlines()
+        try:
+            compile(code, relative_path, "exec", dont_inherit=True)
+        except SyntaxError as e:
+            line = e.lineno or 1
+            text = e.text or (lines[line - 1] if 0 < line <= len(lines) else "")
+            return [Diagnostic(line, type(e).__name__, e.msg, text.rstrip("\n"), e.offset)]
+        except ValueError as e:  # es. caratteri nulli nel sorgente
+            return [Diagnostic(1, "SyntaxError", str(e))]
+        module = self._module(relative_path, code)
+        if module is None:
+            return []
+
+        def source(node):
+            return lines[node.lineno - 1] if 0 < node.lineno <= len(lines) else ""
+
+        def resolve(dotted):
+            # prima la cartella del file, poi quelle di search: vince il primo modulo del progetto trovato
+            for folder in (posixpath.dirname(relative_path), *search):
+                target, error = project.resolve(dotted, folder)
+                if target is not None or error:
+                    return target, error
+            return None, None
+
+        diagnostics = []
+        aliases = {}  # nome locale -> (modulo importato, percorso nel progetto)
+        for node in _executed_imports(module.tree.body):
+            if isinstance(node, ast.ImportFrom) and node.level:
+                diagnostics.append(Diagnostic(node.lineno, "ImportError",
+                                              "attempted relative import with no known parent package", source(node)))
+                continue
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    target, error = resolve(alias.name)
+                    if error:
+                        diagnostics.append(Diagnostic(node.lineno, *error, source(node)))
+                    elif target is None and not _installed(alias.name.split(".")[0]):
+                        diagnostics.append(Diagnostic(node.lineno, "ModuleNotFoundError",
+                                                      f"No module named '{alias.name.split('.')[0]}'", source(node)))
+                    elif target is not None and (alias.asname or "." not in alias.name):
+                        aliases[alias.asname or alias.name] = (alias.name, target)
+                continue
+            target, error = resolve(node.module)
+            if error:
+                diagnostics.append(Diagnostic(node.lineno, *error, source(node)))
+            elif target is None:
+                if not _installed(node.module.split(".")[0]):
+                    diagnostics.append(Diagnostic(node.lineno, "ModuleNotFoundError",
+                                                  f"No module named '{node.module.split('.')[0]}'", source(node)))
+            else:
+                exports = self._exports(target, project, files)
+                for alias in node.names:
+                    if exports is not None and alias.name != "*" and alias.name not in exports:
+                        diagnostics.append(Diagnostic(
+                            node.lineno, "ImportError",
+                            f"cannot import name '{alias.name}' from '{node.module}' ({target})", source(node),
+                        ))
+
+        # m.X con m modulo del progetto importato e mai riassegnato
+        rebound = {n.id for n in ast.walk(module.tree) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)}
+        rebound.update(n.arg for n in ast.walk(module.tree) if isinstance(n, ast.arg))
+        for name, (dotted, target) in aliases.items():
+            exports = None if name in rebound else self._exports(target, project, files)
+            if exports is None:
+                continue
+            for node in ast.walk(module.tree):
+                if (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == name
+                        and isinstance(node.ctx, ast.Load) and node.attr not in exports):
+                    diagnostics.append(Diagnostic(node.lineno, "AttributeError",
+                                                  f"module '{dotted}' has no attribute '{node.attr}'", source(node)))
+        return sorted(diagnostics, key=lambda d: d.line)
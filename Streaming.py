@@ -0,0 +1,89 @@
+"""
+Utility per le risposte in streaming di chat.completions.create(stream=True):
+accumulano i frammenti (testo e tool call) man mano che arrivano, così chi
+chiama può reagire al primo token invece di attendere la risposta completa.
+"""
+import re
+
+# Stesso formato riconosciuto da extract_code in AgentDeveloper.py
+_CODE_BLOCK = re.compile(r"```(?:[\w+]*)\n(.*?)```", re.DOTALL)
+
+
+class StreamAccumulator:
+    """
+    Ricostruisce il messaggio dell'assistente a partire dai chunk dello stream.
+    I delta delle tool call arrivano spezzati (id e nome nel primo chunk, argomenti
+    JSON a pezzi nei successivi) e vengono uniti per indice.
+    """
+    def __init__(self):
+        self.content = []
+        self.tool_calls = {}  # {index: {"id": ..., "type": "function", "function": {...}}}
+        self.finish_reason = None
+
+    def feed(self, chunk) -> str:
+        """
+        Aggiunge un chunk e restituisce il testo nuovo (stringa vuota se il chunk
+        contiene solo tool call o metadati).
+        """
+        if not chunk.choices:
+            return ""
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        delta = choice.delta
+        for tool_call in delta.tool_calls or []:
+            entry = self.tool_calls.setdefault(
+                tool_call.index,
+                {"id": "", "type": "function", "function": {"name": "", "arguments": ""}},
+            )
+            if tool_call.id:
+                entry["id"] = tool_call.id
+            if tool_call.function:
+                if tool_call.function.name:
+                    entry["function"]["name"] += tool_call.function.name
+                if tool_call.function.arguments:
+                    entry["function"]["arguments"] += tool_call.function.arguments
+        if delta.content:
+            self.content.append(delta.content)
+            return delta.content
+        return ""
+
+    def message(self):
+        """
+        Il messaggio completo (ChatCompletionMessage), nello stesso formato di response.choices[0].message.
+        """
+        from openai.types.chat import ChatCompletionMessage
+        return ChatCompletionMessage.model_validate({
+            "role": "assistant",
+            "content": "".join(self.content) or None,
+            "tool_calls": [self.tool_calls[i] for i in sorted(self.tool_calls)] or None,
+        })
+
+
+def iter_text(stream):
+    """
+    Generatore dei soli frammenti di testo di uno stream.
+    """
+    accumulator = StreamAccumulator()
+    for chunk in stream:
+        text = accumulator.feed(chunk)
+        if text:
+            yield text
+
+
+class CodeFenceWatcher:
+    """
+    Segue il testo in arrivo e rende disponibile il primo blocco ```...```
+    non appena il delimitatore di chiusura è arrivato.
+    """
+    def __init__(self):
+        self.text = ""
+        self.code = None
+
+    def feed(self, delta: str):
+        self.text += delta
+        if self.code is None and "`" in delta:
+            match = _CODE_BLOCK.search(self.text)
+            if match:
+                self.code = match.group(1)
+        return self.code
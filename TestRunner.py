@@ -0,0 +1,465 @@
+"""
+Esecuzione dei test dei progetti generati, divisa in shard paralleli.
+
+discover_tests trova i file di test (test_*.py, *_test.py) e, senza
+importarli, le loro unità: metodi test* delle classi unittest.TestCase (o
+delle classi Test* in stile pytest) e funzioni test_*. Ogni unità ha un id
+"percorso::Classe::metodo" oppure "percorso::funzione".
+
+TestRunner distribuisce le unità su workers shard (default: uno per core),
+bilanciando le durate misurate nelle esecuzioni precedenti. Ogni shard è un
+processo "python TestRunner.py --shard" che importa i moduli di test ed esegue
+le sue unità una alla volta, con un timeout per test (SIGALRM, dove c'è) e un
+timeout complessivo dello shard; per ogni unità restituisce un TestResult
+(esito, traceback, durata, output).
+
+TestReport.failures() elenca solo le unità fallite; TestRunner.rerun() riesegue
+solo gli shard che contenevano fallimenti e conserva gli altri risultati.
+L'ultimo report viene salvato in REPORT_NAME nella cartella del progetto.
+
+Uso: python TestRunner.py cartella [--workers N] [--timeout S] [--path DIR] [--failed] [--json]
+"""
+import argparse
+import ast
+import contextlib
+import importlib.util
+import inspect
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+REPORT_NAME = ".test_report.json"
+FAILED_OUTCOMES = ("failed", "error", "timeout")
+MAX_OUTPUT = 4000  # caratteri di output conservati per test
+SHARD_STARTUP = 10.0  # secondi concessi a ogni shard oltre ai timeout dei suoi test
+
+
+def is_test_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+
+def source_folders(root: str) -> list:
+    """
+    Cartelle sotto root con moduli Python che non sono test, dalle meno
+    profonde: il percorso di import di default dei test.
+    """
+    folders = []
+    for directory, subdirectories, file_names in os.walk(root):
+        subdirectories[:] = sorted(d for d in subdirectories if not d.startswith((".", "__")))
+        if any(name.endswith(".py") and not is_test_file(name) for name in file_names):
+            folders.append(directory)
+    return sorted(folders, key=lambda folder: (os.path.relpath(folder, root).count(os.sep), folder))
+
+
+def _is_test_class(node: ast.ClassDef) -> bool:
+    bases = [base.attr if isinstance(base, ast.Attribute) else getattr(base, "id", "") for base in node.bases]
+    return node.name.startswith("Test") or any(base.endswith("TestCase") for base in bases)
+
+
+def discover_tests(root: str, paths: list = None) -> list:
+    """
+    Id delle unità di test dei file di test sotto root; paths (relativi a root)
+    limita la ricerca a quei file. Un file che non compila diventa un'unità
+    "percorso", che fallirà con l'errore di import.
+    """
+    if paths is None:
+        paths = []
+        for directory, subdirectories, file_names in os.walk(root):
+            subdirectories[:] = sorted(d for d in subdirectories if not d.startswith((".", "__")))
+            paths.extend(os.path.relpath(os.path.join(directory, name), root)
+                         for name in sorted(file_names) if is_test_file(name))
+    units = []
+    for relative_path in paths:
+        relative_path = relative_path.replace("\\", "/")
+        try:
+            with open(os.path.join(root, relative_path), "r", encoding="utf-8") as f:
+                tree = ast.parse(f.read(), relative_path)
+        except (OSError, SyntaxError, ValueError):
+            units.append(relative_path)
+            continue
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and _is_test_class(node):
+                units.extend(
+                    f"{relative_path}::{node.name}::{item.name}" for item in node.body
+                    if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name.startswith("test")
+                )
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+                units.append(f"{relative_path}::{node.name}")
+    return units
+
+
+@dataclass
+class TestResult:
+    test_id: str
+    outcome: str             # passed, failed, error, skipped, timeout
+    duration: float = 0.0
+    traceback: str = ""
+    output: str = ""
+
+    @property
+    def path(self) -> str:
+        return self.test_id.split("::")[0]
+
+    @property
+    def failed(self) -> bool:
+        return self.outcome in FAILED_OUTCOMES
+
+
+class TestReport:
+    """
+    Risultati di un'esecuzione: shard (liste di id) e {id: TestResult}.
+    """
+    def __init__(self, shards: list, results: dict, duration: float = 0.0):
+        self.shards = shards
+        self.results = results
+        self.duration = duration
+
+    def failures(self) -> list:
+        return [result for result in self.results.values() if result.failed]
+
+    def failed_shards(self) -> list:
+        return [shard for shard in self.shards if any(self.results[test_id].failed for test_id in shard)]
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures()
+
+    def counts(self) -> dict:
+        counts = {}
+        for result in self.results.values():
+            counts[result.outcome] = counts.get(result.outcome, 0) + 1
+        return counts
+
+    def summary(self) -> str:
+        counts = self.counts()
+        return (
+            f"Test: {counts.get('passed', 0)} superati, {counts.get('failed', 0)} falliti, "
+            f"{counts.get('error', 0)} errori, {counts.get('timeout', 0)} interrotti, "
+            f"{counts.get('skipped', 0)} saltati in {len(self.shards)} shard ({self.duration:.2f} s)"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "shards": self.shards,
+            "duration": round(self.duration, 4),
+            "results": [asdict(result) for result in self.results.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TestReport":
+        results = {item["test_id"]: TestResult(**item) for item in data["results"]}
+        return cls(data["shards"], results, data.get("duration", 0.0))
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path: str):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+
+class TestRunner:
+    """
+    Esegue unità di test del progetto in root in shard paralleli. sys_path:
+    cartelle aggiunte al percorso di import dei test (oltre a root e alla
+    cartella di ogni file di test); timeout: secondi per singolo test.
+    """
+    def __init__(self, root: str, workers: int = None, timeout: float = 10.0, sys_path: list = None,
+                 python: str = None):
+        self.root = os.path.abspath(root)
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.timeout = timeout
+        self.sys_path = [os.path.abspath(path) for path in sys_path or []]
+        self.python = python or sys.executable
+        self.durations = {}  # id -> durata dell'ultima esecuzione
+        self._lock = threading.Lock()
+
+    def shard(self, units: list) -> list:
+        """
+        Divide le unità in al massimo workers shard di durata simile (le più
+        lunghe per prime, ognuna nello shard meno carico).
+        """
+        count = min(self.workers, len(units))
+        shards = [[] for _ in range(count)]
+        loads = [0.0] * count
+        for test_id in sorted(units, key=lambda unit: -self.durations.get(unit, 0.1)):
+            index = loads.index(min(loads))
+            shards[index].append(test_id)
+            loads[index] += self.durations.get(test_id, 0.1)
+        return [sorted(shard) for shard in shards if shard]
+
+    def run(self, units: list) -> TestReport:
+        return self.run_shards(self.shard(units))
+
+    def run_shards(self, shards: list) -> TestReport:
+        # import locale: il processo di uno shard usa solo la libreria standard
+        from Tracing import get_tracer
+
+        start = time.monotonic()
+        with get_tracer().span("tests.run", shards=len(shards), tests=sum(map(len, shards))) as span:
+            results = {}
+            if shards:
+                with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+                    for shard_results in pool.map(self._run_shard, shards):
+                        results.update((result.test_id, result) for result in shard_results)
+            report = TestReport(shards, results, time.monotonic() - start)
+            span.set(failed=len(report.failures()))
+        return report
+
+    def rerun(self, report: TestReport, failed_only: bool = False) -> TestReport:
+        """
+        Riesegue gli shard con test falliti (con failed_only, solo i test
+        falliti) e restituisce il report aggiornato, con gli stessi shard.
+        """
+        if failed_only:
+            shards = [[test_id for test_id in shard if report.results[test_id].failed]
+                      for shard in report.failed_shards()]
+        else:
+            shards = report.failed_shards()
+        partial = self.run_shards(shards)
+        results = dict(report.results)
+        results.update(partial.results)
+        return TestReport(report.shards, results, partial.duration)
+
+    def _run_shard(self, units: list) -> list:
+        """
+        Esegue le unità in un processo. Se il processo termina prima della fine
+        (crash, os._exit, timeout complessivo), il primo test senza risultato
+        viene segnato come errore e i successivi ripartono in un nuovo processo.
+        """
+        results = []
+        remaining = list(units)
+        while remaining:
+            done, stderr = self._spawn(remaining)
+            for test_id in remaining:
+                if test_id not in done:
+                    break
+                results.append(done[test_id])
+            else:
+                break
+            crashed = remaining.index(test_id)
+            results.append(TestResult(
+                test_id, "error",
+                traceback=f"Il processo dello shard si è interrotto durante il test.\n{stderr[-MAX_OUTPUT:]}",
+            ))
+            remaining = remaining[crashed + 1:]
+        with self._lock:
+            self.durations.update((result.test_id, result.duration) for result in results)
+        return results
+
+    def _spawn(self, units: list):
+        """
+        ({id: TestResult} dei test completati, stderr del processo).
+        """
+        job = {"root": self.root, "sys_path": self.sys_path, "units": units, "timeout": self.timeout}
+        with tempfile.TemporaryDirectory(prefix="shard_") as directory:
+            job_file, output_file = os.path.join(directory, "job.json"), os.path.join(directory, "results.jsonl")
+            with open(job_file, "w", encoding="utf-8") as f:
+                json.dump(job, f)
+            try:
+                stderr = subprocess.run(
+                    [self.python, os.path.abspath(__file__), "--shard", job_file, output_file],
+                    cwd=self.root, capture_output=True, text=True,
+                    timeout=SHARD_STARTUP + self.timeout * len(units),
+                ).stderr
+            except subprocess.TimeoutExpired:
+                stderr = "timeout complessivo dello shard superato"
+            done = {}
+            if os.path.exists(output_file):
+                with open(output_file, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            item = json.loads(line)
+                        except ValueError:  # ultima riga interrotta
+                            break
+                        done[item["test_id"]] = TestResult(**item)
+        return done, stderr
+
+
+#################################################################
+#                     PROCESSO DI UNO SHARD                     #
+#################################################################
+
+class _TestTimeout(BaseException):
+    """
+    Sollevata nel test che supera il timeout (BaseException: "except Exception" non la intercetta).
+    """
+
+
+@contextlib.contextmanager
+def _time_limit(seconds: float):
+    if not seconds or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise _TestTimeout(f"test interrotto dopo {seconds} s")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _format_exception(error: BaseException) -> str:
+    # Nascondiamo i frame del runner: il traceback parte dal codice del progetto
+    tb = error.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename == __file__:
+        tb = tb.tb_next
+    return "".join(traceback.format_exception(type(error), error, tb))
+
+
+def _import_test_module(root: str, relative_path: str):
+    path = os.path.join(root, relative_path)
+    directory = os.path.dirname(path)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    name = "_test_" + relative_path.replace("/", "_").replace(".", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _run_unit(module, names: list):
+    """
+    (esito, traceback) di un'unità già importata.
+    """
+    if len(names) == 2 and isinstance(getattr(module, names[0]), type) \
+            and issubclass(getattr(module, names[0]), unittest.TestCase):
+        result = unittest.TestResult()
+        unittest.defaultTestLoader.loadTestsFromName(names[1], getattr(module, names[0])).run(result)
+        if result.errors:
+            details = result.errors[0][1]
+            # unittest intercetta anche le BaseException: il timeout arriva come errore
+            return ("timeout" if _TestTimeout.__name__ in details else "error"), details
+        if result.failures:
+            return "failed", result.failures[0][1]
+        if result.unexpectedSuccesses:
+            return "failed", "successo inatteso di un test marcato expectedFailure"
+        return ("skipped", result.skipped[0][1]) if result.skipped else ("passed", "")
+
+    if len(names) == 2:  # classe in stile pytest
+        instance = getattr(module, names[0])()
+        if hasattr(instance, "setup_method"):
+            instance.setup_method(getattr(instance, names[1]))
+        test = getattr(instance, names[1])
+    else:
+        test = getattr(module, names[0])
+    required = [p.name for p in inspect.signature(test).parameters.values() if p.default is p.empty]
+    if required:
+        return "error", f"fixture non supportate dal runner: {', '.join(required)}"
+    try:
+        outcome = test()
+        if inspect.iscoroutine(outcome):
+            import asyncio
+            asyncio.run(outcome)
+    except AssertionError as e:
+        return "failed", _format_exception(e)
+    except unittest.SkipTest as e:
+        return "skipped", str(e)
+    finally:
+        if len(names) == 2 and hasattr(instance, "teardown_method"):
+            instance.teardown_method(test)
+    return "passed", ""
+
+
+def _run_shard_units(job: dict, output) -> None:
+    """
+    Esegue le unità del job e scrive ogni risultato su output (una riga JSON
+    per test, subito), così un crash non cancella i risultati precedenti.
+    """
+    root = job["root"]
+    os.chdir(root)
+    # al posto della cartella di TestRunner.py: i moduli dell'orchestratore non devono coprire quelli del progetto
+    sys.path[:1] = [root] + [path for path in job["sys_path"] if path != root]
+    modules = {}  # percorso -> modulo, oppure l'eccezione dell'import
+    for test_id in job["units"]:
+        relative_path, *names = test_id.split("::")
+        captured = io.StringIO()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(captured), contextlib.redirect_stderr(captured), \
+                    _time_limit(job["timeout"]):
+                if relative_path not in modules:
+                    try:
+                        modules[relative_path] = _import_test_module(root, relative_path)
+                    except BaseException as e:
+                        if isinstance(e, (KeyboardInterrupt, _TestTimeout)):
+                            raise
+                        modules[relative_path] = e
+                module = modules[relative_path]
+                if isinstance(module, BaseException):
+                    outcome, details = "error", _format_exception(module)
+                elif not names:
+                    outcome, details = "error", "il file di test non contiene unità eseguibili"
+                else:
+                    outcome, details = _run_unit(module, names)
+        except _TestTimeout as e:
+            outcome, details = "timeout", _format_exception(e)
+        except SystemExit as e:
+            outcome, details = "error", f"il test ha chiamato sys.exit({e.code!r})"
+        except Exception as e:
+            outcome, details = "error", _format_exception(e)
+        result = TestResult(test_id, outcome, round(time.perf_counter() - start, 4), details,
+                            captured.getvalue()[-MAX_OUTPUT:])
+        output.write(json.dumps(asdict(result)) + "\n")
+        output.flush()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Esegue i test di un progetto generato in shard paralleli.")
+    parser.add_argument("root", help="cartella del progetto")
+    parser.add_argument("--workers", type=int, default=None, help="shard paralleli (default: numero di core)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="secondi per singolo test")
+    parser.add_argument("--path", action="append", default=None,
+                        help="cartella da aggiungere al percorso di import (default: quelle con moduli non di test)")
+    parser.add_argument("--failed", action="store_true", help="riesegue solo gli shard falliti dell'ultimo report")
+    parser.add_argument("--json", action="store_true", help="report JSON su stdout")
+    args = parser.parse_args(argv)
+
+    sys_path = args.path if args.path is not None else source_folders(args.root)
+    runner = TestRunner(args.root, workers=args.workers, timeout=args.timeout, sys_path=sys_path)
+    report_path = os.path.join(args.root, REPORT_NAME)
+    previous = TestReport.load(report_path) if args.failed else None
+    if previous is not None:
+        report = runner.rerun(previous)
+    else:
+        report = runner.run(discover_tests(args.root))
+    report.save(report_path)
+    if args.json:
+        print(json.dumps(report.to_dict(), ensure_ascii=False))
+    else:
+        for result in report.failures():
+            print(f"\n--- {result.test_id} ({result.outcome}) ---\n{result.traceback}")
+        print(report.summary())
+    return 0 if report.passed else 1
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--shard"]:
+    with open(sys.argv[2], "r", encoding="utf-8") as job_file:
+        shard_job = json.load(job_file)
+    with open(sys.argv[3], "w", encoding="utf-8") as results_file:
+        _run_shard_units(shard_job, results_file)
+elif __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Tracing e metriche per MAS.py e AgentDeveloper.py.
+
+Ogni operazione interessante (chiamata LLM, esecuzione di un tool, handoff,
+esecuzione di codice, ciclo di debug, generazione di un file) apre uno span
+con latenza e attributi (agente, modello, token di prompt/completamento/cache).
+
+Di default il tracer è un no-op dal costo trascurabile. Con configure_tracing(path)
+o la variabile d'ambiente TRACE_FILE gli span vengono scritti in un file JSONL
+(un oggetto per riga, con i campi di uno span OTLP: traceId, spanId,
+parentSpanId, name, startTimeUnixNano, endTimeUnixNano, attributes, status).
+Il riepilogo di fine esecuzione è aggiornato man mano che gli span si
+chiudono; in memoria restano solo gli ultimi MAX_SPANS span (Tracer.spans),
+così un processo di lunga durata (es. Sessions.py) non cresce senza limite.
+
+Riepilogo di un file già scritto: python Tracing.py trace.jsonl
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+MAX_SPANS = 10000  # span recenti conservati in memoria da Tracer
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_agent = contextvars.ContextVar("current_agent", default=None)
+
+
+class agent_scope:
+    """
+    Context manager che indica per conto di quale agente vengono aperti gli
+    span (es. le chiamate LLM fatte dal livello di completamento).
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_agent.set(self._name)
+        return self
+
+    def __exit__(self, *exc):
+        _current_agent.reset(self._token)
+        return False
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attributes", "status")
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        if "agent" not in attributes and _current_agent.get() is not None:
+            attributes["agent"] = _current_agent.get()
+        self.start = time.time_ns()
+        self.end = None
+        self.status = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> float:
+        return ((self.end or time.time_ns()) - self.start) / 1e9
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start,
+            "endTimeUnixNano": self.end,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class _SpanContext:
+    def __init__(self, tracer, name, attributes):
+        self._tracer = tracer
+        self._span = Span(name, _current_span.get(), attributes)
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        self._tracer.finish(self._span, exc)
+        return False
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class NoopTracer:
+    """
+    Tracer disattivato: span() restituisce sempre lo stesso oggetto vuoto.
+    """
+    enabled = False
+
+    def span(self, name, **attributes):
+        return _NOOP_SPAN
+
+    def start_span(self, name, **attributes):
+        return _NOOP_SPAN
+
+    def finish(self, span, error=None):
+        pass
+
+    def summary(self) -> str:
+        return ""
+
+
+class Tracer:
+    """
+    Tracer attivo: esporta gli span su file JSONL (se path è dato) e ne
+    aggrega tempi e token per summary(); spans contiene gli ultimi max_spans.
+    """
+    enabled = True
+
+    def __init__(self, path: str = None, max_spans: int = MAX_SPANS):
+        self.path = path
+        self.spans = deque(maxlen=max_spans)
+        self._totals = _Totals()
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    def span(self, name, **attributes):
+        """
+        Context manager: lo span diventa il padre degli span aperti al suo interno.
+        """
+        return _SpanContext(self, name, attributes)
+
+    def start_span(self, name, **attributes) -> Span:
+        """
+        Span che non diventa corrente e va chiuso con finish(), per operazioni
+        che durano oltre il blocco che le avvia (es. risposte in streaming).
+        """
+        return Span(name, _current_span.get(), attributes)
+
+    def finish(self, span, error=None) -> None:
+        if span.end is not None:
+            return
+        span.end = time.time_ns()
+        if error is not None:
+            span.status = "error"
+            span.attributes["error"] = f"{type(error).__name__}: {error}"
+        record = span.to_dict()
+        with self._lock:
+            self.spans.append(span)
+            self._totals.add(record)
+            if self._file:
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                self._file.flush()
+
+    def summary(self) -> str:
+        with self._lock:
+            return self._totals.render()
+
+
+class _Totals:
+    """
+    Tempo e token per tipo di span, agente e modello, sommati span per span.
+    """
+    def __init__(self):
+        self.groups = {"span": {}, "agent": {}, "model": {}}
+        self.llm_calls = 0
+        self.cache_hits = 0
+
+    def add(self, span: dict) -> None:
+        attributes = span["attributes"]
+        self._add("span", span["name"], span)
+        if span["name"] != "llm.call":
+            return
+        self.llm_calls += 1
+        self.cache_hits += attributes.get("cache") == "hit"
+        self._add("agent", attributes.get("agent", "?"), span)
+        if attributes.get("model") is not None:
+            self._add("model", attributes["model"], span)
+
+    def _add(self, kind: str, group, span: dict) -> None:
+        row = self.groups[kind].setdefault(
+            group, {"count": 0, "seconds": 0.0, "prompt": 0, "completion": 0, "cached": 0}
+        )
+        attributes = span["attributes"]
+        row["count"] += 1
+        row["seconds"] += (span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e9
+        row["prompt"] += attributes.get("prompt_tokens", 0) or 0
+        row["completion"] += attributes.get("completion_tokens", 0) or 0
+        row["cached"] += attributes.get("cached_tokens", 0) or 0
+
+    def render(self) -> str:
+        def table(title, rows):
+            lines = [f"{title:<32}{'count':>7}{'total s':>10}{'mean ms':>10}{'prompt':>10}{'compl.':>9}{'cached':>9}"]
+            for group, row in sorted(rows.items(), key=lambda item: -item[1]["seconds"]):
+                lines.append(
+                    f"{str(group)[:31]:<32}{row['count']:>7}{row['seconds']:>10.2f}"
+                    f"{row['seconds'] / row['count'] * 1000:>10.1f}{row['prompt']:>10}{row['completion']:>9}{row['cached']:>9}"
+                )
+            return "\n".join(lines)
+
+        return "\n\n".join([
+            "=== RIEPILOGO TRACE ===",
+            table("span", self.groups["span"]),
+            table("agente (chiamate LLM)", self.groups["agent"]),
+            table("modello (chiamate LLM)", self.groups["model"]),
+            f"chiamate LLM: {self.llm_calls}, da cache: {self.cache_hits}",
+        ])
+
+
+def summarize(spans) -> str:
+    """
+    Tabella del tempo e dei token per tipo di span, agente e modello (spans:
+    iterabile di span nel formato JSONL esportato).
+    """
+    totals = _Totals()
+    for span in spans:
+        totals.add(span)
+    return totals.render()
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def configure_tracing(path: str = None):
+    """
+    Attiva il tracing (su file JSONL se path è dato) e restituisce il tracer.
+    """
+    global _tracer
+    with _tracer_lock:
+        _tracer = Tracer(path)
+        return _tracer
+
+
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                path = os.environ.get("TRACE_FILE")
+                _tracer = Tracer(path) if path else NoopTracer()
+    return _tracer
+
+
+def record_usage(span, usage) -> None:
+    """
+    Copia sullo span i token riportati da response.usage (se presenti).
+    """
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    span.set(
+        prompt_tokens=usage.prompt_tokens,
+        completion_tokens=usage.completion_tokens,
+        cached_tokens=getattr(details, "cached_tokens", 0) or 0,
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python Tracing.py trace.jsonl")
+        sys.exit(1)
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        print(summarize(json.loads(line) for line in f if line.strip()))
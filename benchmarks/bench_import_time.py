@@ -0,0 +1,51 @@
+"""
+Microbenchmark: tempo di avvio a freddo di un processo che importa i moduli
+dell'orchestratore (come un worker, un test o uno strumento), confrontato con
+lo stesso import seguito dalla creazione del client OpenAI (il costo che prima
+si pagava già all'import).
+
+Ogni misura è la mediana di N processi Python nuovi; "openai" indica se l'SDK
+risulta caricato dopo l'import.
+
+Uso: python benchmarks/bench_import_time.py [ripetizioni]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ("python (nessun import)", "pass"),
+    ("import Executor", "import Executor"),
+    ("import CommandLine", "import CommandLine"),
+    ("import MAS", "import MAS"),
+    ("import MAS + client", "import MAS; MAS.llm.client"),
+    ("import AgentDeveloper", "import AgentDeveloper"),
+    ("import AgentDeveloper + client", "import AgentDeveloper; AgentDeveloper.llm.client"),
+]
+
+
+def cold_start(code: str, repeat: int):
+    """
+    (mediana dei secondi, SDK openai caricato) per repeat processi che eseguono code.
+    """
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "benchmark"))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    probe = f"{code}\nimport sys\nprint('openai' in sys.modules)"
+    times, loaded = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", probe], env=env, capture_output=True, text=True, check=True)
+        times.append(time.perf_counter() - start)
+        loaded = result.stdout.strip() == "True"
+    return statistics.median(times), loaded
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for label, code in CASES:
+        seconds, loaded = cold_start(code, repeat)
+        print(f"{label:<34}{seconds * 1000:>8.0f} ms   openai: {'sì' if loaded else 'no'}")
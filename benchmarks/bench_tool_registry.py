@@ -0,0 +1,40 @@
+"""
+Microbenchmark: costo di orchestrazione per iterazione di run_full_turn,
+confrontando la ricostruzione degli schemi ad ogni giro (vecchio comportamento)
+con il ToolRegistry compilato di Agent.
+
+Uso: python benchmarks/bench_tool_registry.py [iterazioni]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from Utility import function_to_schema
+from MAS import triage_agent, project_manager_agent
+
+
+def rebuild_per_iteration(agent):
+    tool_schemas = [function_to_schema(tool) for tool in agent.tools]
+    tools = {tool.__name__: tool for tool in agent.tools}
+    return tool_schemas, tools
+
+
+def compiled_registry(agent):
+    registry = agent.registry
+    return registry.schemas, registry.functions
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for agent in (triage_agent, project_manager_agent):
+        old = timeit.timeit(lambda: rebuild_per_iteration(agent), number=number)
+        new = timeit.timeit(lambda: compiled_registry(agent), number=number)
+        print(
+            f"{agent.name} ({len(agent.tools)} tools): "
+            f"rebuild {old / number * 1e6:.2f} us/iter, "
+            f"registry {new / number * 1e6:.2f} us/iter, "
+            f"speedup x{old / new:.1f}"
+        )
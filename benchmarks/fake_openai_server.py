@@ -0,0 +1,225 @@
+"""
+Server locale che parla il protocollo chat.completions di OpenAI, per misurare
+l'orchestrazione senza pagare un'API reale.
+
+Le risposte sono decise da un "responder" (funzione richiesta JSON -> messaggio
+dell'assistente) e vengono restituite con una latenza simulata: tempo al primo
+token estratto da una distribuzione log-normale e velocità di generazione in
+token al secondo. Sono supportati sia le risposte complete sia lo streaming SSE.
+Con rate_limit (richieste al secondo) le richieste in eccesso ricevono un 429
+con header retry-after-ms, come l'API reale.
+
+Esempio:
+    with FakeOpenAIServer(lambda request: {"content": "ciao"}, latency=0.2) as server:
+        client = OpenAI(base_url=server.url, api_key="fake")
+"""
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Architecture import count_tokens
+
+
+class FakeOpenAIServer:
+    """
+    latency: mediana del tempo al primo token (secondi); jitter: deviazione
+    standard del suo logaritmo; tokens_per_second: velocità di generazione
+    (None = istantanea); rate_limit: richieste accettate al secondo (None = nessun limite).
+    """
+    def __init__(self, responder, latency: float = 0.0, jitter: float = 0.0,
+                 tokens_per_second: float = None, seed: int = 0, port: int = 0, rate_limit: float = None):
+        self.responder = responder
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit = rate_limit
+        self._accepted = []  # istanti delle richieste accettate nell'ultimo secondo
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "server_time": 0.0, "rate_limited": 0}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class(), bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 1024  # centinaia di sessioni concorrenti
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def _first_token_delay(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        with self._lock:
+            return self.latency * math.exp(self._random.gauss(0, self.jitter)) if self.jitter else self.latency
+
+    def _admit(self) -> float:
+        """
+        0 se la richiesta rientra nel limite, altrimenti i secondi dopo cui riprovare.
+        """
+        if not self.rate_limit:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            self._accepted = [t for t in self._accepted if now - t < 1.0]
+            if len(self._accepted) >= self.rate_limit:
+                self.stats["rate_limited"] += 1
+                return 1.0 - (now - self._accepted[0])
+            self._accepted.append(now)
+            return 0.0
+
+    def _record(self, prompt_tokens, completion_tokens, elapsed):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+            self.stats["server_time"] += elapsed
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                start = time.monotonic()
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                retry_after = server._admit()
+                if retry_after:
+                    self._rate_limited(retry_after)
+                    return
+                # con n > 1 il responder viene interrogato una volta per scelta
+                messages = [server.responder(request) for _ in range(request.get("n") or 1)]
+                message = messages[0]
+                prompt_tokens = count_tokens(json.dumps(request.get("messages", []), ensure_ascii=False))
+                completion_tokens = 0
+                for choice in messages:
+                    completion_tokens += count_tokens(choice.get("content") or "")
+                    if choice.get("tool_calls"):
+                        completion_tokens += count_tokens(json.dumps(choice["tool_calls"], ensure_ascii=False))
+                time.sleep(server._first_token_delay())
+                try:
+                    if request.get("stream"):
+                        self._stream(request, message, prompt_tokens, completion_tokens)
+                    else:
+                        if server.tokens_per_second:
+                            time.sleep(completion_tokens / server.tokens_per_second)
+                        self._complete(request, messages, prompt_tokens, completion_tokens)
+                except (BrokenPipeError, ConnectionResetError):
+                    # il client ha chiuso lo stream in anticipo (es. blocco di codice già completo)
+                    self.close_connection = True
+                finally:
+                    server._record(prompt_tokens, completion_tokens, time.monotonic() - start)
+
+            def _complete(self, request, messages, prompt_tokens, completion_tokens):
+                body = json.dumps({
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake"),
+                    "choices": [{
+                        "index": index,
+                        "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+                        "message": {"role": "assistant", "content": message.get("content"),
+                                    "tool_calls": message.get("tool_calls")},
+                    } for index, message in enumerate(messages)],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, request, message, prompt_tokens, completion_tokens):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk",
+                        "created": int(time.time()), "model": request.get("model", "fake")}
+                delay = 1 / server.tokens_per_second if server.tokens_per_second else 0
+                content = message.get("content") or ""
+                for i in range(0, len(content), 4):  # ~1 token ogni 4 caratteri
+                    self._event({**base, "choices": [{"index": 0, "delta": {"content": content[i:i + 4]}}]})
+                    time.sleep(delay)
+                for index, tool_call in enumerate(message.get("tool_calls") or []):
+                    self._event({**base, "choices": [{"index": 0, "delta": {"tool_calls": [
+                        {"index": index, **tool_call}
+                    ]}}]})
+                finish = "tool_calls" if message.get("tool_calls") else "stop"
+                self._event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": finish}]})
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    self._event({**base, "choices": [], "usage": {
+                        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    }})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _rate_limited(self, retry_after):
+                body = json.dumps({"error": {
+                    "message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded",
+                }}).encode("utf-8")
+                self.send_response(429)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("retry-after-ms", str(int(retry_after * 1000)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _event(self, payload):
+                self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+        return Handler
+
+
+def tool_call(name: str, arguments: dict) -> dict:
+    """
+    Tool call nel formato dei messaggi dell'assistente.
+    """
+    return {
+        "id": f"call_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(arguments)},
+    }
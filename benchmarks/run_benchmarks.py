@@ -0,0 +1,415 @@
+"""
+Benchmark offline dell'orchestrazione, contro FakeOpenAIServer.
+
+Scenari:
+  - triage:     turni di conversazione MAS (Triage -> handoff -> tool -> risposta);
+                con --phrased le richieste sono frasi che il pre-router può instradare;
+  - supervisor: SupervisorAgent.manage_project su un progetto di N file,
+                con una frazione di file che fallisce alla prima esecuzione;
+                --architect-format json usa l'architettura strutturata (JSON),
+                drift una prima risposta in un formato non riconosciuto che
+                l'architetto deve correggere; con --syntax-errors i file che
+                falliscono hanno errori di sintassi, trovati dalla verifica
+                statica senza eseguirli;
+  - batch:      gli stessi progetti (--projects copie) generati da Batch.BatchBuilder
+                con LocalBatchClient; le richieste in batch non passano da
+                CompletionLayer.create e non sono contate in llm_busy_time;
+  - index:      CodeIndex su uno spazio di lavoro sintetico di --index-files file:
+                costruzione, aggiornamenti di singoli file e latenza delle ricerche
+                (search e symbol, con termini esatti e parziali); senza LLM.
+
+Per ogni scenario vengono riportati tempo totale, round-trip LLM, token inviati
+e ricevuti, e overhead di orchestrazione (tempo in cui nessuna richiesta LLM era
+in corso). I risultati sono scritti in JSON per seguire le regressioni.
+
+Uso: python benchmarks/run_benchmarks.py --scenario all --latency 0.05 --output bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from openai import OpenAI
+
+from fake_openai_server import FakeOpenAIServer, tool_call
+
+# Richieste di esempio: (destinazione del Triage, tool dell'agente, argomenti, testo con --phrased)
+TRIAGE_REQUESTS = [
+    ("transfer_to_file_manager_agent", "read_file", lambda d: {"file_name": os.path.join(d, "sample.py")},
+     "leggi il file sample.py"),
+    ("transfer_to_execute_code_agent", "execute_code_from_file", lambda d: {"file_name": os.path.join(d, "sample.py")},
+     "esegui sample.py"),
+    ("transfer_to_write_code_agent", "write_code_to_file",
+     lambda d: {"file_name": os.path.join(d, "out", "generated.py"), "code": "print('generated')\n"},
+     "scrivi il codice di generated.py"),
+    ("transfer_to_planner_agent", None, None, "che cosa conviene fare adesso?"),
+]
+
+
+class LLMTimer:
+    """
+    Misura le chiamate a CompletionLayer.create: numero e intervalli di tempo.
+    """
+    def __init__(self):
+        self.intervals = []
+        self._lock = threading.Lock()
+
+    def wrap(self, layer):
+        create = layer.create
+
+        def timed_stream(stream, start):
+            # una richiesta in streaming dura finché lo stream non è letto o chiuso
+            try:
+                yield from stream
+            finally:
+                self._record(start)
+
+        def timed_create(**params):
+            start = time.monotonic()
+            try:
+                response = create(**params)
+            except Exception:
+                self._record(start)
+                raise
+            if params.get("stream"):
+                return timed_stream(response, start)
+            self._record(start)
+            return response
+
+        layer.create = timed_create
+
+    def _record(self, start: float) -> None:
+        with self._lock:
+            self.intervals.append((start, time.monotonic()))
+
+    def busy_time(self) -> float:
+        """
+        Durata dell'unione degli intervalli (tempo con almeno una richiesta in corso).
+        """
+        total, current_start, current_end = 0.0, None, None
+        for start, end in sorted(self.intervals):
+            if current_end is None or start > current_end:
+                if current_end is not None:
+                    total += current_end - current_start
+                current_start, current_end = start, end
+            else:
+                current_end = max(current_end, end)
+        if current_end is not None:
+            total += current_end - current_start
+        return total
+
+
+def triage_responder(workdir):
+    def respond(request):
+        messages = request["messages"]
+        system = messages[0]["content"]
+        last = messages[-1]
+        if system.startswith("Io sono il Triage Agent"):
+            index = int(re.search(r"#(\d+)", last["content"]).group(1))
+            transfer = TRIAGE_REQUESTS[index % len(TRIAGE_REQUESTS)][0]
+            return {"content": None, "tool_calls": [tool_call(transfer, {"message": last["content"]})]}
+        if last["role"] == "tool" or system.startswith("I am the Planner Agent"):
+            return {"content": "Fatto. Restituisco il controllo al Triage Agent."}
+        index = int(re.search(r"#(\d+)", last["content"]).group(1))
+        _, tool, arguments, _ = TRIAGE_REQUESTS[index % len(TRIAGE_REQUESTS)]
+        return {"content": None, "tool_calls": [tool_call(tool, arguments(workdir))]}
+    return respond
+
+
+def run_triage(server, timer, args):
+    import MAS
+
+    workdir = tempfile.mkdtemp(prefix="bench_triage_")
+    with open(os.path.join(workdir, "sample.py"), "w", encoding="utf-8") as f:
+        f.write("print(sum(range(10)))\n")
+    server.responder = triage_responder(workdir)
+    MAS.llm.client = OpenAI(base_url=server.url, api_key="fake", max_retries=0)
+    timer.wrap(MAS.llm)
+    MAS.prerouter.enabled = not args.no_prerouter
+
+    start = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for turn in range(args.turns):
+            phrase = TRIAGE_REQUESTS[turn % len(TRIAGE_REQUESTS)][3] if args.phrased else "Richiesta"
+            MAS.run_full_turn(MAS.triage_agent, f"{phrase} #{turn}", stream=args.stream)
+    router = MAS.prerouter
+    return {
+        "turns": args.turns,
+        "prerouter": {"hit_rate": round(router.hit_rate, 3), "routed": router.stats["routed"],
+                      "saved_seconds": router.saved_seconds and round(router.saved_seconds, 3)},
+    }, time.monotonic() - start
+
+
+def supervisor_plan(files: int):
+    names = [f"module_{i}.py" for i in range(files)]
+    uml = "\n".join(f"class Module{i}" for i in range(files))
+    # albero di dipendenze: il modulo i usa il modulo (i - 1) // 2
+    uml += "\n" + "\n".join(f"Module{i} --> Module{(i - 1) // 2}" for i in range(1, files))
+    tree = "root/\n    app/\n" + "".join(f"        {name}\n" for name in names)
+    architecture = (
+        "### Descrizione Generale\n- Progetto sintetico per il benchmark.\n\n"
+        f"### UML\n```\n{uml}\n```\n\n"
+        "### Moduli Principali\n" + "".join(f"- {name}: modulo numero {i}\n" for i, name in enumerate(names)) +
+        f"\n### Struttura della Cartella del Progetto\n```\n{tree}```\n"
+        # sezione dopo la struttura: con --tokens-per-second lo sviluppo può partire prima
+        "\n### Note di Implementazione\n" + "".join(
+            f"- {name}: gestire gli errori di input e documentare l'interfaccia pubblica di Module{i}.\n"
+            for i, name in enumerate(names)
+        )
+    )
+    return architecture
+
+
+def supervisor_document(files: int) -> str:
+    """
+    Lo stesso progetto di supervisor_plan come documento JSON (ArchitectureSchema.py).
+    """
+    names = [f"module_{i}.py" for i in range(files)]
+    uml = "\n".join(f"class Module{i}" for i in range(files))
+    return json.dumps({
+        "description": "Progetto sintetico per il benchmark.",
+        "uml": uml,
+        "modules": [{"name": name, "description": f"modulo numero {i}"} for i, name in enumerate(names)],
+        "files": [
+            {"path": f"root/app/{name}", "depends_on": [f"root/app/module_{(i - 1) // 2}.py"] if i else []}
+            for i, name in enumerate(names)
+        ],
+    })
+
+
+def supervisor_responder(files: int, failure_rate: float, seed: int, fix_rate: float = 1.0,
+                         architect_format: str = "text", syntax_errors: bool = False):
+    architecture = supervisor_plan(files)
+    if architect_format == "drift":
+        # la sezione delle cartelle ha un altro titolo: il testo non è utilizzabile così com'è
+        architecture = architecture.replace("### Struttura della Cartella del Progetto", "### File del Progetto")
+    document = supervisor_document(files)
+    failing = set(random.Random(seed).sample(range(files), int(files * failure_rate)))
+    fixes = random.Random(seed + 1)  # esito di ogni correzione candidata del debugger
+
+    def respond(request):
+        system = request["messages"][0]["content"]
+        user = request["messages"][-1]["content"]
+        if system.startswith("Sei un architetto"):
+            return {"content": document if request.get("response_format") else architecture}
+        name = re.search(r"module_(\d+)\.py", user)
+        index = int(name.group(1)) if name else 0
+        if system.startswith("Sei uno sviluppatore") and index in failing:
+            if syntax_errors:
+                return {"content": f"```python\nclass Module{index}\n    pass\n```"}
+            return {"content": f"```python\nraise RuntimeError('errore iniettato {index}')\n```"}
+        if system.startswith("Sei un esperto debug") and fixes.random() >= fix_rate:
+            return {"content": f"```python\nimport time\ntime.sleep(0.5)\nraise RuntimeError('correzione errata {index}')\n```"}
+        return {"content": f"```python\nclass Module{index}:\n    pass\n\nprint('module_{index} ok')\n```"}
+
+    return respond
+
+
+def run_supervisor(server, timer, args):
+    import AgentDeveloper
+    from Routing import RoutingPolicy
+
+    server.responder = supervisor_responder(args.files, args.failure_rate, args.seed, args.fix_rate,
+                                            args.architect_format, args.syntax_errors)
+    AgentDeveloper.llm.client = OpenAI(base_url=server.url, api_key="fake", max_retries=0)
+    timer.wrap(AgentDeveloper.llm)
+
+    workdir = tempfile.mkdtemp(prefix="bench_supervisor_")
+    supervisor = AgentDeveloper.SupervisorAgent(
+        max_workers=args.max_workers, stream=args.stream, root_folder=os.path.join(workdir, "root"),
+        repair_candidates=args.repair_candidates, repair_rounds=args.repair_rounds,
+        routing=RoutingPolicy(),  # statistiche solo in memoria, senza toccare .sessions/routing_stats.json
+        pipeline=not args.no_pipeline, structured=args.architect_format == "json",
+    )
+    with supervisor:
+        start = time.monotonic()
+        with contextlib.redirect_stdout(io.StringIO()):
+            supervisor.manage_project("Progetto sintetico per il benchmark.")
+        elapsed = time.monotonic() - start
+    repairs = supervisor.repair_stats.values()
+    return {
+        "files": args.files,
+        "generated_files": len(supervisor.project_context["files"]),
+        "injected_failures": int(args.files * args.failure_rate),
+        "repaired": sum(1 for stats in repairs if stats["fixed"]),
+        "repair_attempts": sum(stats["attempts"] for stats in repairs),
+        "repair_seconds": round(sum(stats["seconds"] for stats in repairs), 4),
+        **supervisor.check_stats,
+        "models": supervisor.routing.stats.data,
+    }, elapsed
+
+
+def run_batch(server, timer, args):
+    import AgentDeveloper
+    from Batch import BatchBuilder, BatchRunner, LocalBatchClient
+    from Routing import RoutingPolicy
+
+    server.responder = supervisor_responder(args.files, args.failure_rate, args.seed, args.fix_rate)
+    client = OpenAI(base_url=server.url, api_key="fake", max_retries=0)
+    AgentDeveloper.llm.client = client
+    timer.wrap(AgentDeveloper.llm)
+
+    workdir = tempfile.mkdtemp(prefix="bench_batch_")
+    projects = {os.path.join(workdir, f"project_{i}"): f"Progetto sintetico {i} per il benchmark."
+                for i in range(args.projects)}
+    runner = BatchRunner(LocalBatchClient(client, max_workers=args.batch_workers), poll_interval=0.01)
+    builder = BatchBuilder(runner, max_workers=args.max_workers, routing=RoutingPolicy(),
+                           repair_candidates=args.repair_candidates, repair_rounds=args.repair_rounds)
+    start = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = builder.build(projects)
+    return {
+        "projects": args.projects,
+        "files": args.files * args.projects,
+        "completed_projects": sum(1 for result in results.values() if result),
+        "batch_failures": len(runner.errors),
+    }, time.monotonic() - start
+
+
+INDEX_WORDS = ["reservation", "invoice", "customer", "payment", "room", "booking", "report", "schedule",
+               "account", "discount", "inventory", "shipment", "review", "session", "ticket", "refund"]
+
+
+def index_module(rng, number: int) -> str:
+    """
+    Modulo sintetico: due classi con metodi e qualche funzione, nomi dal vocabolario.
+    """
+    lines = ["import os", "", f"LIMIT_{number} = {number}", ""]
+    for _ in range(2):
+        noun = rng.choice(INDEX_WORDS)
+        lines += ["", f"class {noun.title()}Manager{number}:", f'    """Gestione di {noun}."""', ""]
+        for verb in rng.sample(["create", "cancel", "update", "load", "validate", "total"], 3):
+            lines += [f"    def {verb}_{noun}(self, {noun}_id, amount=0):",
+                      f"        value = amount * {rng.randint(2, 9)} + LIMIT_{number}",
+                      f"        return {{'{noun}': {noun}_id, 'value': value}}", ""]
+    for _ in range(3):
+        noun = rng.choice(INDEX_WORDS)
+        lines += ["", f"def compute_{noun}_{number}(items):", f"    return sum(item.{noun} for item in items)", ""]
+    return "\n".join(lines) + "\n"
+
+
+def run_index(server, timer, args):
+    from CodeIndex import CodeIndex
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench_index_")
+    for number in range(args.index_files):
+        folder = os.path.join(workdir, "root", f"package_{number % 10}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"module_{number}.py"), "w", encoding="utf-8") as f:
+            f.write(index_module(rng, number))
+
+    start = time.monotonic()
+    index = CodeIndex(workdir, refresh_interval=3600)
+    index.refresh()
+    updates = max(1, args.index_files // 10)
+    for number in rng.sample(range(args.index_files), updates):
+        path = os.path.join(workdir, "root", f"package_{number % 10}", f"module_{number}.py")
+        code = index_module(rng, number)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(code)
+        index.update_file(path, code)
+    latencies = []
+    for query in range(args.index_queries):
+        noun, number = rng.choice(INDEX_WORDS), rng.randrange(args.index_files)
+        query_start = time.perf_counter()
+        if query % 3 == 0:
+            hits = index.search(f"cancel {noun}", 5)
+        elif query % 3 == 1:
+            hits = index.search(noun[:5], 5)  # termine parziale: espansione per trigrammi
+        else:
+            hits = index.symbol(f"compute_{noun}_{number}")
+        latencies.append(time.perf_counter() - query_start)
+        assert query % 3 == 2 or hits
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    stats = index.stats()
+    return {
+        "files": args.index_files,
+        "chunks": stats["chunks"],
+        "terms": stats["terms"],
+        "index_build_seconds": round(stats["build_seconds"], 4),
+        "index_update_seconds_avg": round(stats["update_seconds_avg"], 6),
+        "queries": args.index_queries,
+        "query_p50": round(latencies[len(latencies) // 2], 6),
+        "query_p95": round(latencies[int(len(latencies) * 0.95)], 6),
+    }, elapsed
+
+
+SCENARIOS = {"triage": run_triage, "supervisor": run_supervisor, "batch": run_batch, "index": run_index}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    parser.add_argument("--turns", type=int, default=20, help="turni di conversazione (triage)")
+    parser.add_argument("--files", type=int, default=40, help="file del progetto (supervisor)")
+    parser.add_argument("--failure-rate", type=float, default=0.1, help="frazione di file che falliscono")
+    parser.add_argument("--fix-rate", type=float, default=1.0, help="probabilità che una correzione funzioni")
+    parser.add_argument("--repair-candidates", type=int, default=3)
+    parser.add_argument("--repair-rounds", type=int, default=2)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--no-pipeline", action="store_true",
+                        help="lo sviluppo attende l'architettura completa (supervisor)")
+    parser.add_argument("--syntax-errors", action="store_true",
+                        help="i file che falliscono hanno errori di sintassi (supervisor)")
+    parser.add_argument("--architect-format", choices=["text", "json", "drift"], default="text",
+                        help="formato della risposta dell'architetto (supervisor)")
+    parser.add_argument("--projects", type=int, default=4, help="progetti generati insieme (batch)")
+    parser.add_argument("--batch-workers", type=int, default=32, help="richieste in parallelo di LocalBatchClient")
+    parser.add_argument("--index-files", type=int, default=500, help="file dello spazio di lavoro (index)")
+    parser.add_argument("--index-queries", type=int, default=300, help="ricerche misurate (index)")
+    parser.add_argument("--latency", type=float, default=0.05, help="mediana del tempo al primo token (s)")
+    parser.add_argument("--jitter", type=float, default=0.3, help="deviazione standard log-normale")
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--server-rate-limit", type=float, default=None,
+                        help="richieste al secondo accettate dal server (le altre ricevono 429)")
+    parser.add_argument("--phrased", action="store_true", help="richieste in linguaggio naturale (triage)")
+    parser.add_argument("--no-prerouter", action="store_true", help="ogni messaggio passa dal Triage")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file JSON dei risultati (default: stdout)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in (SCENARIOS if args.scenario == "all" else [args.scenario]):
+        with FakeOpenAIServer(None, latency=args.latency, jitter=args.jitter,
+                              tokens_per_second=args.tokens_per_second, seed=args.seed,
+                              rate_limit=args.server_rate_limit) as server:
+            timer = LLMTimer()
+            details, wall_time = SCENARIOS[name](server, timer, args)
+            units = details.get("turns") or details.get("files") or 1
+            overhead = wall_time - timer.busy_time()
+            results.append({
+                "scenario": name,
+                **details,
+                "wall_time": round(wall_time, 4),
+                "llm_round_trips": server.stats["requests"],
+                "rate_limited": server.stats["rate_limited"],
+                "prompt_tokens": server.stats["prompt_tokens"],
+                "completion_tokens": server.stats["completion_tokens"],
+                "llm_busy_time": round(timer.busy_time(), 4),
+                "orchestration_overhead": round(overhead, 4),
+                "orchestration_overhead_per_unit": round(overhead / units, 6),
+            })
+
+    report = json.dumps({"config": vars(args), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AgentDeveloper
+from AgentDeveloper import ArchitectAgent
+
+
+class _EmptyStream:
+    def __iter__(self):
+        return iter(())
+
+    def close(self):
+        pass
+
+
+class _RecordingLayer:
+    def __init__(self):
+        self.params = None
+
+    def create(self, **params):
+        self.params = params
+        return _EmptyStream()
+
+
+class ArchitectStreamTest(unittest.TestCase):
+    def test_structured_stream_requests_json(self):
+        layer = _RecordingLayer()
+        with mock.patch.object(AgentDeveloper, "llm", layer):
+            list(ArchitectAgent(structured=True).process_stream("progetto"))
+        self.assertTrue(layer.params["stream"])
+        self.assertEqual(layer.params["response_format"], {"type": "json_object"})
+
+    def test_text_stream_has_no_response_format(self):
+        layer = _RecordingLayer()
+        with mock.patch.object(AgentDeveloper, "llm", layer):
+            list(ArchitectAgent().process_stream("progetto"))
+        self.assertNotIn("response_format", layer.params)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import os
+import sys
+import types
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Architecture
+
+
+class CountTokensTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = Architecture._encoding, sys.modules.get("tiktoken")
+
+    def tearDown(self):
+        Architecture._encoding, tiktoken = self.saved
+        if tiktoken is None:
+            sys.modules.pop("tiktoken", None)
+        else:
+            sys.modules["tiktoken"] = tiktoken
+
+    def test_unavailable_encoding_falls_back_to_estimate(self):
+        def get_encoding(name):
+            raise ConnectionError("download di o200k_base non riuscito")
+
+        sys.modules["tiktoken"] = types.SimpleNamespace(get_encoding=get_encoding)
+        Architecture._encoding = None
+        with self.assertLogs("Architecture", "WARNING"):
+            self.assertEqual(Architecture.count_tokens("x" * 10), 3)
+        self.assertIs(Architecture._encoding, False)
+
+
+if __name__ == "__main__":
+    unittest.main()
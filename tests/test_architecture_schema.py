@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ArchitectureSchema import looks_like_document, validate
+
+
+def document(files, **fields):
+    return json.dumps({"description": "Gestione prenotazioni", "files": files, **fields})
+
+
+class DependsOnTest(unittest.TestCase):
+    def test_full_and_suffix_paths_are_resolved(self):
+        doc, errors = validate(document([
+            {"path": "./root/app/main.py", "depends_on": ["root/app/models.py", "manager.py", "manager.py"]},
+            {"path": "root/app/models.py"},
+            {"path": "root/app/services/manager.py", "depends_on": ["app\\models.py"]},
+        ]))
+        self.assertIsNone(errors)
+        self.assertEqual(doc.plan()["dependencies"], {
+            "root/app/main.py": ["root/app/models.py", "root/app/services/manager.py"],
+            "root/app/services/manager.py": ["root/app/models.py"],
+        })
+
+    def test_unknown_dependency_is_rejected(self):
+        doc, errors = validate(document([
+            {"path": "root/app/main.py", "depends_on": ["root/app/missing.py"]},
+        ]))
+        self.assertIsNone(doc)
+        self.assertIn("da correggere in: root/app/main.py", errors[0])
+
+    def test_ambiguous_suffix_is_rejected(self):
+        doc, errors = validate(document([
+            {"path": "root/main.py", "depends_on": ["models.py"]},
+            {"path": "root/app/models.py"},
+            {"path": "root/lib/models.py"},
+        ]))
+        self.assertIsNone(doc)
+        self.assertIn("root/main.py", errors[0])
+
+    def test_self_dependency_is_rejected(self):
+        doc, errors = validate(document([{"path": "root/main.py", "depends_on": ["main.py"]}]))
+        self.assertIsNone(doc)
+
+
+class DocumentTest(unittest.TestCase):
+    def test_plan_adds_intermediate_folders(self):
+        doc, _ = validate("```json\n" + document(
+            [{"path": "root/app/main.py"}], modules=[{"name": "main.py", "description": "avvio"}],
+        ) + "\n```")
+        plan = doc.plan()
+        self.assertEqual(plan["folders"], {"root": [], "root/app": ["main.py"]})
+        self.assertEqual(plan["modules"], "- main.py: avvio")
+        self.assertEqual(plan["dependencies"], {})
+
+    def test_invalid_paths_and_duplicates_are_reported(self):
+        _, errors = validate(document([{"path": "../main.py"}, {"path": "root/"}]))
+        self.assertEqual([error.split(":")[0] for error in errors], ["files.0.path", "files.1.path"])
+        _, errors = validate(document([{"path": "root/a.py"}, {"path": "root/a.py"}]))
+        self.assertIn("file ripetuti in files: root/a.py", errors[0])
+
+    def test_looks_like_document(self):
+        self.assertTrue(looks_like_document('  {"files": []}'))
+        self.assertTrue(looks_like_document("```json\n{}\n```"))
+        self.assertFalse(looks_like_document("### Descrizione Generale"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import sys
+import tempfile
+import textwrap
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CodeIndex import CodeIndex, terms
+
+BOOKING = """
+class ReservationManager:
+    def cancel(self, reservation_id):
+        return reservation_id
+"""
+
+INVOICE = """
+def cancel(invoice):
+    return invoice
+"""
+
+
+class CodeIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.index = CodeIndex(self.root, refresh_interval=3600)
+
+    def write(self, relative_path, source, mtime=None):
+        path = os.path.join(self.root, relative_path)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(textwrap.dedent(source))
+        if mtime is not None:
+            os.utime(path, ns=(mtime, mtime))
+        return path
+
+    def assertEmpty(self):
+        self.assertEqual((self.index._files, self.index._chunks, self.index._postings,
+                          self.index._trigrams, self.index._symbols), ({}, {}, {}, {}, {}))
+        self.assertEqual(self.index._total_length, 0)
+
+    def test_terms_split_identifiers(self):
+        self.assertEqual(terms("ReservationManager.cancel_all"),
+                         ["reservationmanager", "reservation", "manager", "cancel_all", "cancel", "all"])
+
+    def test_update_file_replaces_the_entries_of_the_file(self):
+        path = self.write("booking.py", BOOKING)
+        self.index.update_file(path)
+        self.assertEqual([s.name for s, _ in self.index.symbol("cancel")], ["ReservationManager.cancel"])
+
+        self.index.update_file(path, "def refund(amount):\n    return amount\n")
+        self.assertEqual(self.index.symbol("cancel"), [])
+        self.assertEqual(self.index.symbol("ReservationManager"), [])
+        self.assertNotIn("reservation", self.index._postings)
+        self.assertTrue(all("reservation" not in indexed for indexed in self.index._trigrams.values()))
+        self.assertEqual(self.index.search("refund")[0].symbol, "refund")
+
+    def test_remove_keeps_symbols_of_other_files(self):
+        self.index.update_file(self.write("booking.py", BOOKING))
+        self.index.update_file(self.write("invoice.py", INVOICE))
+        self.assertEqual(len(self.index.symbol("cancel")), 2)
+
+        self.index.remove_file(os.path.join(self.root, "booking.py"))
+        [(symbol, source)] = self.index.symbol("cancel")
+        self.assertEqual((symbol.path, symbol.name), ("invoice.py", "cancel"))
+        self.assertIn("return invoice", source)
+
+        self.index.remove_file(os.path.join(self.root, "invoice.py"))
+        self.assertEmpty()
+
+    def test_refresh_indexes_only_changed_files(self):
+        self.write("booking.py", BOOKING, mtime=1_000_000_000)
+        self.write("notes.md", "Prenotazioni e cancellazioni\n", mtime=1_000_000_000)
+        self.index.refresh(force=True)
+        self.assertEqual(set(self.index._files), {"booking.py", "notes.md"})
+        notes_chunks = self.index._files["notes.md"]["chunks"]
+
+        self.write("booking.py", INVOICE, mtime=2_000_000_000)
+        self.index.refresh(force=True)
+        self.assertEqual(self.index._files["notes.md"]["chunks"], notes_chunks)
+        self.assertEqual([s.path for s, _ in self.index.symbol("cancel")], ["booking.py"])
+        self.assertEqual(self.index.symbol("ReservationManager"), [])
+
+        os.remove(os.path.join(self.root, "booking.py"))
+        os.remove(os.path.join(self.root, "notes.md"))
+        self.index.refresh(force=True)
+        self.assertEmpty()
+        self.assertEqual(self.index.stats()["refreshes"], 2)
+
+    def test_refresh_waits_for_the_interval(self):
+        self.index.refresh()
+        self.write("booking.py", BOOKING)
+        self.index.refresh()
+        self.assertEqual(self.index._files, {})
+
+    def test_file_that_does_not_compile_is_indexed_by_lines(self):
+        self.index.update_file(self.write("broken.py", "def reserve(:\n    pass\n"))
+        [hit] = self.index.search("reserve")
+        self.assertEqual((hit.path, hit.start, hit.symbol), ("broken.py", 1, ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import gc
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Compaction import CompactionPolicy, Compactor, message_tokens
+
+
+class _FakeLLM:
+    def create(self, **params):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="riassunto"))])
+
+
+class _Memory(list):
+    """
+    Lista che ammette riferimenti deboli, come ConversationStore.StoredMemory.
+    """
+
+
+def conversation(factory=list, turns=6):
+    memory = factory()
+    for turn in range(turns):
+        memory.append({"role": "user", "content": f"richiesta {turn} " + "parola " * 20})
+        memory.append({"role": "assistant", "content": f"risposta {turn} " + "parola " * 20})
+    return memory
+
+
+# budget doppio della conversazione di prova (i token dipendono da tiktoken):
+# sopra trigger, sotto max_tokens
+POLICY = CompactionPolicy(max_tokens=2 * sum(map(message_tokens, conversation())), trigger=0.25, keep_turns=1)
+
+
+def start_job(compactor, memory):
+    # il riassunto parte in background
+    assert compactor.compact("agente", POLICY, memory) is None
+    job = compactor._jobs[id(memory)]
+    job.future.result(timeout=5)
+    return job
+
+
+class CompactorJobsTest(unittest.TestCase):
+    def test_discard_releases_job(self):
+        compactor = Compactor(_FakeLLM())
+        memory = conversation()
+        start_job(compactor, memory)
+        compactor.discard(memory)
+        self.assertEqual(len(compactor._jobs), 0)
+
+    def test_finished_jobs_expire(self):
+        compactor = Compactor(_FakeLLM(), job_ttl=0)
+        start_job(compactor, conversation())
+        compactor.compact("agente", POLICY, [])
+        self.assertEqual(len(compactor._jobs), 0)
+
+    def test_job_does_not_keep_memory_alive(self):
+        compactor = Compactor(_FakeLLM())
+        memory = conversation(_Memory)
+        start_job(compactor, memory)
+        del memory
+        gc.collect()
+        compactor.compact("agente", POLICY, [])
+        self.assertEqual(len(compactor._jobs), 0)
+
+    def test_jobs_are_bounded(self):
+        compactor = Compactor(_FakeLLM(), max_jobs=3)
+        memories = [conversation() for _ in range(5)]
+        for memory in memories:
+            start_job(compactor, memory)
+        compactor.compact("agente", POLICY, [])
+        self.assertEqual(list(compactor._jobs), [id(memory) for memory in memories[2:]])
+
+    def test_finished_summary_is_applied(self):
+        compactor = Compactor(_FakeLLM())
+        memory = conversation()
+        start_job(compactor, memory)
+        compacted = compactor.compact("agente", POLICY, memory)
+        self.assertIn("riassunto", compacted[0]["content"])
+        self.assertEqual(len(compactor._jobs), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
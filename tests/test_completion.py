@@ -0,0 +1,124 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai.types.chat import ChatCompletionChunk
+
+from Completion import CompletionCache, CompletionLayer, ReplayMiss, partial_scope
+from Streaming import iter_text
+
+PARTS = ["Ecco il codice:\n```python\n", "print('ciao')\n", "```\n", "Spiegazione che nessuno legge."]
+
+
+def _chunk(text, finish_reason=None):
+    return ChatCompletionChunk.model_validate({
+        "id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0, "model": "test-model",
+        "choices": [{"index": 0, "delta": {"role": "assistant", "content": text}, "finish_reason": finish_reason}],
+    })
+
+
+class _FakeStream:
+    def __init__(self):
+        self.closed = False
+
+    def __iter__(self):
+        for part in PARTS:
+            if self.closed:
+                return
+            yield _chunk(part)
+        yield _chunk("", "stop")
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeClient:
+    """
+    Client con la sola chat.completions.create in streaming.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, **params):
+        self.calls += 1
+        return _FakeStream()
+
+
+MESSAGES = [{"role": "user", "content": "codice"}]
+
+
+def read_until_fence(layer):
+    """
+    Legge lo stream come request_code: si ferma a fine blocco e chiude lo stream.
+    """
+    stream = layer.create(model="test-model", messages=MESSAGES, stream=True)
+    text = ""
+    try:
+        for delta in iter_text(stream):
+            text += delta
+            if text.count("```") == 2:
+                break
+    finally:
+        stream.close()
+    return text
+
+
+def read_all(layer):
+    return "".join(iter_text(layer.create(model="test-model", messages=MESSAGES, stream=True)))
+
+
+class StreamRecordReplayTest(unittest.TestCase):
+    def test_stream_closed_early_is_replayed_in_partial_scope(self):
+        cache = CompletionCache(path=None)
+        client = _FakeClient()
+        with partial_scope():
+            recorded = read_until_fence(CompletionLayer(client=client, cache=cache, mode="record"))
+        self.assertEqual(client.calls, 1)
+
+        with partial_scope():
+            replayed = read_until_fence(CompletionLayer(client=_FakeClient(), cache=cache, mode="replay"))
+        self.assertEqual(replayed, recorded)
+        self.assertIn("print('ciao')", replayed)
+
+    def test_partial_answer_is_not_served_to_other_callers(self):
+        cache = CompletionCache(path=None)
+        with partial_scope():
+            read_until_fence(CompletionLayer(client=_FakeClient(), cache=cache, mode="record"))
+
+        layer = CompletionLayer(client=_FakeClient(), cache=cache, mode="replay")
+        with self.assertRaises(ReplayMiss):
+            layer.create(model="test-model", messages=MESSAGES)
+        with self.assertRaises(ReplayMiss):
+            read_all(layer)
+
+    def test_stream_closed_early_outside_partial_scope_is_not_recorded(self):
+        cache = CompletionCache(path=None)
+        read_until_fence(CompletionLayer(client=_FakeClient(), cache=cache, mode="record"))
+        with self.assertRaises(ReplayMiss), partial_scope():
+            read_until_fence(CompletionLayer(client=_FakeClient(), cache=cache, mode="replay"))
+
+    def test_finished_stream_is_served_to_non_stream_callers(self):
+        cache = CompletionCache(path=None)
+        recorded = read_all(CompletionLayer(client=_FakeClient(), cache=cache, mode="record"))
+        self.assertEqual(recorded, "".join(PARTS))
+
+        response = CompletionLayer(client=_FakeClient(), cache=cache, mode="replay").create(
+            model="test-model", messages=MESSAGES)
+        self.assertEqual(response.choices[0].message.content, recorded)
+        self.assertEqual(response.choices[0].finish_reason, "stop")
+
+    def test_unread_stream_is_not_recorded(self):
+        cache = CompletionCache(path=None)
+        layer = CompletionLayer(client=_FakeClient(), cache=cache, mode="record")
+        with partial_scope():
+            layer.create(model="test-model", messages=MESSAGES, stream=True).close()
+        with self.assertRaises(ReplayMiss), partial_scope():
+            read_until_fence(CompletionLayer(client=_FakeClient(), cache=cache, mode="replay"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ConversationStore import ConversationStore, SessionMemories
+
+AGENT = "File Manager Agent"
+
+
+def tool_turn(number):
+    """
+    Un turno con due chiamate di tool: utente, assistente con tool_calls, due risposte, assistente.
+    """
+    calls = [{"id": f"call_{number}_{i}", "type": "function",
+              "function": {"name": "read_file", "arguments": f'{{"file_name": "f{i}.py"}}'}} for i in range(2)]
+    return [
+        {"role": "user", "content": f"leggi i file del turno {number}"},
+        {"role": "assistant", "content": None, "tool_calls": calls},
+        {"role": "tool", "tool_call_id": calls[0]["id"], "content": "print(0)"},
+        {"role": "tool", "tool_call_id": calls[1]["id"], "content": "print(1)"},
+        {"role": "assistant", "content": f"fatto {number}"},
+    ]
+
+
+def orphans(messages):
+    """
+    Id delle risposte di tool senza la chiamata corrispondente in un messaggio precedente.
+    """
+    called, missing = set(), []
+    for message in messages:
+        called.update(call["id"] for call in message.get("tool_calls", ()))
+        if message["role"] == "tool" and message["tool_call_id"] not in called:
+            missing.append(message["tool_call_id"])
+    return missing
+
+
+class ConversationStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = ConversationStore(":memory:", ttl=60)
+        self.system = {"role": "system", "content": "Io sono il File Manager Agent."}
+
+    def tearDown(self):
+        self.store.close()
+
+    def fill(self, memories, turns):
+        memory = memories[AGENT]
+        memory.append(self.system)
+        for number in range(turns):
+            for message in tool_turn(number):
+                memory.append(message)
+        return memory
+
+    def test_trim_never_starts_with_tool_responses(self):
+        for window in range(1, 12):
+            with self.subTest(window=window):
+                memory = self.fill(SessionMemories(self.store, f"s{window}", window=window), 3)
+                self.assertEqual(memory[0], self.system)
+                self.assertLessEqual(len(memory), window + 1)
+                self.assertEqual(orphans(memory), [])
+
+    def test_reloaded_window_has_no_orphan_tool_responses(self):
+        self.fill(SessionMemories(self.store, "s", window=100), 3)
+        for window in range(1, 12):
+            with self.subTest(window=window):
+                memory = SessionMemories(self.store, "s", window=window)[AGENT]
+                self.assertEqual(memory[0], self.system)
+                self.assertEqual(orphans(memory), [])
+                self.assertEqual(memory[-1], {"role": "assistant", "content": "fatto 2"})
+
+    def test_reload_continues_the_sequence(self):
+        self.fill(SessionMemories(self.store, "s", window=4), 1)
+        memory = SessionMemories(self.store, "s", window=4)[AGENT]
+        memory.append({"role": "user", "content": "ancora"})
+        messages, next_seq = self.store.window("s", AGENT, 100)
+        self.assertEqual(next_seq, 7)
+        self.assertEqual(messages[0], self.system)
+        self.assertEqual(messages[-1], {"role": "user", "content": "ancora"})
+
+    def test_assignment_replaces_the_memory(self):
+        memories = SessionMemories(self.store, "s")
+        self.fill(memories, 2)
+        memories[AGENT] = [self.system]
+        self.assertEqual(self.store.window("s", AGENT), ([self.system], 1))
+
+    def test_current_agent_and_purge(self):
+        SessionMemories(self.store, "s")[AGENT].append(self.system)
+        self.store.end_turn("s", AGENT)
+        self.assertEqual(self.store.agent("s"), AGENT)
+        self.assertEqual(self.store.purge(), 0)
+        self.assertEqual(self.store.purge(now=10 ** 12), 1)
+        self.assertFalse(self.store.exists("s"))
+        self.assertEqual(self.store.window("s", AGENT), ([], 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+import textwrap
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Executor import WorkerPool
+
+
+class WorkerPoolMainModuleTest(unittest.TestCase):
+    """
+    Il file eseguito dal pool deve comportarsi come con "python file.py".
+    """
+    def setUp(self):
+        self.pool = WorkerPool(size=1)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def run_source(self, source):
+        path = os.path.join(self.directory, "generated.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(textwrap.dedent(source))
+        return self.pool.run(path)
+
+    def test_failing_unittest_main(self):
+        result = self.run_source("""
+            import unittest
+
+            class Failing(unittest.TestCase):
+                def test_fails(self):
+                    self.assertEqual(1, 2)
+
+            if __name__ == "__main__":
+                unittest.main()
+        """)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("Ran 1 test", result.stderr)
+        self.assertIn("FAILED", result.stderr)
+
+    def test_pickle_class_defined_in_file(self):
+        result = self.run_source("""
+            import pickle
+            from dataclasses import dataclass
+
+            @dataclass
+            class Point:
+                x: int
+
+            print(pickle.loads(pickle.dumps(Point(3))))
+        """)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "Point(x=3)")
+
+
+class WorkerPoolCloseTest(unittest.TestCase):
+    def test_busy_worker_is_stopped_after_close(self):
+        pool = WorkerPool(size=1)
+        path = os.path.join(tempfile.mkdtemp(), "slow.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("import time\ntime.sleep(0.5)\nprint('fine')\n")
+        results = []
+        runner = threading.Thread(target=lambda: results.append(pool.run(path)))
+        runner.start()
+        while pool._started == 0:
+            threading.Event().wait(0.01)
+        pool.close()
+        runner.join()
+        self.assertEqual(results[0].stdout, "fine\n")
+        self.assertEqual(pool._started, 0)
+        self.assertTrue(pool._idle.empty())
+        with self.assertRaises(RuntimeError):
+            pool.run(path)
+
+    def test_supervisor_closes_only_its_own_pool(self):
+        from AgentDeveloper import SupervisorAgent
+
+        with SupervisorAgent(max_workers=1) as supervisor:
+            own = supervisor.executor
+        self.assertTrue(own._closed)
+
+        shared = WorkerPool(size=1)
+        with SupervisorAgent(executor=shared):
+            pass
+        self.assertFalse(shared._closed)
+        shared.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PreRouter import DEFAULT_ROUTES, PreRouter
+
+
+def make_router():
+    """
+    PreRouter con le regole predefinite e agenti fittizi al posto di quelli di MAS.py.
+    """
+    targets = {}
+    for name in DEFAULT_ROUTES:
+        def transfer():
+            pass
+        transfer.__name__ = name
+        agent_name = name[len("transfer_to_"):].replace("_", " ").title()
+        targets[transfer] = SimpleNamespace(name=agent_name, instructions=f"Io sono il {agent_name}.")
+    return PreRouter(SimpleNamespace(name="Triage Agent"), targets, enabled=True)
+
+
+class PreRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.router = make_router()
+
+    def routed(self, message):
+        transfer = self.router.route(message)
+        return transfer.__name__ if transfer else None
+
+    def test_obvious_requests_skip_the_triage(self):
+        self.assertEqual(self.routed("esegui main.py"), "transfer_to_execute_code_agent")
+        self.assertEqual(self.routed("leggi il file main.py"), "transfer_to_file_manager_agent")
+
+    def test_negated_requests_go_to_the_triage(self):
+        for message in ("non eseguire main.py, spiegami cosa fa", "do not run main.py",
+                        "don't run main.py", "never run main.py", "mostrami main.py senza eseguirlo"):
+            with self.subTest(message=message):
+                self.assertIsNone(self.routed(message))
+
+    def test_two_actions_joined_by_and_go_to_the_triage(self):
+        for message in ("show me main.py and fix the bug", "mostrami main.py e correggi il bug",
+                        "leggi main.py ed esegui test.py"):
+            with self.subTest(message=message):
+                self.assertIsNone(self.routed(message))
+
+    def test_rules_of_several_routes_go_to_the_triage(self):
+        message = "esegui main.py documentazione"
+        matched = [route.transfer.__name__ for _, rule, route in self.router.scores(message) if rule]
+        self.assertEqual(len(matched), 2)
+        self.assertIsNone(self.routed(message))
+
+    def test_stats_count_fallbacks(self):
+        self.routed("esegui main.py")
+        self.routed("do not run main.py")
+        self.assertEqual(self.router.stats["routed"], 1)
+        self.assertEqual(self.router.stats["fallback"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
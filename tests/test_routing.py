@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Routing import STATS_FILE, ModelStats, RoutingPolicy
+
+
+class ModelStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "sessions", "routing_stats.json")
+
+    def test_default_file_is_in_the_sessions_folder(self):
+        self.assertEqual(os.path.dirname(STATS_FILE), ".sessions")
+
+    def test_save_writes_only_new_attempts(self):
+        ModelStats(self.path).save()
+        self.assertFalse(os.path.exists(self.path))
+
+        stats = ModelStats(self.path)
+        stats.record("developer", "gpt-4o-mini", True, 1.5)
+        stats.save()
+        mtime = os.stat(self.path).st_mtime_ns
+        stats.save()
+        self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+        self.assertEqual(ModelStats(self.path).success_rate("developer", "gpt-4o-mini"), 1.0)
+
+    def test_policy_skips_unreliable_first_rung(self):
+        stats = ModelStats()
+        for success in (False, False, True):
+            stats.record("developer", "gpt-4o-mini", success)
+        policy = RoutingPolicy(stats, min_success_rate=0.5, min_samples=3)
+        self.assertEqual(policy.ladder("developer", ("gpt-4o-mini", "gpt-4o")), ["gpt-4o"])
+        self.assertEqual(policy.ladder("debugger", ("gpt-4o-mini", "gpt-4o")), ["gpt-4o-mini", "gpt-4o"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from openai import OpenAI
+
+from Completion import CompletionLayer
+from Scheduler import pooled_async_http_client
+from fake_openai_server import FakeOpenAIServer
+
+
+class PooledAsyncTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenAIServer(lambda request: {"content": "ok"}).start()
+        self.client = OpenAI(base_url=self.server.url, api_key="fake", max_retries=0)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_async_requests_share_the_pooled_transport(self):
+        layers = [CompletionLayer(client=self.client, mode="off") for _ in range(2)]
+
+        async def turn():
+            responses = await asyncio.gather(*(
+                layer.acreate(model="test-model", messages=[{"role": "user", "content": "ciao"}])
+                for layer in layers
+            ))
+            transports = {id(layer.async_client._client) for layer in layers}
+            return [response.choices[0].message.content for response in responses], transports, \
+                id(pooled_async_http_client())
+
+        contents, transports, pooled = asyncio.run(turn())
+        self.assertEqual(contents, ["ok", "ok"])
+        self.assertEqual(transports, {pooled})
+
+        # un nuovo event loop ha un trasporto proprio: il client asincrono viene ricreato
+        contents, transports, second = asyncio.run(turn())
+        self.assertEqual(contents, ["ok", "ok"])
+        self.assertEqual(transports, {second})
+        self.assertEqual(self.server.stats["requests"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from StaticCheck import StaticChecker, _Project, format_diagnostics
+
+FOLDERS = {
+    "app": ["main.py", "models.py"],
+    "app/pkg": ["__init__.py", "store.py"],
+    "app/ns": ["tool.py"],
+}
+
+
+class ProjectResolveTest(unittest.TestCase):
+    def setUp(self):
+        self.project = _Project(FOLDERS, {})
+
+    def test_module_next_to_the_file(self):
+        self.assertEqual(self.project.resolve("models", "app"), ("app/models.py", None))
+
+    def test_package_and_submodule(self):
+        self.assertEqual(self.project.resolve("pkg", "app"), ("app/pkg", None))
+        self.assertEqual(self.project.resolve("pkg.store", "app"), ("app/pkg/store.py", None))
+
+    def test_namespace_package(self):
+        self.assertEqual(self.project.resolve("ns.tool", "app"), ("app/ns/tool.py", None))
+
+    def test_external_module(self):
+        self.assertEqual(self.project.resolve("json", "app"), (None, None))
+
+    def test_missing_submodule(self):
+        self.assertEqual(self.project.resolve("pkg.missing", "app"),
+                         (None, ("ModuleNotFoundError", "No module named 'pkg.missing'")))
+
+    def test_module_is_not_a_package(self):
+        target, error = self.project.resolve("models.user", "app")
+        self.assertIsNone(target)
+        self.assertEqual(error, ("ModuleNotFoundError", "No module named 'models.user'; 'models' is not a package"))
+
+
+class StaticCheckerTest(unittest.TestCase):
+    def setUp(self):
+        self.checker = StaticChecker()
+        self.files = {
+            "app/models.py": "class User:\n    pass\n\n\ndef load():\n    return User()\n",
+            "app/pkg/__init__.py": "",
+            "app/pkg/store.py": "VERSION = 1\n",
+        }
+
+    def check(self, code):
+        return self.checker.check("app/main.py", code, FOLDERS, {**self.files, "app/main.py": code})
+
+    def test_valid_file(self):
+        self.assertEqual(self.check("import json\nfrom models import User, load\nfrom pkg import store\n"), [])
+
+    def test_missing_name_is_an_import_error(self):
+        [diagnostic] = self.check("import json\nfrom models import Account\n")
+        self.assertEqual((diagnostic.line, diagnostic.kind), (2, "ImportError"))
+        self.assertEqual(diagnostic.message, "cannot import name 'Account' from 'models' (app/models.py)")
+
+    def test_missing_attribute_is_an_attribute_error(self):
+        [diagnostic] = self.check("import models\n\nmodels.save()\n")
+        self.assertEqual((diagnostic.line, diagnostic.kind), (3, "AttributeError"))
+        self.assertEqual(diagnostic.message, "module 'models' has no attribute 'save'")
+
+    def test_rebound_alias_is_not_checked(self):
+        self.assertEqual(self.check("import models\nmodels = None\nmodels.save()\n"), [])
+
+    def test_dynamic_module_is_not_checked(self):
+        self.files["app/models.py"] = "def __getattr__(name):\n    return name\n"
+        self.assertEqual(self.check("from models import Anything\n"), [])
+
+    def test_imports_inside_try_are_left_to_execution(self):
+        self.assertEqual(self.check("try:\n    from models import Account\nexcept ImportError:\n    pass\n"), [])
+
+    def test_uninstalled_module(self):
+        [diagnostic] = self.check("import module_that_does_not_exist\n")
+        self.assertEqual(diagnostic.kind, "ModuleNotFoundError")
+
+    def test_syntax_error_is_formatted_as_a_traceback(self):
+        [diagnostic] = self.check("def broken(:\n    pass\n")
+        self.assertEqual((diagnostic.line, diagnostic.kind), (1, "SyntaxError"))
+        text = format_diagnostics("app/main.py", [diagnostic])
+        self.assertIn('File "app/main.py", line 1', text)
+        self.assertIn("^", text)
+
+    def test_check_tree_reports_only_broken_files(self):
+        self.files["app/main.py"] = "from models import Account\n"
+        self.assertEqual(list(self.checker.check_tree(FOLDERS, self.files)), ["app/main.py"])
+
+
+if __name__ == "__main__":
+    unittest.main()
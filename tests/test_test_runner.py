@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+import textwrap
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from TestRunner import TestRunner, discover_tests, source_folders
+
+
+def write(root, relative_path, source):
+    path = os.path.join(root, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(textwrap.dedent(source))
+
+
+class DiscoverTestsTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        write(self.root, "app/calc.py", "def add(a, b):\n    return a + b\n")
+        write(self.root, "tests/test_calc.py", """
+            import unittest
+
+            class CalcTest(unittest.TestCase):
+                def test_add(self):
+                    pass
+
+                def helper(self):
+                    pass
+
+            class TestStyle:
+                def test_method(self):
+                    pass
+
+            def test_function():
+                pass
+
+            def helper():
+                pass
+        """)
+        write(self.root, "tests/broken_test.py", "def test_(:\n")
+        write(self.root, ".hidden/test_skipped.py", "def test_hidden():\n    pass\n")
+
+    def test_units_of_every_test_file(self):
+        self.assertEqual(discover_tests(self.root), [
+            "tests/broken_test.py",
+            "tests/test_calc.py::CalcTest::test_add",
+            "tests/test_calc.py::TestStyle::test_method",
+            "tests/test_calc.py::test_function",
+        ])
+
+    def test_paths_limit_the_search(self):
+        self.assertEqual(discover_tests(self.root, ["tests/test_calc.py"])[-1], "tests/test_calc.py::test_function")
+        self.assertEqual(len(discover_tests(self.root, ["tests/test_calc.py"])), 3)
+
+    def test_source_folders_skip_test_only_folders(self):
+        self.assertEqual(source_folders(self.root), [os.path.join(self.root, "app")])
+
+
+class ShardRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        write(self.root, "test_crash.py", """
+            import os
+
+            def test_a_before():
+                pass
+
+            def test_b_crash():
+                os._exit(3)
+
+            def test_c_after():
+                assert 1 == 2
+        """)
+        self.runner = TestRunner(self.root, workers=1, timeout=5)
+
+    def test_crash_marks_one_test_and_resumes_the_rest(self):
+        report = self.runner.run(discover_tests(self.root))
+        outcomes = {test_id.split("::")[1]: result.outcome for test_id, result in report.results.items()}
+        self.assertEqual(outcomes, {"test_a_before": "passed", "test_b_crash": "error", "test_c_after": "failed"})
+        self.assertIn("interrotto durante il test", report.results["test_crash.py::test_b_crash"].traceback)
+        self.assertEqual(len(report.shards), 1)
+
+    def test_rerun_keeps_passed_results(self):
+        report = self.runner.run(discover_tests(self.root))
+        write(self.root, "test_crash.py", """
+            def test_a_before():
+                assert False
+
+            def test_b_crash():
+                pass
+
+            def test_c_after():
+                pass
+        """)
+        rerun = self.runner.rerun(report, failed_only=True)
+        self.assertTrue(rerun.passed)
+        self.assertEqual(rerun.shards, report.shards)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Tracing import Tracer, agent_scope, summarize
+
+
+class TracerTest(unittest.TestCase):
+    def test_memory_is_bounded_and_summary_counts_every_span(self):
+        path = os.path.join(tempfile.mkdtemp(), "trace.jsonl")
+        tracer = Tracer(path, max_spans=10)
+        with agent_scope("Triage Agent"):
+            for number in range(25):
+                with tracer.span("llm.call", model="gpt-4o-mini", cache="hit" if number % 5 == 0 else "miss") as span:
+                    span.set(prompt_tokens=10, completion_tokens=2)
+        with tracer.span("tool.call"):
+            pass
+
+        self.assertEqual(len(tracer.spans), 10)
+        summary = tracer.summary()
+        self.assertIn("chiamate LLM: 25, da cache: 5", summary)
+        self.assertRegex(summary, r"Triage Agent\s+25 .*\s+250\s+50\s+0")
+        self.assertRegex(summary, r"tool\.call\s+1 ")
+
+        tracer._file.close()
+        with open(path, "r", encoding="utf-8") as f:
+            self.assertEqual(summarize(json.loads(line) for line in f), summary)
+
+
+if __name__ == "__main__":
+    unittest.main()